@@ -0,0 +1,68 @@
+"""
+Compare splitting long responses into IRC lines with textwrap and with LineSplitter.
+
+The textwrap version is the one the bot used before, wrapping at 420
+characters.  Both are timed on responses of 10 to 100 KB of plain English
+and of mixed multi-byte text, which also shows how many of the textwrap
+lines would be cut off by the server's 512 byte limit.
+
+    python bench/chop.py
+"""
+import os
+import random
+import sys
+import textwrap
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linesplit import LineSplitter, line_budget
+
+ENGLISH = ("the quick brown fox jumps over the lazy dog while a curious cat watches "
+           "from the warm windowsill and wonders why anyone would ever run").split()
+MIXED = ENGLISH + ["naïve", "café", "Grüße", "日本語の文章", "привет", "👍", "👩‍💻", "Ελληνικά"]
+
+def textwrap_chop(message):
+    lines = []
+    for line in message.splitlines():
+        if len(line) > 420:
+            lines.extend(textwrap.wrap(line, width=420, drop_whitespace=False, replace_whitespace=False,
+                                       fix_sentence_endings=True, break_long_words=False))
+        else:
+            lines.append(line)
+    return lines
+
+def response(words, size):
+    random.seed(size)
+    paragraphs = []
+    total = 0
+    while total < size:
+        paragraph = " ".join(random.choice(words) for _ in range(random.randint(40, 400))).capitalize() + "."
+        paragraphs.append(paragraph)
+        total += len(paragraph.encode()) + 2
+    return "\n\n".join(paragraphs)
+
+def best(function, text, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lines = function(text)
+        times.append(time.perf_counter() - start)
+    return min(times), lines
+
+def main():
+    budget = line_budget("InfiniGPT", "#infinigpt")
+    relayed = len(":InfiniGPT!~infinigpt@user/example/bot PRIVMSG #infinigpt :\r\n")
+    print(f"line budget {budget} bytes")
+    print(f"{'text':<8}{'size':>8}{'textwrap':>12}{'splitter':>12}{'speedup':>9}{'overlong':>10}")
+    for name, words in (("english", ENGLISH), ("mixed", MIXED)):
+        for size in (10_000, 30_000, 100_000):
+            text = response(words, size)
+            old, old_lines = best(textwrap_chop, text)
+            new, new_lines = best(lambda text: LineSplitter(budget).split(text), text)
+            overlong = sum(1 for line in old_lines if relayed + len(line.encode()) > 512)
+            assert all(len(line.encode()) <= budget for line in new_lines)
+            print(f"{name:<8}{size // 1000:>6}KB{old * 1000:>10.2f}ms{new * 1000:>10.2f}ms{old / new:>8.1f}x{overlong:>10}")
+
+if __name__ == "__main__":
+    main()
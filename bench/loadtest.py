@@ -0,0 +1,185 @@
+"""
+Load test InfiniGPT against a fake LLM provider and a fake IRC server.
+
+Fake users in a few channels talk to the bot with .ai at a steady pace.
+Reports reply throughput, latency from a user's message to the start of the
+bot's reply, memory growth, and how often the bot's sending would have
+tripped the server's flood protection.  With --models each channel uses
+its own local model, to see how often the fake Ollama server has to switch
+models, and --compat sends requests to its OpenAI compatible endpoint
+instead of /api/chat for comparison.
+
+    python bench/loadtest.py --users 30 --channels 3 --messages 5 --latency 0.3 --stream
+    python bench/loadtest.py --channels 4 --models 2 --load-delay 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from infinigpt import InfiniGPT
+from mock_ircd import MockIRCd
+from mock_openai import MockOpenAI
+from services import Services
+from toolrunner import ToolRuntime
+
+async def lookup(query):
+    await asyncio.sleep(0.01)
+    return f"Results for {query}"
+
+TOOL_SCHEMA = [{
+    "type": "function",
+    "function": {
+        "name": "lookup",
+        "description": "Look something up.",
+        "parameters": {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]}
+    }
+}]
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))]
+
+def bench_config(args, llm_port, irc_port):
+    """
+    Point a copy of config.json at the fake servers.
+    """
+    with open(os.path.join(ROOT, "config.json")) as f:
+        config = json.load(f)
+    config.pop("storage", None)
+    config.pop("metrics", None)
+    llm = config["llm"]
+    llm["models"] = {"ollama": [f"bench{i}" for i in range(args.models)]}
+    llm["ollama_url"] = f"127.0.0.1:{llm_port}"
+    llm["ollama"] = {"parallel": args.parallel, "refresh": 1}
+    llm["default_model"] = "bench0"
+    llm["fallback"] = []
+    llm["stream"] = args.stream
+    llm["retry"] = dict(llm.get("retry", {}), backoff=0.05)
+    llm["limits"] = {"default": {"max_inflight": args.inflight, "max_queue": args.users * args.channels}}
+    irc = config["irc"][0] if isinstance(config["irc"], list) else config["irc"]
+    config["irc"] = dict(
+        irc, server="127.0.0.1", port=irc_port, password=None, transport="asyncio",
+        channels=[f"#bench{i}" for i in range(args.channels)],
+        flood={"burst": args.burst, "rate": args.rate}
+    )
+    return config
+
+async def run(args):
+    provider = MockOpenAI(args.latency, args.token_delay, args.words, args.tool_rate, args.error_rate, args.load_delay)
+    await provider.start()
+
+    pending = {}
+    latencies = []
+    replies = [0]
+
+    def on_message(now, target, text):
+        # Replies in a channel start with a "nick:" line
+        if text.endswith(":") and " " not in text:
+            started = pending.pop((target, text[:-1]), None)
+            if started is not None:
+                latencies.append(now - started)
+                replies[0] += 1
+
+    ircd = MockIRCd(args.server_burst, args.server_rate, on_message)
+    await ircd.start()
+
+    services = Services(bench_config(args, provider.port, ircd.port), TOOL_SCHEMA)
+    module = types.ModuleType("bench_tools")
+    module.lookup = lookup
+    services.toolbox = ToolRuntime(module, TOOL_SCHEMA, metrics=services.metrics)
+    if args.compat:
+        services.ollama = None
+    bot = InfiniGPT(services, services.networks[0])
+    bot.log = lambda *args: None
+    bot.channel_models = {f"#bench{i}": f"bench{i % args.models}" for i in range(args.channels)}
+
+    tracemalloc.start()
+    services.start()
+    task = asyncio.create_task(bot.main())
+    await asyncio.wait_for(ircd.registered.wait(), 10)
+    while len(ircd.channels) < args.channels:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(args.settle)
+    memory_before = tracemalloc.get_traced_memory()[0]
+    sent_before = len(ircd.sent)
+
+    users = [(f"#bench{c}", f"user{c}_{u}") for c in range(args.channels) for u in range(args.users)]
+    merged = 0
+    start = time.monotonic()
+    for round in range(args.messages):
+        random.shuffle(users)
+        for channel, nick in users:
+            if (channel, nick) in pending:
+                merged += 1
+            pending[(channel, nick)] = time.monotonic()
+            ircd.say(nick, channel, f".ai tell me something interesting, round {round}")
+            await asyncio.sleep(args.interval / len(users))
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline and (pending or any(
+            stats["inflight"] for stats in services.admission.stats()["providers"].values())):
+        await asyncio.sleep(0.1)
+    elapsed = time.monotonic() - start
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    sent = len(ircd.sent) - sent_before
+    print(f"users {len(users)}, messages {len(users) * args.messages}, elapsed {elapsed:.2f}s")
+    print(f"replies {replies[0]} ({replies[0] / elapsed:.2f}/s), unanswered {len(pending)}, merged {merged}")
+    print(f"reply latency p50 {percentile(latencies, 0.5):.3f}s p99 {percentile(latencies, 0.99):.3f}s max {max(latencies, default=float('nan')):.3f}s")
+    print(f"lines sent {sent} ({sent / elapsed:.2f}/s), flood violations {ircd.violations}, overlong {ircd.overlong}")
+    print(f"memory growth {(memory_after - memory_before) / 1024:.1f} KiB, peak {memory_peak / 1024:.1f} KiB")
+    print(f"provider requests {provider.requests}, injected errors {provider.errors}, tool calls {provider.tool_calls}, model loads {provider.loads}")
+    stats = bot.sender.stats()
+    print(f"send queue avg wait {stats['wait_avg']:.3f}s max {stats['wait_max']:.3f}s")
+
+    bot.connection.disconnect("Benchmark finished")
+    await asyncio.sleep(0.1)
+    for pending_task in (task, bot.recon.task):
+        if pending_task is not None:
+            pending_task.cancel()
+    await ircd.close()
+    await provider.close()
+    await services.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="users per channel")
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--messages", type=int, default=3, help="messages per user")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds for every user to speak once")
+    parser.add_argument("--latency", type=float, default=0.2, help="provider time to first byte")
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--words", type=int, default=40)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--tool-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--inflight", type=int, default=8, help="provider requests in flight")
+    parser.add_argument("--models", type=int, default=1, help="local models, one per channel in turn")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="seconds for the fake Ollama server to switch models")
+    parser.add_argument("--parallel", type=int, default=4, help="requests sent to the Ollama server at once")
+    parser.add_argument("--compat", action="store_true", help="use the OpenAI compatible endpoint instead of /api/chat")
+    parser.add_argument("--burst", type=int, default=5, help="bot flood burst")
+    parser.add_argument("--rate", type=float, default=0.7, help="bot messages per second")
+    parser.add_argument("--server-burst", type=int, default=10, help="server flood burst")
+    parser.add_argument("--server-rate", type=float, default=1.0, help="server messages per second")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to wait after joining")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for the last replies")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
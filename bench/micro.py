@@ -0,0 +1,91 @@
+"""
+Micro benchmarks of the bot's per-message hot paths.
+
+Times splitting long responses into IRC lines, filtering the reasoning of
+thinking models out of a stream, trimming conversation history by size and by tokens, and
+dispatching channel messages, both ordinary chatter the bot ignores and
+commands it answers.
+
+    python bench/micro.py
+"""
+import os
+import sys
+import timeit
+
+from irc.client import Event, NickMask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversations import ConversationStore
+from infinigpt import InfiniGPT
+from reasoning import ReasoningFilter
+
+PARAGRAPH = ("The quick brown fox jumps over the lazy dog while a curious cat watches from the warm windowsill. " * 12).strip()
+RESPONSE = "\n\n".join([PARAGRAPH] * 4)
+THINKING = "<think>\n" + "Let me work through this step by step. " * 40 + "\n</think>\n\n" + RESPONSE
+# Pieces of a few characters, the way streamed tokens arrive
+CHUNKS = [THINKING[i:i + 6] for i in range(0, len(THINKING), 6)]
+
+def run_sync(coroutine):
+    """
+    Run a coroutine that never awaits anything, without the cost of an event loop.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine awaited")
+
+def report(name, number, seconds):
+    print(f"{name:<32} {seconds / number * 1e6:10.2f} us/op")
+
+def bench(name, statement, number=2000, repeat=5):
+    report(name, number, min(timeit.repeat(statement, number=number, repeat=repeat)))
+
+def main():
+    bot = InfiniGPT.__new__(InfiniGPT)
+    bot.log = lambda *args: None
+    bot.nickname = "InfiniGPT"
+    bot.hostmask = None
+    bot.admins = []
+    bot.build_commands()
+    bot.schedule = lambda coroutine: coroutine.close()
+
+    bench("chop (4 x 1.2 KB paragraphs)", lambda: bot.chop(RESPONSE))
+    bench("chop (short line)", lambda: bot.chop("A short answer."), number=100_000)
+    def stream_reasoning():
+        reasoning = ReasoningFilter()
+        for chunk in CHUNKS:
+            reasoning.feed(chunk)
+        reasoning.flush()
+
+    bench(f"reasoning filter ({len(CHUNKS)} chunks)", stream_reasoning, number=200)
+
+    store = ConversationStore()
+    conversation = store.open("#bench", "user", "You are a helpful assistant.")
+    message = {"role": "user", "content": PARAGRAPH[:300]}
+
+    def trim_size():
+        store.append(conversation, message)
+        store.trim(conversation, size=24)
+
+    def trim_tokens():
+        store.append(conversation, message)
+        store.trim(conversation, max_tokens=4000)
+
+    bench("append + trim by size", trim_size, number=50_000)
+    bench("append + trim by tokens", trim_tokens, number=50_000)
+
+    source = NickMask("someone!user@example.org")
+    chatter = Event("pubmsg", source, "#bench", ["did anyone catch the game last night? " * 3])
+    dotted = Event("pubmsg", source, "#bench", ["...and that was the end of it"])
+    command = Event("pubmsg", source, "#bench", [".ai what is the capital of France"])
+    addressed = Event("pubmsg", source, "#bench", ["InfiniGPT: what is the capital of France"])
+    bench("on_pubmsg, chatter", lambda: bot.on_pubmsg(None, chatter), number=200_000)
+    bench("on_pubmsg, dot but no command", lambda: bot.on_pubmsg(None, dotted), number=200_000)
+    bench("on_pubmsg, .ai command", lambda: bot.on_pubmsg(None, command), number=200_000)
+    bench("on_pubmsg, addressed by name", lambda: bot.on_pubmsg(None, addressed), number=200_000)
+    bench("handle_message, lookup", lambda: run_sync(bot.handle_message(None, "#bench", "someone", ["hello", "there"])), number=200_000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Fake IRC server for benchmarks.
+
+Registers the bot, confirms its joins, lets the load test speak as any
+number of fake users, and records everything the bot sends.  Outgoing
+traffic is checked against a token bucket like a real server's flood
+protection, and every message that would have been throttled is counted,
+as is every message that would have been cut off when relayed.
+"""
+import asyncio
+import time
+
+class MockIRCd:
+    """
+    Single-client IRC server.
+
+    Attributes:
+        burst (int): Messages the server lets through back to back.
+        rate (float): Messages per second allowed after the burst.
+        sent (list): (time, target, text) of every PRIVMSG or NOTICE from the bot.
+        violations (int): Messages that exceeded the flood allowance.
+        overlong (int): Messages longer than 512 bytes once relayed with the bot's hostmask.
+        channels (set): Channels the bot has joined.
+        on_message (callable): Called with (time, target, text) for each message from the bot.
+        port (int): Port the server listens on, once started.
+    """
+    def __init__(self, burst=10, rate=1.0, on_message=None):
+        self.burst = burst
+        self.rate = rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.sent = []
+        self.violations = 0
+        self.overlong = 0
+        self.channels = set()
+        self.on_message = on_message
+        self.writer = None
+        self.nickname = None
+        self.registered = asyncio.Event()
+        self.port = None
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Start listening.
+
+        Args:
+            host (str, optional): Address to listen on.
+            port (int, optional): Port to listen on, 0 for any free port.
+        """
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        Disconnect the bot and stop listening.
+        """
+        if self.writer is not None:
+            self.writer.close()
+        self.server.close()
+
+    def write(self, line):
+        """
+        Send one line to the bot.
+        """
+        self.writer.write(line.encode() + b"\r\n")
+
+    def say(self, nick, target, text):
+        """
+        Deliver a PRIVMSG from a fake user.
+
+        Args:
+            nick (str): Fake user's nickname.
+            target (str): Channel, or the bot's nickname for a private message.
+            text (str): The message.
+        """
+        self.write(f":{nick}!{nick}@bench PRIVMSG {target} :{text}")
+
+    def throttle(self, now):
+        """
+        Spend a flood token for one message, counting a violation if none is left.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+        else:
+            self.violations += 1
+
+    async def handle(self, reader, writer):
+        """
+        Talk to the connected bot.
+        """
+        self.writer = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode(errors="replace").rstrip("\r\n")
+                command, _, rest = line.partition(" ")
+                command = command.upper()
+                if command == "NICK":
+                    self.nickname = rest.strip()
+                elif command == "USER":
+                    self.write(f":bench.irc 001 {self.nickname} :Welcome to the benchmark network")
+                    self.registered.set()
+                elif command == "JOIN":
+                    for channel in rest.split(" ")[0].split(","):
+                        self.channels.add(channel)
+                        self.write(f":{self.nickname}!bot@bench JOIN {channel}")
+                elif command == "PART":
+                    self.channels.discard(rest.split(" ")[0])
+                elif command == "PING":
+                    self.write(f":bench.irc PONG bench.irc {rest}")
+                elif command in ("PRIVMSG", "NOTICE"):
+                    target, _, text = rest.partition(" ")
+                    now = time.monotonic()
+                    self.throttle(now)
+                    text = text[1:] if text.startswith(":") else text
+                    if len(f":{self.nickname}!bot@bench {command} {target} :{text}\r\n".encode()) > 512:
+                        self.overlong += 1
+                    self.sent.append((now, target, text))
+                    if self.on_message is not None:
+                        self.on_message(now, target, text)
+                await writer.drain()
+        except ConnectionError:
+            pass
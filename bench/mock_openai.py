@@ -0,0 +1,250 @@
+"""
+Fake OpenAI compatible /v1/chat/completions server for benchmarks.
+
+Answers with generated text after a configurable delay, optionally streams
+the answer word by word, asks for tool calls and injects errors, so the bot
+can be load tested without API keys or spend.  It also speaks Ollama's
+/api/chat and /api/ps.  Like a GPU with room for one model, it keeps one
+model loaded at a time and takes --load-delay seconds to switch to another.
+
+    python bench/mock_openai.py --port 8911 --latency 0.3 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+WORDS = ("the quick brown fox jumps over the lazy dog while a curious cat watches "
+         "from the warm windowsill and wonders why anyone would ever run").split()
+
+class MockOpenAI:
+    """
+    Minimal HTTP/1.1 server speaking the chat completions API.
+
+    Attributes:
+        latency (float): Seconds before the first byte of each answer.
+        token_delay (float): Seconds between streamed words.
+        words (int): Words in each answer.
+        tool_rate (float): Chance of answering with a tool call when tools are offered.
+        error_rate (float): Chance of answering with a 500 or 429 error.
+        requests (int): Requests received.
+        errors (int): Errors injected.
+        tool_calls (int): Tool calls requested.
+        load_delay (float): Seconds to load a model that isn't loaded.
+        loaded (str): Model currently loaded.
+        loads (int): Models loaded.
+        port (int): Port the server listens on, once started.
+    """
+    def __init__(self, latency=0.1, token_delay=0.005, words=40, tool_rate=0.0, error_rate=0.0, load_delay=0.0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.words = words
+        self.tool_rate = tool_rate
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.tool_calls = 0
+        self.load_delay = load_delay
+        self.loaded = None
+        self.loads = 0
+        self.switching = asyncio.Lock()
+        self.port = None
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Start listening.
+
+        Args:
+            host (str, optional): Address to listen on.
+            port (int, optional): Port to listen on, 0 for any free port.
+        """
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        Stop listening.
+        """
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        """
+        Serve requests on one keep-alive connection.
+        """
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                method, path = request.decode().split(" ")[:2]
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if method == "POST" and path.endswith("/chat/completions"):
+                    await self.complete(json.loads(body), writer)
+                elif method == "POST" and path == "/api/chat":
+                    await self.complete(json.loads(body), writer, native=True)
+                elif method == "GET" and path == "/api/ps":
+                    # Reported with a tag, like Ollama does
+                    models = [f"{self.loaded}:latest" if ":" not in self.loaded else self.loaded] if self.loaded else []
+                    self.respond(writer, 200, {"models": [{"name": name, "model": name} for name in models]})
+                else:
+                    self.respond(writer, 404, {"error": "not found"})
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status, payload, extra=""):
+        """
+        Write a JSON response.
+        """
+        body = json.dumps(payload).encode()
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n{extra}"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+
+    def chunk(self, writer, data, native=False):
+        """
+        Write one server-sent event, or one line of JSON for /api/chat, as an HTTP chunk.
+        """
+        event = f"{data}\n".encode() if native else f"data: {data}\n\n".encode()
+        writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+
+    async def load(self, model):
+        """
+        Switch the loaded model, taking load_delay seconds if it changes.
+        """
+        async with self.switching:
+            if model != self.loaded:
+                self.loads += 1
+                await asyncio.sleep(self.load_delay)
+                self.loaded = model
+
+    def tool_call(self, tools):
+        """
+        Build a call to the first offered tool, filling required string arguments.
+        """
+        function = tools[0]["function"]
+        arguments = {name: "bench" for name in function.get("parameters", {}).get("required", [])}
+        return {
+            "id": f"call_{self.requests}",
+            "type": "function",
+            "function": {"name": function["name"], "arguments": json.dumps(arguments)}
+        }
+
+    async def complete(self, request, writer, native=False):
+        """
+        Answer one chat completions request, or one /api/chat request if native.
+        """
+        model = request.get("model", "bench")
+        await self.load(model)
+        if native:
+            if not request.get("messages"):
+                self.respond(writer, 200, {"model": model, "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "load"})
+                return
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            if random.random() < 0.5:
+                self.respond(writer, 429, {"error": {"message": "rate limited"}}, "Retry-After: 0\r\n")
+            else:
+                self.respond(writer, 500, {"error": {"message": "injected failure"}})
+            return
+
+        messages = request.get("messages", [])
+        tools = request.get("tools")
+        call = None
+        if tools and messages and messages[-1].get("role") != "tool" and random.random() < self.tool_rate:
+            self.tool_calls += 1
+            call = self.tool_call(tools)
+        text = " ".join(random.choice(WORDS) for _ in range(self.words)).capitalize() + "."
+        prompt_tokens = sum(len(str(message.get("content") or "")) for message in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": self.words}
+
+        if native:
+            await self.chat(request, writer, text, call, usage)
+            return
+        if not request.get("stream"):
+            message = {"role": "assistant", "content": None if call else text}
+            if call:
+                message["tool_calls"] = [call]
+            self.respond(writer, 200, {
+                "id": f"bench-{self.requests}", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if call else "stop"}],
+                "usage": usage
+            })
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        if call:
+            self.chunk(writer, json.dumps({"choices": [{"index": 0, "delta": {"tool_calls": [dict(call, index=0)]}, "finish_reason": None}]}))
+            self.chunk(writer, json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}]}))
+        else:
+            for i, word in enumerate(text.split(" ")):
+                delta = word if i == 0 else " " + word
+                self.chunk(writer, json.dumps({"choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}))
+                await writer.drain()
+                if self.token_delay:
+                    await asyncio.sleep(self.token_delay)
+            self.chunk(writer, json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}))
+        self.chunk(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+
+    async def chat(self, request, writer, text, call, usage):
+        """
+        Answer an /api/chat request the way Ollama does.
+        """
+        model = request["model"]
+        final = {"model": model, "done": True, "done_reason": "stop",
+                 "prompt_eval_count": usage["prompt_tokens"], "eval_count": usage["completion_tokens"]}
+        message = {"role": "assistant", "content": "" if call else text}
+        if call:
+            message["tool_calls"] = [{"function": {"name": call["function"]["name"], "arguments": json.loads(call["function"]["arguments"])}}]
+        if not request.get("stream"):
+            self.respond(writer, 200, dict(final, message=message))
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        if call:
+            self.chunk(writer, json.dumps({"model": model, "message": message, "done": False}), native=True)
+        else:
+            for i, word in enumerate(text.split(" ")):
+                delta = word if i == 0 else " " + word
+                self.chunk(writer, json.dumps({"model": model, "message": {"role": "assistant", "content": delta}, "done": False}), native=True)
+                await writer.drain()
+                if self.token_delay:
+                    await asyncio.sleep(self.token_delay)
+        self.chunk(writer, json.dumps(dict(final, message={"role": "assistant", "content": ""})), native=True)
+        writer.write(b"0\r\n\r\n")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--words", type=int, default=40)
+    parser.add_argument("--tool-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--load-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockOpenAI(args.latency, args.token_delay, args.words, args.tool_rate, args.error_rate, args.load_delay)
+    await server.start(args.host, args.port)
+    print(f"Mock chat completions on http://{args.host}:{server.port}/v1")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+class TTLCache:
+    """
+    In-memory cache with per-entry expiry, an LRU size cap and single-flight loading.
+
+    Concurrent lookups of a key that is being computed wait for that one
+    computation instead of starting their own.  Only successful results are
+    stored, errors are passed to every waiter and then forgotten.
+
+    Attributes:
+        max_size (int): Maximum number of entries kept.
+        entries (OrderedDict): Key -> (expiry time, value), least recently used first.
+        inflight (dict): Key -> task computing the value.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to compute the value.
+        coalesced (int): Misses that joined a computation already in progress.
+    """
+    def __init__(self, max_size=256):
+        """
+        Args:
+            max_size (int, optional): Maximum number of entries kept.
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        """
+        Look up a key.
+
+        Args:
+            key (hashable): The cache key.
+
+        Returns:
+            The cached value, or MISSING if it is absent or expired.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+        self.misses += 1
+        return MISSING
+
+    def set(self, key, value, ttl):
+        """
+        Store a value, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (hashable): The cache key.
+            value: The value to store.
+            ttl (float): Seconds until the entry expires.
+        """
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get_or_compute(self, key, compute, ttl):
+        """
+        Return the cached value for a key, computing it once if needed.
+
+        Args:
+            key (hashable): The cache key.
+            compute (coroutine function): Produces the value when it isn't cached.
+            ttl (float): Seconds a computed value stays cached.
+
+        Returns:
+            The cached or newly computed value.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self.inflight[key] = task
+            task.add_done_callback(lambda task: self.settle(key, task, ttl))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def settle(self, key, task, ttl):
+        """
+        Store the result of a finished computation.
+
+        Args:
+            key (hashable): The cache key.
+            task (asyncio.Task): The finished computation.
+            ttl (float): Seconds the value stays cached.
+        """
+        self.inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.set(key, task.result(), ttl)
+
+    def stats(self):
+        """
+        Report cache size and hit/miss counters.
+
+        Returns:
+            dict: Entries, hits, misses and coalesced lookups.
+        """
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced
+        }
@@ -0,0 +1,87 @@
+import logging
+import httpx
+
+class ClientPool:
+    """
+    Registry of long-lived HTTP clients, one per provider base URL.
+
+    Every completion used to open a fresh httpx.AsyncClient, paying a new
+    TCP and TLS handshake each time.  The pool hands out a persistent client
+    per base URL so connections are kept alive and reused across requests,
+    tool iterations and channels.
+
+    Attributes:
+        limits (httpx.Limits): Connection limits applied to every client.
+        timeout (httpx.Timeout): Connect and read timeouts applied to every client.
+        http2 (bool): Whether clients negotiate HTTP/2.
+        clients (dict): Open clients keyed by base URL.
+    """
+    def __init__(self, max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0, http2=False, timeout=120.0, connect_timeout=10.0):
+        """
+        Initialize the pool.  Clients are created lazily on first use.
+
+        Args:
+            max_connections (int): Maximum concurrent connections per client.
+            max_keepalive_connections (int): Idle connections kept open per client.
+            keepalive_expiry (float): Seconds an idle connection is kept open.
+            http2 (bool): Enable HTTP/2, requires the h2 package (httpx[http2]).
+            timeout (float): Seconds to wait for each read, write or pooled connection.
+            connect_timeout (float): Seconds to wait for a new connection to be established.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        if http2:
+            try:
+                import h2
+            except ImportError:
+                self.log("HTTP/2 requested but the h2 package is not installed, falling back to HTTP/1.1")
+                http2 = False
+        self.http2 = http2
+        self.clients = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a pool from the "http" block of config.json.
+
+        Args:
+            config (dict): HTTP settings, any missing key uses the default.
+
+        Returns:
+            ClientPool: The configured pool.
+        """
+        return cls(**(config or {}))
+
+    def get(self, base_url):
+        """
+        Return the shared client for a base URL, creating it if needed.
+
+        Args:
+            base_url (str): Provider base URL, eg https://api.openai.com/v1
+
+        Returns:
+            httpx.AsyncClient: The persistent client for that URL.
+        """
+        client = self.clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2
+            )
+            self.clients[base_url] = client
+        return client
+
+    async def aclose(self):
+        """
+        Close every client in the pool.  Called on shutdown.
+        """
+        clients = list(self.clients.values())
+        self.clients.clear()
+        for client in clients:
+            await client.aclose()
@@ -0,0 +1,105 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+class TurnCoalescer:
+    """
+    Takes turns on each conversation one at a time, merging turns that arrive together.
+
+    Several people can talk to the same history with .x, and one person can
+    send a few lines in a row.  A turn opens a batch for its conversation and
+    waits a short window, then for the conversation's previous turn to
+    finish.  Turns arriving in the meantime join the open batch instead of
+    starting their own, so they are answered together by a single completion
+    that sees all of them, and no two completions ever update the same
+    history at once.
+
+    Attributes:
+        window (float): Seconds a new batch waits for more turns before running.
+        open (dict): Conversation key -> batch still taking turns, a list of (nickname, text).
+        locks (dict): Conversation key -> [asyncio.Lock, number of tasks using it].
+        batches (int): Batches run.
+        merged (int): Turns that joined a batch started by another turn.
+    """
+    def __init__(self, window=0.0):
+        """
+        Args:
+            window (float, optional): Seconds a new batch waits for more turns before running.
+        """
+        self.window = window
+        self.open = {}
+        self.locks = {}
+        self.batches = 0
+        self.merged = 0
+
+    def join(self, key, nickname, text):
+        """
+        Add a turn to the conversation's open batch, or open a new one.
+
+        Args:
+            key (tuple): (channel, nickname) of the conversation.
+            nickname (str): Who sent the turn.
+            text (str): The message.
+
+        Returns:
+            list: The new batch if the caller should run it with run(), None if
+                the turn joined a batch another task is going to run.
+        """
+        batch = self.open.get(key)
+        if batch is not None:
+            batch.append((nickname, text))
+            self.merged += 1
+            return None
+        batch = self.open[key] = [(nickname, text)]
+        return batch
+
+    @asynccontextmanager
+    async def run(self, key, batch):
+        """
+        Wait for the window and the conversation's turn, then stop the batch taking turns.
+
+        Args:
+            key (tuple): (channel, nickname) of the conversation.
+            batch (list): The batch returned by join().
+
+        Yields:
+            list: The batch's (nickname, text) turns, in the order they arrived.
+        """
+        try:
+            if self.window:
+                await asyncio.sleep(self.window)
+            async with self.lock(key):
+                del self.open[key]
+                self.batches += 1
+                yield batch
+        finally:
+            if self.open.get(key) is batch:
+                del self.open[key]
+
+    @asynccontextmanager
+    async def lock(self, key):
+        """
+        Hold a conversation exclusively, for anything else that rewrites its history.
+
+        Args:
+            key (tuple): (channel, nickname) of the conversation.
+        """
+        entry = self.locks.get(key)
+        if entry is None:
+            entry = self.locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.locks[key]
+
+    def stats(self):
+        """
+        Report batching activity.
+
+        Returns:
+            dict: Batches run, turns merged into them and conversations with a turn running or waiting.
+        """
+        return {"batches": self.batches, "merged": self.merged, "busy": len(self.locks)}
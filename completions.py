@@ -0,0 +1,95 @@
+import hashlib
+import json
+import time
+
+from cache import MISSING, TTLCache
+
+class CompletionCache:
+    """
+    Cache of finished responses to repeated requests.
+
+    Requests that are sent with exactly the same model, options and messages,
+    like channel introductions, farewells and persona greetings, are answered
+    from memory instead of calling the API again.  With storage attached the
+    responses are also kept on disk, so they survive a restart.  Callers opt
+    in per request, conversations with real users are never cached.
+
+    Attributes:
+        ttl (float): Seconds a response stays cached, 0 disables the cache.
+        memory (TTLCache): Recently used responses.
+        storage (Storage): Persistent backing store, or None.
+    """
+    def __init__(self, ttl=86400, max_size=512, storage=None):
+        """
+        Args:
+            ttl (float, optional): Seconds a response stays cached.
+            max_size (int, optional): Maximum number of responses kept in memory.
+            storage (Storage, optional): Persistent backing store.
+        """
+        self.ttl = ttl
+        self.memory = TTLCache(max_size)
+        self.storage = storage
+
+    @staticmethod
+    def key(model, options, messages, tools=None):
+        """
+        Hash everything that determines a response.
+
+        Args:
+            model (str): Model name.
+            options (dict): Sampling options sent with the request.
+            messages (list): The request's messages.
+            tools (list, optional): Tool definitions offered to the model.
+
+        Returns:
+            str: Hex SHA-256 digest of the request.
+        """
+        request = json.dumps([model, options, messages, tools], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    async def get(self, key):
+        """
+        Look up a response in memory, then on disk.
+
+        Args:
+            key (str): Request hash.
+
+        Returns:
+            list: The response lines, or None if they aren't cached.
+        """
+        if not self.ttl:
+            return None
+        lines = self.memory.get(key)
+        if lines is not MISSING:
+            return list(lines)
+        if self.storage is None:
+            return None
+        stored = await self.storage.load_completion(key)
+        if stored is None:
+            return None
+        lines, expires = stored
+        self.memory.set(key, tuple(lines), expires - time.time())
+        return list(lines)
+
+    def set(self, key, lines):
+        """
+        Store a response.
+
+        Args:
+            key (str): Request hash.
+            lines (list): The response lines.
+        """
+        if not self.ttl or not lines:
+            return
+        self.memory.set(key, tuple(lines), self.ttl)
+        if self.storage is not None:
+            self.storage.save_completion(key, list(lines), time.time() + self.ttl)
+
+    def stats(self):
+        """
+        Report cache size and hit/miss counters.
+
+        Returns:
+            dict: Entries in memory, hits and misses.
+        """
+        return self.memory.stats()
@@ -0,0 +1,188 @@
+import logging
+
+SUMMARY_PROMPT = ("Summarize the conversation below in at most {words} words.  Keep names, facts, "
+                  "preferences, decisions and open questions.  Reply with the summary only.")
+
+def transcript(messages):
+    """
+    Render messages as plain text for the summary model.
+
+    Args:
+        messages (list): Chat messages.
+
+    Returns:
+        str: One "role: content" line per message, tool calls by name.
+    """
+    lines = []
+    for message in messages:
+        if message.get("content"):
+            lines.append(f"{message['role']}: {message['content']}")
+        for tool_call in message.get("tool_calls") or []:
+            lines.append(f"{message['role']}: called {tool_call.get('function', {}).get('name')}")
+    return "\n".join(lines)
+
+class ContextPacker:
+    """
+    Fits a conversation into the context budget of the model answering it.
+
+    Token counts come from the estimates the conversation store already keeps
+    for every turn, so packing costs a walk over the turns and no tokenizer.
+    The newest turns are sent as they are.  When the whole history doesn't
+    fit, the older turns are replaced by a short summary written by a cheap
+    model.  The summary is kept with the conversation and reused until more
+    turns fall out of the budget, and then only the new turns are folded into
+    it, so the summary model sees each turn once.  A new summary also covers
+    enough turns to leave half the budget free, so it lasts for several turns
+    instead of being rewritten for every message.  The history in memory is
+    not changed; "history_size" and "history_tokens" still limit it.
+
+    Attributes:
+        max_tokens (int): Budget for models without their own, None to send everything.
+        model_tokens (dict): Model name -> token budget for its requests.
+        summary_model (str): Model writing the summaries, None to drop old turns without one.
+        summary_words (int): Longest summary asked for, in words.
+        summarize (coroutine function): Called with (model, messages), returns the summary text.
+        packed (int): Requests that didn't fit and were packed.
+        summaries (int): Summaries written.
+        reused (int): Packed requests that reused the conversation's summary.
+        failed (int): Summaries that couldn't be written, the old turns were dropped instead.
+    """
+    def __init__(self, summarize=None, max_tokens=None, model_tokens=None, summary_model=None, summary_words=150):
+        """
+        Args:
+            summarize (coroutine function, optional): Called with (model, messages), returns the summary text.
+            max_tokens (int, optional): Budget for models without their own.
+            model_tokens (dict, optional): Model name -> token budget.
+            summary_model (str, optional): Model writing the summaries.
+            summary_words (int, optional): Longest summary asked for, in words.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.model_tokens = model_tokens or {}
+        self.summary_model = summary_model if summarize is not None else None
+        self.summary_words = summary_words
+        self.packed = 0
+        self.summaries = 0
+        self.reused = 0
+        self.failed = 0
+
+    def budget(self, model):
+        """
+        Look up the token budget of a model.
+
+        Args:
+            model (str): Model name.
+
+        Returns:
+            int: The budget, or None if requests to the model aren't limited.
+        """
+        return self.model_tokens.get(model, self.max_tokens)
+
+    async def pack(self, conversation, model):
+        """
+        Build the messages to send for a conversation within the model's budget.
+
+        Args:
+            conversation (Conversation): The conversation to send.
+            model (str): Model that will answer.
+
+        Returns:
+            list: The system message, with any summary of older turns, followed by the newest turns.
+        """
+        budget = self.budget(model)
+        if budget is None or conversation.system_tokens + conversation.tokens <= budget:
+            return conversation.messages()
+        self.packed += 1
+
+        units = conversation.units
+        available = budget - conversation.system_tokens
+        if self.summary_model is not None:
+            available -= self.summary_words * 4 // 3 + 4
+        cut = self.fit(units, available)
+
+        summary = None
+        if cut and self.summary_model is not None:
+            cut, summary = await self.summary(conversation, cut, available)
+
+        system = conversation.system
+        if summary:
+            summary = f"Summary of the earlier conversation: {summary}"
+            system = f"{system}\n\n{summary}" if system is not None else summary
+        messages = [{"role": "system", "content": system}] if system is not None else []
+        for index in range(cut, len(units)):
+            messages.extend(units[index][0])
+        return messages
+
+    @staticmethod
+    def fit(units, available):
+        """
+        Find how many of the newest turns fit a number of tokens.  The newest turn always fits.
+
+        Args:
+            units (deque): The conversation's turns, oldest first.
+            available (int): Tokens available for turns.
+
+        Returns:
+            int: Index of the oldest turn that fits.
+        """
+        used = 0
+        cut = len(units)
+        while cut > 0 and (cut == len(units) or used + units[cut - 1][2] <= available):
+            cut -= 1
+            used += units[cut][2]
+        return cut
+
+    async def summary(self, conversation, cut, available):
+        """
+        Get a summary of the turns before the cut, reusing and extending the conversation's last one.
+
+        Args:
+            conversation (Conversation): The conversation being packed.
+            cut (int): Index of the first turn that will be sent as it is.
+            available (int): Tokens available for turns.
+
+        Returns:
+            tuple: The index of the first turn to send, which is later than the cut
+                if the existing summary already covers more, and the summary text or None.
+        """
+        units = conversation.units
+        previous = None
+        start = 0
+        if conversation.summary is not None:
+            last, previous = conversation.summary
+            position = next((index for index, unit in enumerate(units) if unit is last), None)
+            if position is not None:
+                if position + 1 >= cut:
+                    self.reused += 1
+                    return position + 1, previous
+                start = position + 1
+
+        deeper = max(cut, self.fit(units, available // 2))
+        older = [message for index in range(start, deeper) for message in units[index][0]]
+        text = transcript(older)
+        if previous:
+            text = f"Summary so far: {previous}\n\nConversation since then:\n{text}"
+        request = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(words=self.summary_words)},
+            {"role": "user", "content": text}
+        ]
+        try:
+            summary = await self.summarize(self.summary_model, request)
+        except Exception as e:
+            # Not only Overloaded and CompletionError, a failure here would fail every request of the conversation
+            self.failed += 1
+            self.log("Could not summarize history of %s: %r", conversation.key, e)
+            return cut, previous
+        self.summaries += 1
+        conversation.summary = (units[deeper - 1], summary)
+        return deeper, summary
+
+    def stats(self):
+        """
+        Report packing activity.
+
+        Returns:
+            dict: Packed requests, summaries written, summaries reused and failures.
+        """
+        return {"packed": self.packed, "summaries": self.summaries, "reused": self.reused, "failed": self.failed}
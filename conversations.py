@@ -0,0 +1,319 @@
+import sys
+import time
+from collections import OrderedDict, deque
+
+def message_size(message):
+    """
+    Estimate the memory a message takes, in bytes of text.
+
+    Args:
+        message (dict): A chat message.
+
+    Returns:
+        int: UTF-8 length of its content and tool call arguments.
+    """
+    size = len((message.get("content") or "").encode())
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        size += len((function.get("name") or "").encode()) + len((function.get("arguments") or "").encode())
+    return size
+
+def estimate_tokens(message):
+    """
+    Roughly estimate how many tokens a message costs.
+
+    Args:
+        message (dict): A chat message.
+
+    Returns:
+        int: About four bytes of text per token, plus the per-message overhead.
+    """
+    return message_size(message) // 4 + 4
+
+class Conversation:
+    """
+    Chat history for one user in one channel.
+
+    The system prompt is kept apart from the turns and interned, so every
+    conversation using the same persona shares a single copy of it.  Turns
+    are stored as units in a deque: a unit is a single message, or an
+    assistant tool call together with its results, so the oldest turn can be
+    dropped in constant time and tool results are never left without the
+    call that produced them.
+
+    Attributes:
+        key (tuple): (channel, sender) the conversation belongs to.
+        system (str): System prompt, or None for stock settings.
+        system_tokens (int): Estimated tokens in the system prompt.
+        units (deque): (messages, bytes, tokens) for each turn, oldest first.
+        count (int): Number of messages in the units.
+        size (int): Bytes of text held in the units.
+        tokens (int): Estimated tokens held in the units.
+        last_used (float): Monotonic time of the last access.
+        summary (tuple): (newest unit covered, text) of the summary of older turns, or None.
+    """
+    __slots__ = ("key", "system", "system_tokens", "units", "count", "size", "tokens", "last_used", "summary")
+
+    def __init__(self, key, system=None):
+        self.key = key
+        self.units = deque()
+        self.count = 0
+        self.size = 0
+        self.tokens = 0
+        self.set_system(system)
+        self.last_used = time.monotonic()
+        self.summary = None
+
+    def __len__(self):
+        return self.count + (self.system is not None)
+
+    def set_system(self, system):
+        """
+        Replace the system prompt.
+
+        Args:
+            system (str): The new system prompt, None for stock settings.
+        """
+        self.system = sys.intern(system) if system is not None else None
+        self.system_tokens = estimate_tokens({"content": system}) if system is not None else 0
+
+    def messages(self):
+        """
+        Build the message list to send to the model.
+
+        Returns:
+            list: The system message, if any, followed by the turns.
+        """
+        messages = [{"role": "system", "content": self.system}] if self.system is not None else []
+        for unit, size, tokens in self.units:
+            messages.extend(unit)
+        return messages
+
+class ConversationStore:
+    """
+    Bounded store of every conversation the bot is tracking.
+
+    Conversations are kept in least recently used order.  When there are too
+    many of them, they hold too much text, or they have been idle too long,
+    whole conversations are evicted starting with the least recently used.
+    With storage attached, every change is also queued to be saved to disk,
+    and evicted conversations can be fetched back later.
+
+    Attributes:
+        max_conversations (int): Maximum number of conversations kept.
+        max_bytes (int): Maximum bytes of message text kept across all conversations.
+        idle_timeout (float): Seconds after which an unused conversation is dropped, None to keep them.
+        conversations (OrderedDict): (channel, sender) -> Conversation, least recently used first.
+        bytes (int): Bytes of message text currently held.
+        evicted (int): Number of conversations evicted so far.
+        storage (Storage): Persistent backing store, or None.
+    """
+    def __init__(self, max_conversations=1000, max_bytes=50_000_000, idle_timeout=None, storage=None):
+        """
+        Args:
+            max_conversations (int, optional): Maximum number of conversations kept.
+            max_bytes (int, optional): Maximum bytes of message text kept.
+            idle_timeout (float, optional): Seconds of inactivity before a conversation is dropped.
+            storage (Storage, optional): Persistent backing store.
+        """
+        self.storage = storage
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.conversations = OrderedDict()
+        self.bytes = 0
+        self.evicted = 0
+
+    def get(self, channel, sender):
+        """
+        Look up a conversation and mark it as recently used.
+
+        Args:
+            channel (str): Channel name, or "privmsg".
+            sender (str): Nickname the conversation belongs to.
+
+        Returns:
+            Conversation: The conversation, or None if it isn't tracked.
+        """
+        conversation = self.conversations.get((channel, sender))
+        if conversation is not None:
+            conversation.last_used = time.monotonic()
+            self.conversations.move_to_end(conversation.key)
+        return conversation
+
+    async def fetch(self, channel, sender):
+        """
+        Look up a conversation, loading it from storage if it isn't in memory.
+
+        Args:
+            channel (str): Channel name, or "privmsg".
+            sender (str): Nickname the conversation belongs to.
+
+        Returns:
+            Conversation: The conversation, or None if it isn't tracked or stored.
+        """
+        conversation = self.get(channel, sender)
+        if conversation is not None or self.storage is None:
+            return conversation
+        stored = await self.storage.load(channel, sender)
+        conversation = self.get(channel, sender)
+        if conversation is not None or stored is None:
+            return conversation
+        system, units = stored
+        conversation = self.conversations[(channel, sender)] = Conversation((channel, sender), system)
+        for unit in units:
+            self.add_unit(conversation, unit)
+        self.evict()
+        return conversation
+
+    def open(self, channel, sender, system=None):
+        """
+        Return a conversation, starting a new one if it isn't tracked.
+
+        Args:
+            channel (str): Channel name, or "privmsg".
+            sender (str): Nickname the conversation belongs to.
+            system (str, optional): System prompt for a new conversation.
+
+        Returns:
+            Conversation: The existing or new conversation.
+        """
+        conversation = self.get(channel, sender)
+        if conversation is None:
+            conversation = self.conversations[(channel, sender)] = Conversation((channel, sender), system)
+            self.evict()
+        return conversation
+
+    def reset(self, channel, sender, system=None):
+        """
+        Clear a conversation and give it a new system prompt.
+
+        Args:
+            channel (str): Channel name, or "privmsg".
+            sender (str): Nickname the conversation belongs to.
+            system (str, optional): The new system prompt, None for stock settings.
+
+        Returns:
+            Conversation: The cleared conversation.
+        """
+        conversation = self.open(channel, sender)
+        self.resize(conversation, -conversation.size)
+        conversation.units.clear()
+        conversation.count = conversation.tokens = 0
+        conversation.summary = None
+        conversation.set_system(system)
+        self.changed(conversation)
+        return conversation
+
+    def append(self, conversation, *messages):
+        """
+        Add messages to the end of a conversation as one unit.
+
+        An assistant message with tool calls should be appended together with
+        its tool results, so they are kept and dropped together.
+
+        Args:
+            conversation (Conversation): The conversation to extend.
+            *messages (dict): The messages to add.
+        """
+        self.add_unit(conversation, messages)
+        conversation.last_used = time.monotonic()
+        self.changed(conversation)
+        self.evict()
+
+    def add_unit(self, conversation, messages):
+        """
+        Append a unit to a conversation and update its counters.
+
+        Args:
+            conversation (Conversation): The conversation to extend.
+            messages (tuple): The messages making up the unit.
+        """
+        size = sum(message_size(message) for message in messages)
+        tokens = sum(estimate_tokens(message) for message in messages)
+        conversation.units.append((tuple(messages), size, tokens))
+        conversation.count += len(messages)
+        conversation.tokens += tokens
+        self.resize(conversation, size)
+
+    def trim(self, conversation, size=None, max_tokens=None):
+        """
+        Drop the oldest units until a conversation fits its limits.  The newest unit is always kept.
+
+        Args:
+            conversation (Conversation): The conversation to trim.
+            size (int, optional): Maximum number of messages, counting the system prompt.
+            max_tokens (int, optional): Maximum estimated tokens, counting the system prompt.
+        """
+        units = conversation.units
+        while len(units) > 1:
+            over_size = size is not None and len(conversation) > size
+            over_tokens = max_tokens is not None and conversation.system_tokens + conversation.tokens > max_tokens
+            if not (over_size or over_tokens):
+                break
+            messages, unit_size, tokens = units.popleft()
+            conversation.count -= len(messages)
+            conversation.tokens -= tokens
+            self.resize(conversation, -unit_size)
+            self.changed(conversation)
+
+    def drop_channel(self, channel):
+        """
+        Forget every conversation in a channel.
+
+        Args:
+            channel (str): Channel name.
+        """
+        for key in [key for key in self.conversations if key[0] == channel]:
+            self.bytes -= self.conversations.pop(key).size
+        if self.storage is not None:
+            self.storage.delete_channel(channel)
+
+    def changed(self, conversation):
+        """
+        Queue a conversation to be saved, if storage is attached.
+
+        Args:
+            conversation (Conversation): The conversation that changed.
+        """
+        if self.storage is not None:
+            self.storage.save(conversation)
+
+    def resize(self, conversation, delta):
+        """
+        Account for text added to or removed from a conversation.
+
+        Args:
+            conversation (Conversation): The conversation that changed.
+            delta (int): Change in bytes.
+        """
+        conversation.size += delta
+        if self.conversations.get(conversation.key) is conversation:
+            self.bytes += delta
+
+    def evict(self):
+        """
+        Drop least recently used conversations until the store is within its limits.
+        """
+        now = time.monotonic()
+        while len(self.conversations) > 1:
+            conversation = next(iter(self.conversations.values()))
+            idle = self.idle_timeout is not None and now - conversation.last_used > self.idle_timeout
+            if not idle and len(self.conversations) <= self.max_conversations and self.bytes <= self.max_bytes:
+                break
+            del self.conversations[conversation.key]
+            self.bytes -= conversation.size
+            self.evicted += 1
+
+    def stats(self):
+        """
+        Report what the store is holding.
+
+        Returns:
+            dict: Resident conversations, bytes of text and evictions so far.
+        """
+        return {
+            "conversations": len(self.conversations),
+            "bytes": self.bytes,
+            "evicted": self.evicted
+        }
@@ -1,12 +1,27 @@
 import asyncio
+import concurrent.futures
+import itertools
 import logging
-import httpx
-import textwrap
-import json
+import threading
 import time
-from irc.bot import SingleServerIRCBot
-
-from tools import *
+from contextlib import nullcontext
+from types import MappingProxyType
+import httpx
+from irc.bot import ExponentialBackoff, ServerSpec, SingleServerIRCBot
+import more_itertools
+
+from coalescing import TurnCoalescer
+from context import ContextPacker
+from limiter import Overloaded
+from linesplit import LineSplitter, line_budget
+import ollama
+from resilience import CompletionError, ProviderError
+from sender import SendScheduler, PRIORITY_COMMAND, PRIORITY_REPLY
+from services import Services
+from reasoning import separate
+from reload import ConfigWatcher
+from streaming import read_stream
+from transport import AsyncReconnect, LoopReactor
 
 class InfiniGPT(SingleServerIRCBot):
     """
@@ -20,48 +35,297 @@ class InfiniGPT(SingleServerIRCBot):
 
     Configuration:
     Reads settings from a JSON file, including IRC credentials, LLM API keys, 
-    and default behavior settings.
+    and default behavior settings.  One InfiniGPT serves one IRC network, and
+    several of them can share a Services object to serve many networks from
+    one process.
     
     Attributes:
+        services (Services): Resources shared with the bots of other networks.
+        network (str): Name of the network, None when a single unnamed network is configured.
+        irc (dict): The network's IRC settings from config.json.
         server (str): IRC server to connect to.
         port (int): Port to connect to on the IRC server.
         nickname (str): Bot's nickname on the IRC server.
+        hostmask (str): The bot's nick!user@host as the server shows it, None until it has joined a channel.
         password (str): Password for NickServ identification.
-        _channels (list): List of channels to join.
+        _channels (list): Channels to join, names or {"name", "intro"} entries.
+        identify_timeout (float): Seconds to wait for NickServ to confirm identification.
+        transport (str): "thread" to run the IRC reactor in a thread, "asyncio" to run it on the event loop.
         admins (list): Nicknames of the bot's admins.
-        models (dict): Supported LLM models grouped by provider.
-        api_keys (dict): API keys for different providers.
         default_model (str): Default model for generating responses.
         default_personality (str): Default personality for the bot.
         prompt (list): System prompt template for LLM interactions.
         options (dict): Additional options for API calls.
         history_size (int): Maximum number of messages per user to retain for context.
-        messages (dict): Tracks conversation history per channel and user.
-        openai_key (str): API key for OpenAI.
-        xai_key (str): API key for xAI.
-        google_key (str): API key for Google.
-        mistral_key (str): API key for Mistral.
+        history_tokens (dict): Per-model token budgets for history, used instead of history_size.
+        packer (ContextPacker): Fits each request into the model's context budget, summarizing older turns.
+        turns (TurnCoalescer): Runs one turn at a time per conversation, merging turns that arrive together.
+        stream (bool): Whether to stream completions and send lines as they finish.
+        conversations (ConversationStore): Tracks conversation history per channel and user.
+        storage (Storage): On-disk copy of conversations and settings, or None.
+        completions (CompletionCache): Responses to repeated requests like introductions and farewells.
+        admission (Admission): Per-provider request limits.
+        resilience (Resilience): Retries, circuit breakers and the fallback chain for requests.
+        clients (ClientPool): Persistent HTTP clients shared by all LLM requests.
+        ollama (OllamaPool): Native backend for local models on Ollama servers, None without Ollama models.
+        sender (SendScheduler): Outbound message queue with flood control.
+        metrics (Metrics): Shared metrics registry, with the LLM and send queue metrics
+            kept as send_wait, llm_first_byte, llm_latency, llm_tokens and llm_errors.
+        toolbox (ToolRuntime): Registry and executor for the tools in schema.json.
+        reasoning_log (ReasoningLog): Where the reasoning of thinking models is written.
+        tools (list): Tool definitions sent to the model.
+        model_index (dict): Model name -> Provider, built once from the model lists.
+        model (str): Global model, used where no channel or user model is set.
+        channel_models (dict): Channel -> model chosen for that channel.
+        user_models (dict): (channel, nickname) -> model chosen by that user.
+        identified (asyncio.Event): Set once NickServ has accepted the password.
+        prefixes (tuple): Starts of channel messages that can be commands, checked before any other work.
+        commands (MappingProxyType): Channel command -> action, for everyone.
+        admin_commands (MappingProxyType): Channel command -> action, for admins.
+        private_commands (MappingProxyType): Private message command -> action, for everyone.
+        private_admin_commands (MappingProxyType): Private message command -> action, for admins.
+        ready_after (float): Seconds from start until the channels were joined, None until then.
     """
-    def __init__(self):
+    def __init__(self, services=None, irc=None):
         """
         Initialize the InfiniGPT bot and load configurations.
+
+        Args:
+            services (Services, optional): Shared resources, loaded from config.json if not given.
+            irc (dict, optional): IRC settings of the network to serve, the first configured one if not given.
         """
-        with open("config.json", "r") as f:
-            self.config = json.load(f)
-            f.close()
-        
-        with open("schema.json") as f:
-            self.tools = json.load(f)
+        self.log = logging.getLogger(__name__).info
+        if services is None:
+            services = Services.from_files()
+        self.services = services
+        if irc is None:
+            irc = services.networks[0]
+
+        self.network = irc.get("name")
+        self.irc = irc
+        self.server, self.port, self.nickname, self.password = irc["server"], irc["port"], irc["nickname"], irc["password"]
+        self._channels, self.admins = irc["channels"], irc["admins"]
+        self.identify_timeout = irc.get("identify_timeout", 10)
+        self.transport = irc.get("transport", "thread")
+        self.ready_after = None
+        self.hostmask = None
+        llm = services.config["llm"]
+        self.default_model = llm["default_model"]
+        self.default_personality, self.prompt, self.options = llm["personality"], llm["prompt"], llm["options"]
+        self.history_size = llm["history_size"]
+        self.history_tokens = llm.get("history_tokens", {})
+        self.stream = llm.get("stream", False)
+        self.model_index = services.model_index
+        self.channel_models = {}
+        self.user_models = {}
+        self.storage = services.storage
+        self.conversations = services.conversations
+        self.completions = services.completions
+        self.clients = services.clients
+        self.ollama = services.ollama
+        self.admission = services.admission
+        self.resilience = services.resilience
+        self.metrics = services.metrics
+        self.reasoning_log = services.reasoning_log
+        self.send_wait = self.metrics.histogram("irc_send_wait_seconds", "Time messages spent in the send queue", ("network",))
+        label = self.network or self.server
+        self.sender = SendScheduler(self.write, observe_wait=lambda waited: self.send_wait.observe(waited, label), **irc.get("flood", {}))
+        services.senders[label] = self.sender
+        self.llm_first_byte = self.metrics.histogram("llm_first_byte_seconds", "Time until the provider started answering", ("provider", "model"))
+        self.llm_latency = self.metrics.histogram("llm_request_seconds", "Time for a whole completion request", ("provider", "model"))
+        self.llm_tokens = self.metrics.counter("llm_tokens_total", "Tokens reported by the provider", ("provider", "model", "direction"))
+        self.llm_errors = self.metrics.counter("llm_errors_total", "Failed completion requests", ("provider",))
+        self.toolbox = services.toolbox
+        self.tools = self.toolbox.schema
+        self.packer = self.context_packer(llm)
+        self.turns = TurnCoalescer(llm.get("coalesce_window", 0))
+
+        if self.transport == "asyncio":
+            self.reactor_class = LoopReactor
+            recon = AsyncReconnect()
+        else:
+            recon = ExponentialBackoff()
+        self.tasks = set()
+        super().__init__([(self.server, self.port)], self.nickname, self.nickname, recon=recon)
 
-        self.server, self.port, self.nickname, self.password, self._channels, self.admins = self.config["irc"].values()
-        self.models, self.api_keys, self.default_model, self.default_personality, self.prompt, self.options, self.history_size, self.ollama_url = self.config["llm"].values()
-        self.openai_key, self.xai_key, self.google_key, self.mistral_key = self.api_keys.values()
-        self.messages = {}
+        self.build_commands()
 
-        super().__init__([(self.server, self.port)], self.nickname, self.nickname) 
+    def build_commands(self):
+        """
+        Compile the command tables for the current nickname.
 
-        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-        self.log = logging.getLogger(__name__).info
+        The tables are built once and replaced as a whole when the nickname
+        changes, so handling a message is a single lookup, and the reactor
+        thread can read them while the event loop replaces them.
+        """
+        def model(message):
+            return message[1] if len(message) > 1 else None
+
+        def ai(connection, channel, sender, message):
+            return self.ai(connection, channel, sender, message)
+
+        self.prefixes = (".", f"{self.nickname}:", f"{self.nickname},")
+        self.commands = MappingProxyType({
+            ".ai": ai,
+            f"{self.nickname}:": ai,
+            f"{self.nickname},": ai,
+            ".x": lambda connection, channel, sender, message: self.ai(connection, channel, sender, message, x=True),
+            ".persona": lambda connection, channel, sender, message: self.set_prompt(connection, channel, sender, persona=' '.join(message[1:])),
+            ".custom": lambda connection, channel, sender, message: self.set_prompt(connection, channel, sender, custom=' '.join(message[1:])),
+            ".reset": lambda connection, channel, sender, message: self.reset(connection, channel, sender),
+            ".stock": lambda connection, channel, sender, message: self.reset(connection, channel, sender, stock=True),
+            ".mymodel": lambda connection, channel, sender, message: self.change_model(connection, channel, model=model(message), sender=sender, scope="user"),
+            ".help": lambda connection, channel, sender, message: self.help_menu(connection, message, sender)
+        })
+        self.admin_commands = MappingProxyType({
+            ".model": lambda connection, channel, sender, message: self.change_model(connection, channel, model=model(message), sender=sender, scope="channel"),
+            ".gmodel": lambda connection, channel, sender, message: self.change_model(connection, channel, model=model(message), sender=sender),
+            ".join": lambda connection, channel, sender, message: self.join_channels(connection, [message[1]] if len(message) > 1 else None),
+            ".part": lambda connection, channel, sender, message: self.part(connection, message[1] if len(message) > 1 else channel),
+            ".gpersona": lambda connection, channel, sender, message: self.gpersona(" ".join(message[1:]) if len(message) > 1 else None),
+            ".stats": lambda connection, channel, sender, message: self.stats(connection, channel)
+        })
+        self.private_commands = MappingProxyType({
+            ".persona": lambda connection, sender, message: self.set_prompt(connection, "privmsg", sender, persona=' '.join(message[1:])),
+            ".custom": lambda connection, sender, message: self.set_prompt(connection, "privmsg", sender, custom=' '.join(message[1:])),
+            ".reset": lambda connection, sender, message: self.reset(connection, "privmsg", sender),
+            ".stock": lambda connection, sender, message: self.reset(connection, "privmsg", sender, stock=True),
+            ".mymodel": lambda connection, sender, message: self.change_model(connection, "privmsg", model=model(message), sender=sender, scope="user"),
+            ".help": lambda connection, sender, message: self.help_menu(connection, message, sender, private=True)
+        })
+        self.private_admin_commands = MappingProxyType({
+            ".model": lambda connection, sender, message: self.change_model(connection, "privmsg", model=model(message), sender=sender),
+            ".gmodel": lambda connection, sender, message: self.change_model(connection, "privmsg", model=model(message), sender=sender),
+            ".join": lambda connection, sender, message: self.join_channels(connection, [message[1]] if len(message) > 1 else None),
+            ".part": lambda connection, sender, message: self.part(connection, message[1] if len(message) > 1 else None),
+            ".gpersona": lambda connection, sender, message: self.gpersona(" ".join(message[1:]) if len(message) > 1 else None),
+            ".stats": lambda connection, sender, message: self.stats(connection, "privmsg", sender)
+        })
+
+    def reload(self, irc, previous):
+        """
+        Switch this network to a reloaded configuration.
+
+        Settings are replaced in place, so conversations, the connection and
+        requests in progress carry on.  The default model and personality
+        are only changed if they changed in config.json, so choices made
+        with .gmodel and .gpersona survive unrelated edits.  Changes to the
+        connection are made afterwards on the event loop.
+
+        Args:
+            irc (dict): The network's new IRC settings.
+            previous (dict): The configuration that was replaced.
+        """
+        services, old = self.services, previous["llm"]
+        llm = services.config["llm"]
+        packer = self.packer
+        if llm.get("context") != old.get("context") or llm["models"] != old["models"]:
+            packer = self.context_packer(llm)
+
+        self.admins, self.password = irc["admins"], irc["password"]
+        self.identify_timeout = irc.get("identify_timeout", 10)
+        self.prompt, self.options = llm["prompt"], llm["options"]
+        self.history_size = llm["history_size"]
+        self.history_tokens = llm.get("history_tokens", {})
+        self.stream = llm.get("stream", False)
+        self.model_index = services.model_index
+        self.admission = services.admission
+        self.resilience = services.resilience
+        self.reasoning_log = services.reasoning_log
+        self.ollama = services.ollama
+        self.toolbox = services.toolbox
+        self.tools = self.toolbox.schema
+        self.packer = packer
+        self.turns.window = llm.get("coalesce_window", 0)
+        flood = irc.get("flood", {})
+        self.sender.burst, self.sender.rate = flood.get("burst", self.sender.burst), flood.get("rate", self.sender.rate)
+
+        if llm["personality"] != old["personality"]:
+            self.default_personality = llm["personality"]
+        self.system_prompt = self.prompt[0] + self.default_personality + self.prompt[1]
+        if llm["default_model"] != old["default_model"] or getattr(self, "model", None) not in self.model_index:
+            self.default_model = self.model = llm["default_model"]
+            if self.storage is not None:
+                self.storage.set_setting(self.scope("model"), self.model)
+
+        if irc.get("transport", "thread") != self.transport:
+            self.log("Changing the transport takes effect after a restart")
+        previous_irc, self.irc, self._channels = self.irc, irc, irc["channels"]
+        self.schedule(self.reconnect(previous_irc))
+
+    def context_packer(self, llm):
+        """
+        Build the context packer from the "context" block.
+
+        A summary model missing from the model lists is dropped, so older turns
+        are left out without a summary instead of failing every request.
+
+        Args:
+            llm (dict): The "llm" section of config.json.
+
+        Returns:
+            ContextPacker: The packer.
+        """
+        context = dict(llm.get("context", {}))
+        # Logged when the configuration is validated
+        if context.get("summary_model") is not None and context["summary_model"] not in self.services.model_index:
+            context["summary_model"] = None
+        return ContextPacker(self.summarize, **context)
+
+    async def reconnect(self, previous):
+        """
+        Bring the connection in line with reloaded IRC settings.
+
+        Only a new server or port needs a new connection.  Otherwise a new
+        nickname is asked for, channels added to the list are joined and
+        channels taken off it are left, without greeting the rest again.
+
+        Args:
+            previous (dict): The IRC settings that were replaced.
+        """
+        irc, connection = self.irc, self.connection
+        self._nickname = irc["nickname"]
+        if (irc["server"], irc["port"]) != (self.server, self.port):
+            self.server, self.port = irc["server"], irc["port"]
+            self.servers = more_itertools.peekable(itertools.cycle([ServerSpec(self.server, self.port)]))
+            self.log("Server changed, connecting to %s:%s", self.server, self.port)
+            if self.transport == "asyncio":
+                if connection.is_connected():
+                    connection.disconnect("Changing servers")
+                try:
+                    await self.connect_async()
+                except OSError as e:
+                    self.log("Could not connect to %s: %s", self.server, e)
+                    self.recon.run(self)
+            else:
+                await asyncio.to_thread(self.jump_server, "Changing servers")
+            return
+        if not connection.is_connected():
+            return
+        if irc["nickname"] != previous["nickname"]:
+            connection.nick(irc["nickname"])
+
+        def name(channel):
+            return channel["name"] if isinstance(channel, dict) else channel
+        before = {name(channel) for channel in previous["channels"]}
+        after = {name(channel) for channel in irc["channels"]}
+        added = [channel for channel in irc["channels"] if name(channel) not in before]
+        if added:
+            await self.join_channels(connection, added)
+        for channel in before - after:
+            await self.part(connection, channel)
+
+    def scope(self, name):
+        """
+        Qualify a channel or setting name with the network, so networks sharing storage stay apart.
+
+        Args:
+            name (str): Channel, "privmsg" or setting name.
+
+        Returns:
+            str: "network/name", or the name unchanged when only one unnamed network is served.
+        """
+        return f"{self.network}/{name}" if self.network else name
 
     def on_welcome(self, connection, event):
         """
@@ -71,19 +335,125 @@ class InfiniGPT(SingleServerIRCBot):
             connection (IRCConnection): IRC connection instance.
             event (IRCEvent): Event details from the server.
         """
-        self.log(f"Connected to {self.server}")
+        self.log("Connected to %s", self.server)
+        self.hostmask = None
+        if connection.get_nickname() != self.nickname:
+            self.nickname = connection.get_nickname()
+            self.build_commands()
         # Avoid UnicodeDecodeError when encountering non UTF-8 input
         if hasattr(connection, "buffer"):
             connection.buffer.errors = "replace"
             
+        self.system_prompt = self.prompt[0] + self.default_personality + self.prompt[1]
+        self.log("System prompt set to '%s'", self.system_prompt)
+        self.schedule(self.startup(connection))
+
+    def schedule(self, coroutine):
+        """
+        Run a coroutine on the event loop from an IRC event handler.
+
+        With the asyncio transport handlers already run on the loop, so the
+        coroutine becomes a task directly.  With the thread transport it is
+        handed over to the loop from the reactor thread.
+
+        Args:
+            coroutine (coroutine): The coroutine to run.
+        """
+        if self.transport == "asyncio":
+            task = self.loop.create_task(coroutine)
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call(self, callback, *args):
+        """
+        Run a plain function on the event loop from an IRC event handler.
+
+        Args:
+            callback (callable): The function to run.
+            *args: Arguments for the function.
+        """
+        if self.transport == "asyncio":
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    async def connect_async(self):
+        """
+        Connect to the next configured server with the asyncio transport.
+
+        Raises:
+            OSError: The connection failed, the next call tries the following server.
+        """
+        server = self.servers.peek()
+        try:
+            await self.connection.connect(server.host, server.port, self._nickname, server.password, ircname=self._realname)
+        except OSError:
+            next(self.servers)
+            raise
+
+    async def startup(self, connection):
+        """
+        Identify to NickServ, then join the configured channels.
+
+        Runs on the event loop, so the reactor thread keeps handling messages
+        while NickServ answers.
+
+        Args:
+            connection (IRCConnection): IRC connection instance.
+        """
+        await self.change_model(connection, model=self.default_model)
         if self.password != None:
-            connection.privmsg("NickServ", f"IDENTIFY {self.password}")
+            self.identified.clear()
+            self.sender.send("NickServ", f"IDENTIFY {self.password}", PRIORITY_COMMAND)
             self.log("Identifying to NickServ")
-            time.sleep(5)
-        asyncio.run_coroutine_threadsafe(self.change_model(connection, model=self.default_model), self.loop)
-        self.system_prompt = self.prompt[0] + self.default_personality + self.prompt[1]
-        self.log(f"System prompt set to '{self.system_prompt}'")
-        asyncio.run_coroutine_threadsafe(self.join_channels(connection, self._channels), self.loop)
+            try:
+                await asyncio.wait_for(self.identified.wait(), self.identify_timeout)
+            except asyncio.TimeoutError:
+                self.log("No answer from NickServ after %s seconds, joining anyway", self.identify_timeout)
+        await self.join_channels(connection, self._channels, on_joined=self.ready)
+
+    def ready(self):
+        """
+        Record how long startup took, once the channels have been joined.
+        """
+        self.ready_after = time.monotonic() - self.started
+        self.log("Ready after %.2f seconds", self.ready_after)
+
+    def on_privnotice(self, connection, event):
+        """
+        Watch for NickServ confirming identification.
+
+        Args:
+            connection (IRCConnection): IRC connection instance.
+            event (IRCEvent): Event details from the server.
+        """
+        if event.source and event.source.nick == "NickServ":
+            text = event.arguments[0].lower()
+            if "identified" in text or "accepted" in text or "recognized" in text:
+                self.call(self.identified.set)
+
+    def on_loggedin(self, connection, event):
+        """
+        Handle RPL_LOGGEDIN, sent by servers when the account is identified.
+
+        Args:
+            connection (IRCConnection): IRC connection instance.
+            event (IRCEvent): Event details from the server.
+        """
+        self.call(self.identified.set)
+
+    def write(self, command, target, text):
+        """
+        Write one message to the server.  Used by the send scheduler.
+
+        Args:
+            command (str): Connection method to use, "privmsg" or "notice".
+            target (str): Channel or nickname to send to.
+            text (str): The message.
+        """
+        getattr(self.connection, command)(target, text)
 
     def on_nicknameinuse(self, connection, event):
         """
@@ -95,6 +465,31 @@ class InfiniGPT(SingleServerIRCBot):
         """
         connection.nick(connection.get_nickname() + "_")
 
+    def on_nick(self, connection, event):
+        """
+        Follow changes of the bot's own nickname, so it keeps answering to it.
+
+        Args:
+            connection (IRCConnection): IRC connection instance.
+            event (IRCEvent): Event details from the server.
+        """
+        if event.source.nick == self.nickname:
+            self.nickname = event.target
+            self.hostmask = f"{event.target}!{event.source.userhost}"
+            self.build_commands()
+            self.log("Nickname changed to %s", self.nickname)
+
+    def on_join(self, connection, event):
+        """
+        Learn the bot's own hostmask from its first join, to know how long its messages can be.
+
+        Args:
+            connection (IRCConnection): IRC connection instance.
+            event (IRCEvent): Event details from the server.
+        """
+        if event.source.nick == self.nickname and "@" in event.source:
+            self.hostmask = str(event.source)
+
     def on_privmsg(self, connection, event):
         """
         Privately chat with the bot, without having to use .ai command
@@ -105,14 +500,9 @@ class InfiniGPT(SingleServerIRCBot):
         """
         sender = event.source.nick
         message = event.arguments[0].split(" ")
-        if "privmsg" not in self.messages:
-            self.messages['privmsg'] = {}
-        if sender not in self.messages['privmsg']:
-            self.messages['privmsg'][sender] = []
-            self.messages['privmsg'][sender].append({"role": "system", "content": self.prompt[0] + self.default_personality + self.prompt[1]})
 
         if sender != self.nickname:
-            asyncio.run_coroutine_threadsafe(self.handle_privmsg(connection, sender, message), self.loop)
+            self.schedule(self.handle_privmsg(connection, sender, message))
 
     def on_pubmsg(self, connection, event):
         """
@@ -122,12 +512,15 @@ class InfiniGPT(SingleServerIRCBot):
             connection (IRCConnection): IRC connection instance.
             event (IRCEvent): Event details from the server.
         """
-        channel = event.target
+        text = event.arguments[0]
+        # Most channel traffic isn't for the bot, drop it before splitting or handing it to the event loop
+        if not text.startswith(self.prefixes):
+            return
         sender = event.source.nick
-        message = event.arguments[0].split(" ")
-
-        if sender != self.nickname:
-            asyncio.run_coroutine_threadsafe(self.handle_message(connection, channel, sender, message), self.loop)
+        command = text.split(" ", 1)[0]
+        if sender == self.nickname or (command not in self.commands and (command not in self.admin_commands or sender not in self.admins)):
+            return
+        self.schedule(self.handle_message(connection, event.target, sender, text.split(" ")))
 
     def on_invite(self, connection, event):
         """
@@ -139,37 +532,35 @@ class InfiniGPT(SingleServerIRCBot):
         """
         channel = event.arguments[0]
         sender = event.source.nick
-        self.log(f"Invited to {channel} by {sender}")
-        asyncio.run_coroutine_threadsafe(self.join_channels(connection, [channel]), self.loop)
+        self.log("Invited to %s by %s", channel, sender)
+        self.schedule(self.join_channels(connection, [channel]))
+
+    def line_budget(self, target=None):
+        """
+        Work out how many bytes of text fit in one message to a target.
+
+        Args:
+            target (str, optional): Channel or nickname, the longest likely one if not given.
+
+        Returns:
+            int: Bytes of UTF-8 text per line.
+        """
+        return line_budget(self.nickname, target, self.hostmask)
 
-    def chop(self, message):
+    def chop(self, message, target=None):
         """
-        Break a message into lines of at most 420 characters, preserving whitespace.
+        Break a message into lines that the server will relay without cutting them off.
 
         Args:
             message (str): The message to be chopped.
+            target (str, optional): Channel or nickname the lines are for.
 
         Returns:
-            list: Lines of the message within the 420-character limit.
-        """
-        lines = message.splitlines()
-        newlines = []  
-
-        for line in lines:
-            if len(line) > 420:
-                wrapped_lines = textwrap.wrap(
-                    line,
-                    width=420,
-                    drop_whitespace=False,
-                    replace_whitespace=False,
-                    fix_sentence_endings=True,
-                    break_long_words=False)
-                newlines.extend(wrapped_lines) 
-            else:
-                newlines.append(line) 
-        return newlines
+            list: Lines of the message within the target's byte limit.
+        """
+        return LineSplitter(self.line_budget(target)).split(message)
 
-    async def respond(self, channel, sender, messages, sender2=False, tools=None):
+    async def respond(self, channel, sender, messages, sender2=False, tools=None, on_line=None, cache=False, target=None):
         """
         Generate a response using the configured LLM.
 
@@ -177,203 +568,388 @@ class InfiniGPT(SingleServerIRCBot):
             sender (str): Nickname of the sender.
             messages (list): Message history to provide as context.
             sender2 (str, optional): Alternative sender name for response tagging.
+            on_line (coroutine function, optional): Called with each line of the response
+                as soon as it is complete.  Lines are streamed when streaming is enabled.
+            cache (bool, optional): Answer identical requests from the completion cache.
+            target (str, optional): Channel or nickname the response is sent to, to fit its lines.
 
         Returns:
-            tuple: The name for response attribution and a list of response lines.
-        """
-        if self.model in self.models["openai"]:
-            bearer = self.openai_key
-            self.url = "https://api.openai.com/v1"
-        elif self.model in self.models["xai"]:
-            bearer = self.xai_key
-            self.url = "https://api.x.ai/v1"
-        elif self.model in self.models["google"]:
-            bearer = self.google_key
-            self.url = "https://generativelanguage.googleapis.com/v1beta/openai"
-        elif self.model in self.models["ollama"]:
-            bearer = "hello_friend"
-            self.url = f"http://{self.ollama_url}/v1"
-        elif self.model in self.models["mistral"]:
-            bearer = self.mistral_key
-            self.url = "https://api.mistral.ai/v1"
-
-        headers = {
-            "Authorization": f"Bearer {bearer}",
-            "Content-Type": "application/json"
-        }
+            tuple: The name for response attribution and a list of response lines,
+                empty if the request was turned away.
+        """
+        name = sender2 if sender2 else sender
+        try:
+            return name, await self.generate(channel, sender, messages, name, tools, on_line, cache, target=target)
+        except Overloaded:
+            self.log("Too many requests queued, dropped request from %s in %s", name, channel)
+            if name:
+                self.sender.send(name, "I'm busy right now, please try again in a moment.", PRIORITY_COMMAND, command="notice")
+            return name, []
+        except CompletionError as e:
+            self.log("No completion for %s in %s: %s", name, channel, e)
+            if on_line is not None:
+                await on_line("Sorry, my reply was cut off, please try again." if e.partial else "Sorry, I can't reach any model right now, please try again later.")
+            return name, []
+
+    async def generate(self, channel, sender, messages, name, tools=None, on_line=None, cache=False, model=None, target=None):
+        """
+        Run the completion requests for a response, including any tool calls.
+
+        Args:
+            channel (str): Channel the conversation belongs to.
+            sender (str): Nickname whose history is used.
+            messages (list): Message history to provide as context.
+            name (str): Nickname the response is for.
+            tools (list, optional): Tool definitions to offer the model.
+            on_line (coroutine function, optional): Called with each line of the response.
+            cache (bool, optional): Answer identical requests from the completion cache.
+            model (str, optional): Model to ask first, instead of the one chosen for the user.
+            target (str, optional): Channel or nickname the response is sent to, to fit its lines.
+
+        Returns:
+            list: The lines of the response.
+
+        Raises:
+            Overloaded: The provider's queue is full.
+            CompletionError: No model in the fallback chain could answer.
+        """
+        models = self.resilience.chain(model or self.model_for(channel, name), self.model_index)
         data = {
-            "model": self.model,
             "messages": messages,
             "tools": tools
         }
 
-        if self.model not in self.models["google"]:
-            data.update(self.options)
-        
-        name = sender2 if sender2 else sender
-        url = f"{self.url}/chat/completions"
+        requests = 0
+        stream = self.stream and on_line is not None
+        if stream:
+            data["stream"] = True
+        budget = self.line_budget(target)
+        buffer = LineSplitter(budget)
+        started = False
+
+        async def emit(lines):
+            nonlocal started
+            for line in lines:
+                if started or line.strip():
+                    started = True
+                    await on_line(line)
+
+        async def on_text(text):
+            await emit(buffer.feed(text))
+
+        async def attempt(model, provider):
+            nonlocal requests, buffer
+            requests += 1
+            headers = {
+                "Authorization": f"Bearer {provider.key}",
+                "Content-Type": "application/json"
+            }
+            body = dict(data, model=model)
+            if provider.use_options:
+                body.update(self.options)
+            native = provider.name == "ollama" and self.ollama is not None
+            async with self.admission.limiter(provider.name).slot(shed=requests == 1), \
+                    (self.ollama.slot(model) if native else nullcontext(provider.url)) as base_url:
+                if native:
+                    url = f"{base_url}/api/chat"
+                    body = ollama.chat_request(body, self.ollama.keep_alive)
+                else:
+                    url = f"{base_url}/chat/completions"
+                client = self.clients.get(base_url)
+                start = time.monotonic()
+                try:
+                    if stream:
+                        buffer = LineSplitter(budget)
+                    # Opened as a stream either way, so the first byte is timed when the headers arrive
+                    async with client.stream("POST", url, headers=headers, json=body) as response:
+                        self.llm_first_byte.observe(time.monotonic() - start, provider.name, model)
+                        if response.status_code != 200:
+                            await response.aread()
+                            raise ProviderError.from_response(response)
+                        if stream:
+                            result = await (ollama.read_stream if native else read_stream)(response, on_text, self.reasoning_log.opens(model))
+                        else:
+                            await response.aread()
+                            result = ollama.chat_completion(response.json()) if native else response.json()
+                            if result.get('choices'):
+                                result['choices'][0]['message'] = separate(result['choices'][0]['message'])
+                    if stream:
+                        await emit(buffer.flush())
+                    if not result.get('choices'):
+                        raise ProviderError(f"no choices in response: {str(result)[:200]}")
+                except (ProviderError, httpx.TransportError, ValueError):
+                    self.llm_errors.inc(provider.name)
+                    raise
+                self.llm_latency.observe(time.monotonic() - start, provider.name, model)
+            usage = result.get('usage') or {}
+            if usage.get('prompt_tokens'):
+                self.llm_tokens.inc(provider.name, model, "in", amount=usage['prompt_tokens'])
+            if usage.get('completion_tokens'):
+                self.llm_tokens.inc(provider.name, model, "out", amount=usage['completion_tokens'])
+            reasoning_tokens = (usage.get('completion_tokens_details') or {}).get('reasoning_tokens')
+            if reasoning_tokens:
+                self.llm_tokens.inc(provider.name, model, "reasoning", amount=reasoning_tokens)
+            reasoning = result['choices'][0]['message'].pop('reasoning_content', None)
+            if reasoning:
+                self.reasoning_log.write(model, f"{self.scope(channel)}/{name}", reasoning)
+            return result
 
         async def get_completion(data):
-            async with httpx.AsyncClient(timeout=httpx.Timeout(120.0)) as client:
-                response = await client.post(
-                    url,
-                    headers=headers,
-                    json=data
-                )
-                return response.json()
+            nonlocal models
+            model, result = await self.resilience.run(models, self.model_index, attempt, can_retry=lambda: not started)
+            models = models[models.index(model):]
+            return result
+
+        if cache:
+            cached_model = models[0]
+            provider = self.model_index[cached_model]
+            key = self.completions.key(cached_model, self.options if provider.use_options else {}, messages, tools)
+            lines = await self.completions.get(key)
+            if lines is not None:
+                # Cached for another target, whose lines may be longer
+                lines = self.chop("\n".join(lines), target)
+                if on_line is not None:
+                    await emit(lines)
+                return lines
 
         if tools is not None:
             result = await get_completion(data)
             max_iterations = 10
             iterations = 0
+            conversation = self.conversations.open(self.scope(channel), sender)
             while result['choices'][0]['message'].get('tool_calls', []) and iterations < max_iterations:
                 msg = result['choices'][0]['message']
-                self.messages[channel][sender].append(msg)
-                tool_calls = msg.get('tool_calls', [])
-                for tool_call in tool_calls:
-                    tool_name = tool_call['function']['name']
-                    args = json.loads(tool_call['function']['arguments'])
-                    self.log(f"Calling tool: {tool_name} with args: {args}")
-                    try:
-                        tool_result = await globals()[tool_name](**args)
-                    except Exception as e:
-                        self.log(f"Error calling tool {tool_name}: {e}")
-                        tool_result = f"Error calling tool {tool_name}: {e}"
-                    self.messages[channel][sender].append({
-                        "role": "tool",
-                        "tool_call_id": tool_call['id'],
-                        "content": tool_result
-                    })
-                data["messages"] = self.messages[channel][sender]
+                self.conversations.append(conversation, msg, *await self.toolbox.run(msg.get('tool_calls', [])))
+                data["messages"] = await self.packer.pack(conversation, models[0])
                 result = await get_completion(data)
                 iterations += 1
 
             if iterations >= max_iterations:
-                self.log(f"WARNING: Tool calls reached maximum iterations ({max_iterations}) for {sender} in {channel}. Response may be incomplete.")
+                self.log("WARNING: Tool calls reached maximum iterations (%s) for %s in %s. Response may be incomplete.", max_iterations, sender, channel)
 
             iterations = 0
             while result['choices'][0]['message'].get('content') in [None, '', '\n'] and iterations < max_iterations:
-                data["messages"] = self.messages[channel][sender]
+                data["messages"] = await self.packer.pack(conversation, models[0])
                 result = await get_completion(data)
                 iterations += 1
 
             if iterations >= max_iterations:
-                self.log(f"WARNING: Empty content handling reached maximum iterations ({max_iterations}) for {sender} in {channel}. Response may be incomplete.")
+                self.log("WARNING: Empty content handling reached maximum iterations (%s) for %s in %s. Response may be incomplete.", max_iterations, sender, channel)
 
             text = result['choices'][0]['message']['content'] or ''
-            lines = self.chop(text.strip())
-            return name, lines
-
-        result = await get_completion(data)
-        lines = self.chop(result['choices'][0]['message']['content'])
-        return name, lines
+            lines = self.chop(text.strip(), target)
+        else:
+            result = await get_completion(data)
+            lines = self.chop((result['choices'][0]['message']['content'] or '').strip(), target)
+
+        if on_line is not None and not stream:
+            await emit(lines)
+        # An answer from a fallback model isn't stored under the chosen model's key
+        if cache and models[0] == cached_model:
+            self.completions.set(key, lines)
+        return lines
     
-    async def thinking(self, lines):
+    async def context(self, channel, sender, name=None):
         """
-        Handles separation of thinking process from responses of reasoning models like DeepSeek-R1.
+        Build the messages for a request from a conversation, within the answering model's budget.
 
         Args:
-        lines (list): A list of lines of an LLM response.
+            channel (str): Channel the conversation belongs to.
+            sender (str): Nickname whose history is used.
+            name (str, optional): Nickname the response is for, whose model answers.  Defaults to sender.
 
+        Returns:
+            list: Messages to send.
         """
-        try:
-            thinking = ' '.join(lines[lines.index('<think>'):lines.index('</think>')+1])
-        except:
-            thinking = None
+        conversation = self.conversations.get(self.scope(channel), sender)
+        return await self.packer.pack(conversation, self.model_for(channel, name or sender))
+
+    async def summarize(self, model, messages):
+        """
+        Ask a model for a summary of older turns.
+
+        Summaries aren't put in the completion cache, which is saved to storage,
+        since they hold the conversation.  The context packer keeps each one
+        with its conversation instead.
+
+        Args:
+            model (str): Model writing the summary.
+            messages (list): The summary request.
+
+        Returns:
+            str: The summary.
+        """
+        lines = await self.generate("", None, messages, None, model=model)
+        return ' '.join(lines).strip()
+
+    def line_sender(self, connection, target, name=None):
+        """
+        Build a callback that sends response lines to a target as they become available.
+
+        Args:
+            connection (IRCConnection): IRC connection instance.
+            target (str): Channel or nickname to send the lines to.
+            name (str, optional): Nickname to address before the first line.
 
-        if thinking != None:
-            self.log(f"Thinking: {thinking}")
-            lines = lines[lines.index('</think>')+2:]
+        Returns:
+            coroutine function: Queues a single line.
+        """
+        header = [f"{name}:"] if name else []
+
+        async def send(line):
+            while header:
+                self.sender.send(target, header.pop())
+            self.sender.send(target, line)
+        return send
+
+    def model_for(self, channel, sender):
+        """
+        Pick the model for a request: the user's choice, then the channel's, then the global model.
 
-        joined_lines = ' '.join(lines)
+        Args:
+            channel (str): Channel name, or "privmsg".
+            sender (str): Nickname of the user.
 
-        return lines, joined_lines
+        Returns:
+            str: The model name.
+        """
+        model = self.user_models.get((channel, sender)) or self.channel_models.get(channel)
+        return model if model in self.model_index else self.model
 
-    async def change_model(self, connection, channel=None, model=None, sender=None):
+    async def change_model(self, connection, channel=None, model=None, sender=None, scope="global"):
         """
-        Change the active LLM model.
+        Change the LLM model for everyone, for a channel, or for one user in a channel.
 
         Args:
             connection (IRCConnection): IRC connection instance.
-            channel (str, optional): Channel to send feedback messages to.
-            model (str, optional): Desired model to switch to.
-        """
-        if model != None:
-            for provider, models in self.models.items():
-                if model in models:
-                    self.model = model
-                    self.log(f"Model set to {self.model}")
-                    if channel != None:
-                        connection.privmsg(channel if channel != "privmsg" else sender, f"Model set to {self.model}")
-                    return
-            if channel != None:
-                connection.privmsg(channel if channel != "privmsg" else sender, f"Model {model} not found in available models.")
-        else:
+            channel (str, optional): Channel the change applies to and feedback is sent to.
+            model (str, optional): Desired model to switch to, "default" removes a channel or user choice.
+            sender (str, optional): Nickname of the user changing the model.
+            scope (str, optional): "global", "channel" or "user".  A private message has no channel, so "channel" changes the global model there.
+        """
+        target = channel if channel != "privmsg" else sender
+        if scope == "channel" and channel == "privmsg":
+            scope = "global"
+        if model == None:
             if channel != None:
                 current_model = [
-                    f"Current model: {self.model}",
-                    "Available models: " + ", ".join(
-                        [model for provider, models in self.models.items() for model in models]
-                    )
+                    f"Current model: {self.model_for(channel, sender)} (global: {self.model})",
+                    "Available models: " + ", ".join(self.model_index)
                 ]
-                lines = self.chop('\n'.join(current_model))
+                lines = self.chop('\n'.join(current_model), target)
                 for line in lines:
-                    connection.privmsg(channel if channel != "privmsg" else sender, line)        
+                    self.sender.send(target, line, PRIORITY_COMMAND)
+            return
+        if model not in self.model_index and not (model == "default" and scope != "global"):
+            if channel != None:
+                self.sender.send(target, f"Model {model} not found in available models.", PRIORITY_COMMAND)
+            return
 
-    async def join_channels(self, connection, channels):
+        if scope == "user":
+            if model == "default":
+                self.user_models.pop((channel, sender), None)
+            else:
+                self.user_models[(channel, sender)] = model
+            feedback = f"Model for {sender} set to {self.model_for(channel, sender)}"
+        elif scope == "channel":
+            if model == "default":
+                self.channel_models.pop(channel, None)
+            else:
+                self.channel_models[channel] = model
+            feedback = f"Model for {channel} set to {self.channel_models.get(channel, self.model)}"
+        else:
+            self.model = model
+            feedback = f"Model set to {self.model}"
+
+        self.log(feedback)
+        if self.storage is not None:
+            self.storage.set_setting(self.scope("model"), self.model)
+            self.storage.set_setting(self.scope("channel_models"), self.channel_models)
+            self.storage.set_setting(self.scope("user_models"), [[c, s, m] for (c, s), m in self.user_models.items()])
+        if channel != None:
+            self.sender.send(target, feedback, PRIORITY_COMMAND)
+
+    @staticmethod
+    def join_batches(channels, size=10, length=400):
+        """
+        Group channels into comma separated JOIN targets.
+
+        Args:
+            channels (list): Channel names.
+            size (int, optional): Most channels in one JOIN.
+            length (int, optional): Longest target list in bytes.
+
+        Returns:
+            list: Comma separated channel lists.
+        """
+        batches, batch = [], []
+        for channel in channels:
+            if batch and (len(batch) == size or len(",".join(batch + [channel]).encode()) > length):
+                batches.append(",".join(batch))
+                batch = []
+            batch.append(channel)
+        if batch:
+            batches.append(",".join(batch))
+        return batches
+
+    async def join_channels(self, connection, channels, on_joined=None):
         """
         Join a list of channels, or do nothing if none were provided.
 
+        All channels are joined straight away, a few per JOIN command.  One
+        introduction is generated and queued for every channel that wants it,
+        and the send scheduler takes turns between the channels.
+
         Args:
             connection (IRCConnection): IRC connection instance.
-            channels (list): The channels to join
+            channels (list): The channels to join, as names or {"name": ..., "intro": false} entries.
+            on_joined (callable, optional): Called once the JOIN commands are sent.
         """
         if channels == None:
             return None
-        channels = [channel for channel in channels if channel.startswith("#")]
-        if channels != []:
+        entries = [channel if isinstance(channel, dict) else {"name": channel} for channel in channels]
+        entries = [entry for entry in entries if entry["name"].startswith("#")]
+        if entries != []:
+            for batch in self.join_batches([entry["name"] for entry in entries]):
+                self.log("Joining channels: %s", batch)
+                connection.join(batch)
+            if on_joined is not None:
+                on_joined()
+
+            greet = [entry["name"] for entry in entries if entry.get("intro", True)]
+            if greet == []:
+                return
             name, lines = await self.respond("",
                 sender=None, 
                 messages=[
                     {"role": "system", "content": self.system_prompt}, 
-                    {"role": "user", "content": "introduce yourself"}])
+                    {"role": "user", "content": "introduce yourself"}],
+                cache=True)
             lines.append(f"Type .help {self.nickname} to learn how to use me.")
-            lines, joined_lines = await self.thinking(lines)
-            for channel in channels:
-                self.log(f"Joining channel: {channel}")
-                connection.join(channel)
-                
-                self.log(f"Sending response to {channel}: '{joined_lines}'")
-                for line in lines:
-                    connection.privmsg(channel, line)
-                    await asyncio.sleep(1.5)  
+            joined_lines = ' '.join(lines)
+            self.log("Sending response to %s: '%s'", ', '.join(greet), joined_lines)
+            for line in lines:
+                for channel in greet:
+                    self.sender.send(channel, line, PRIORITY_REPLY)
 
-    async def add_history(self, role, channel, sender, message, default=True):
+    async def add_history(self, role, channel, sender, message):
         """
         Add a message to the conversation history.
 
         Args:
-            role (str): Role of the message sender ("system", "user", "assistant").
+            role (str): Role of the message sender ("user", "assistant").
             channel (str): Channel where the message occurred.
             sender (str): Nickname of the message sender.
             message (str): Content of the message.
-            default (bool, optional): Whether to add the default system prompt.
-        """
-        if channel not in self.messages:
-            self.messages[channel] = {}
-        if sender not in self.messages[channel]:
-            self.messages[channel][sender] = []
-            if default:
-                self.messages[channel][sender].append({"role": "system", "content": self.prompt[0] + self.default_personality + self.prompt[1]})
-        self.messages[channel][sender].append({"role": role, "content": message})
-
-        if len(self.messages[channel][sender]) > self.history_size:
-            if self.messages[channel][sender][0]["role"] == "system":
-                self.messages[channel][sender].pop(1)
-            else:
-                self.messages[channel][sender].pop(0)
-
-            self.messages[channel][sender] = [m for m in self.messages[channel][sender] if not ((m['role'] == "tool") or ('tool_calls' in m))]
+        """
+        system_prompt = self.prompt[0] + self.default_personality + self.prompt[1]
+        conversation = await self.conversations.fetch(self.scope(channel), sender) or self.conversations.open(self.scope(channel), sender, system_prompt)
+        self.conversations.append(conversation, {"role": role, "content": message})
+        model = self.model_for(channel, sender)
+        if model in self.history_tokens:
+            self.conversations.trim(conversation, max_tokens=self.history_tokens[model])
+        else:
+            self.conversations.trim(conversation, self.history_size)
 
     async def ai(self, connection, channel, sender, message, x=False):
         """
@@ -386,30 +962,55 @@ class InfiniGPT(SingleServerIRCBot):
             message (list): Parsed user message as a list of words.
             x (bool, optional): Whether the message is directed to another user.
         """
-        if x and message[2]:
+        if x:
+            if len(message) < 3:
+                return
             target = message[1]
             message = ' '.join(message[2:])
-            if target in self.messages[channel]:
-                await self.add_history("user", channel, target, message)
-                name, lines = await self.respond(channel, target, self.messages[channel][target], sender2=sender, tools=self.tools)
-                lines, joined_lines = await self.thinking(lines)
-                await self.add_history("assistant", channel, target, joined_lines)
-            else:
-                pass
+            if await self.conversations.fetch(self.scope(channel), target) is None:
+                return
         else:
+            target = sender
             message = ' '.join(message[1:])
-            await self.add_history("user", channel, sender, message)
-            name, lines = await self.respond(channel, sender, self.messages[channel][sender], tools=self.tools)
-            lines, joined_lines = await self.thinking(lines)
-            await self.add_history("assistant", channel, name, joined_lines)
-
-        self.log(f"Sending response to {name} in {channel}: '{joined_lines}'")
-        connection.privmsg(channel, f"{name}:")
-        await asyncio.sleep(1.5)
-        for line in lines:
-            connection.privmsg(channel, line)
-            await asyncio.sleep(1.5)
-    
+        await self.converse(connection, channel, target, sender, message)
+
+    async def converse(self, connection, channel, target, sender, message):
+        """
+        Add a message to a conversation and answer it, together with any other messages for it that arrive meanwhile.
+
+        Only one turn runs on a conversation at a time.  Messages that arrive
+        while a turn waits for its window or for the previous turn join it,
+        and are answered by one completion addressed to everyone who spoke.
+        When several people spoke, each message is marked with its sender.
+
+        Args:
+            connection (IRCConnection): IRC connection instance.
+            channel (str): Channel where the message was sent, or "privmsg".
+            target (str): Nickname whose history the message goes into.
+            sender (str): Nickname of the sender.
+            message (str): The message.
+        """
+        key = (self.scope(channel), target)
+        batch = self.turns.join(key, sender, message)
+        if batch is None:
+            return
+        async with self.turns.run(key, batch):
+            senders = list(dict.fromkeys(nick for nick, text in batch))
+            for nick, text in batch:
+                await self.add_history("user", channel, target, text if len(senders) == 1 else f"{nick}: {text}")
+            if channel != "privmsg":
+                send = self.line_sender(connection, channel, name=", ".join(senders))
+            else:
+                send = self.line_sender(connection, target)
+            sender2 = sender if sender != target else False
+            name, lines = await self.respond(channel, target, await self.context(channel, target, sender), sender2=sender2, tools=self.tools, on_line=send,
+                                             target=channel if channel != "privmsg" else target)
+            if not lines:
+                return
+            joined_lines = ' '.join(lines)
+            await self.add_history("assistant", channel, target, joined_lines)
+            self.log("Sent response to %s in %s: '%s'", ", ".join(senders), channel, joined_lines)
+
     async def set_prompt(self, connection, channel, sender, persona=None, custom=None, respond=True):
         """
         Set a custom or predefined system prompt.
@@ -422,30 +1023,30 @@ class InfiniGPT(SingleServerIRCBot):
             custom (str, optional): Custom text for the system prompt.
             respond (bool, optional): Whether to introduce the bot after setting.
         """
-        if channel in self.messages:
-            if sender in self.messages[channel]:
-                self.messages[channel][sender].clear()
         if persona != None:
             system_prompt = self.prompt[0] + persona + self.prompt[1]
         elif custom != None:
             system_prompt = custom
         
-        await self.add_history("system", channel, sender, system_prompt, default=False)
-        self.log(f"System prompt for {sender} set to '{system_prompt}'")
-        
-        if respond:
-            await self.add_history("user", channel, sender, "introduce yourself")
-            name, lines = await self.respond(channel, sender, self.messages[channel][sender], tools=self.tools)
-            lines, joined_lines = await self.thinking(lines)
-            await self.add_history("assistant", channel, name, joined_lines)
-            self.log(f"Sending response to {name} in {channel}: '{joined_lines}'")
-            if channel != "privmsg":
-                connection.privmsg(channel, f"{name}:")
-                await asyncio.sleep(1.5)
-            for line in lines:
-                connection.privmsg(channel if channel != "privmsg" else sender, line)
-                await asyncio.sleep(1.5)
-            
+        async with self.turns.lock((self.scope(channel), sender)):
+            self.conversations.reset(self.scope(channel), sender, system_prompt)
+            self.log("System prompt for %s set to '%s'", sender, system_prompt)
+
+            if respond:
+                await self.add_history("user", channel, sender, "introduce yourself")
+                if channel != "privmsg":
+                    target = channel
+                    send = self.line_sender(connection, channel, name=sender)
+                else:
+                    target = sender
+                    send = self.line_sender(connection, sender)
+                name, lines = await self.respond(channel, sender, await self.context(channel, sender), tools=self.tools, on_line=send, cache=True, target=target)
+                if not lines:
+                    return
+                joined_lines = ' '.join(lines)
+                await self.add_history("assistant", channel, name, joined_lines)
+                self.log("Sent response to %s in %s: '%s'", name, channel, joined_lines)
+
     async def reset(self, connection, channel, sender, stock=False):
         """
         Reset the bot's conversation history for a user.
@@ -456,18 +1057,17 @@ class InfiniGPT(SingleServerIRCBot):
             sender (str): Nickname of the user to reset.
             stock (bool, optional): Whether to apply stock settings.
         """
-        if channel in self.messages:
-            if sender in self.messages[channel]:
-                self.messages[channel][sender].clear()
+        system_prompt = self.prompt[0] + self.default_personality + self.prompt[1] if not stock else None
+        async with self.turns.lock((self.scope(channel), sender)):
+            self.conversations.reset(self.scope(channel), sender, system_prompt)
         if not stock:
-            await self.set_prompt(connection, channel, sender, persona=self.default_personality, respond=False)
-            connection.privmsg(channel if channel != "privmsg" else sender, f"{self.nickname} reset to default for {sender}")
-            self.log(f"{self.nickname} reset to default for {sender}")
+            self.sender.send(channel if channel != "privmsg" else sender, f"{self.nickname} reset to default for {sender}", PRIORITY_COMMAND)
+            self.log("%s reset to default for %s", self.nickname, sender)
         else:
-            connection.privmsg(channel if channel != "privmsg" else sender, f"Stock settings applied for {sender}")
-            self.log(f"Stock settings applied for {sender}")
+            self.sender.send(channel if channel != "privmsg" else sender, f"Stock settings applied for {sender}", PRIORITY_COMMAND)
+            self.log("Stock settings applied for %s", sender)
     
-    async def help_menu(self, connection, message, sender):
+    async def help_menu(self, connection, message, sender, private=False):
         """
         Display a help menu to the user.
 
@@ -475,14 +1075,13 @@ class InfiniGPT(SingleServerIRCBot):
             connection (IRCConnection): IRC connection instance.
             message (list): Parsed user message as a list of words.
             sender (str): Nickname of the user requesting help.
+            private (bool, optional): Asked in a private message, where the bot's name isn't needed.
         """
-        if message[1]:
-            if message[1] == self.nickname:
-                with open("help.txt", "r") as f:
-                    help_text = f.readlines()
-                for line in help_text:
-                    connection.notice(sender, line.strip())
-                    await asyncio.sleep(1.5)
+        if private or (len(message) > 1 and message[1] == self.nickname):
+            with open("help.txt", "r") as f:
+                help_text = f.readlines()
+            for line in help_text:
+                self.sender.send(sender, line.strip(), PRIORITY_COMMAND, command="notice")
 
     async def part(self, connection, channel):
         """
@@ -497,15 +1096,55 @@ class InfiniGPT(SingleServerIRCBot):
                 sender=None, 
                 messages=[
                     {"role": "system", "content": self.system_prompt}, 
-                    {"role": "user", "content": "say goodbye in a few words"}])
-            lines, joined_lines = await self.thinking(lines)
-            self.log(f"Sending response to {channel}: '{joined_lines}'")
-            for line in lines:
-                connection.privmsg(channel, line)
-                await asyncio.sleep(1.5)
+                    {"role": "user", "content": "say goodbye in a few words"}],
+                cache=True,
+                target=channel)
+            joined_lines = ' '.join(lines)
+            self.log("Sending response to %s: '%s'", channel, joined_lines)
+            sent = [self.sender.send(channel, line, PRIORITY_REPLY) for line in lines]
+            if sent:
+                await asyncio.wait(sent)
             connection.part(channel, "https://github.com/h1ddenpr0cess20/infinigpt-irc")
-            self.messages[channel].clear()
-            self.log(f"Left {channel}")
+            self.conversations.drop_channel(self.scope(channel))
+            self.log("Left %s", channel)
+
+    async def stats(self, connection, channel, sender=None):
+        """
+        Report memory and queue statistics.
+
+        Args:
+            connection (IRCConnection): IRC connection instance.
+            channel (str): Channel to send the report to.
+            sender (str, optional): Nickname to send to when channel is "privmsg".
+        """
+        conversations = self.conversations.stats()
+        sends = self.sender.stats()
+        tool_cache = self.toolbox.cache.stats()
+        response_cache = self.completions.stats()
+        admission = self.admission.stats()
+        breakers = self.resilience.stats()
+        context = self.packer.stats()
+        turns = self.turns.stats()
+        report = [
+            (f"Ready after {self.ready_after:.2f}s | " if self.ready_after is not None else "") +
+            f"Conversations: {conversations['conversations']} ({conversations['bytes']} bytes, {conversations['evicted']} evicted) | "
+            f"Send queue: {sends['depth']} waiting, avg wait {sends['wait_avg']:.2f}s, max {sends['wait_max']:.2f}s | "
+            f"Tool cache: {tool_cache['hits']} hits, {tool_cache['misses']} misses | "
+            f"Response cache: {response_cache['hits']} hits, {response_cache['misses']} misses | "
+            f"Context: {context['packed']} packed, {context['summaries']} summaries, {context['reused']} reused | "
+            f"Turns: {turns['batches']} answered, {turns['merged']} merged, {turns['busy']} busy",
+            "Requests: " + " | ".join(
+                f"{provider} {breakers.get(provider, {}).get('state', 'closed')}, {s['inflight']} running, {s['waiting']} queued, {s['shed']} shed, avg wait {s['wait_avg']:.2f}s"
+                for provider, s in admission["providers"].items()
+            )
+        ]
+        if self.ollama is not None:
+            report.append("Ollama: " + " | ".join(
+                f"{url} {s['inflight']} running, {s['waiting']} queued, {s['switches']} model switches, loaded: {', '.join(s['loaded']) or 'none'}"
+                for url, s in self.ollama.stats().items()
+            ))
+        for line in report:
+            self.sender.send(channel if channel != "privmsg" else sender, line, PRIORITY_COMMAND)
 
     async def gpersona(self, persona):
         """
@@ -517,7 +1156,9 @@ class InfiniGPT(SingleServerIRCBot):
         if persona != None:
             self.default_personality = persona
             self.system_prompt = self.prompt[0] + self.default_personality + self.prompt[1]
-            self.log(f"Default personality set to {self.default_personality}")
+            self.log("Default personality set to %s", self.default_personality)
+            if self.storage is not None:
+                self.storage.set_setting(self.scope("personality"), persona)
 
     async def handle_message(self, connection, channel, sender, message):
         """
@@ -529,33 +1170,14 @@ class InfiniGPT(SingleServerIRCBot):
             sender (str): Nickname of the message sender.
             message (list): Parsed user message as a list of words.
         """
-        user_commands = {
-            ".ai": lambda: self.ai(connection, channel, sender, message),
-            f"{self.nickname}:": lambda: self.ai(connection, channel, sender, message),
-            f"{self.nickname},": lambda: self.ai(connection, channel, sender, message),
-            ".x": lambda: self.ai(connection, channel, sender, message, x=True),
-            ".persona": lambda: self.set_prompt(connection, channel, sender, persona=' '.join(message[1:])),
-            ".custom": lambda: self.set_prompt(connection, channel, sender, custom=' '.join(message[1:])),
-            ".reset": lambda: self.reset(connection, channel, sender),
-            ".stock": lambda: self.reset(connection, channel, sender, stock=True),
-            ".help": lambda: self.help_menu(connection, message, sender)
-        }
-        admin_commands = {
-            ".model": lambda: self.change_model(connection, channel, model=message[1] if len(message) > 1 else None),
-            ".join": lambda: self.join_channels(connection, [message[1]] if len(message) > 1 else None),
-            ".part": lambda: self.part(connection, message[1] if len(message) > 1 else channel),
-            ".gpersona": lambda: self.gpersona(" ".join(message[1:]) if len(message) > 1 else None)
-        }
-
         command = message[0]
-        if command in user_commands:
-            self.log(f"Received message from {sender} in {channel}: '{' '.join(message)}'")
-            action = user_commands[command]
-            await action()
-        if sender in self.admins and command in admin_commands:
-            self.log(f"Received message from {sender} in {channel}: '{' '.join(message)}'")
-            action = admin_commands[command]
-            await action()
+        action = self.commands.get(command)
+        if action is None and sender in self.admins:
+            action = self.admin_commands.get(command)
+        if action is not None:
+            if logging.getLogger(__name__).isEnabledFor(logging.INFO):
+                self.log("Received message from %s in %s: '%s'", sender, channel, ' '.join(message))
+            await action(connection, channel, sender, message)
 
     async def handle_privmsg(self, connection, sender, message):
         """
@@ -566,47 +1188,92 @@ class InfiniGPT(SingleServerIRCBot):
             sender (str): Nickname of the message sender.
             message (list): Parsed user message as a list of words.
         """
-        user_commands = {
-            ".persona": lambda: self.set_prompt(connection, "privmsg", sender, persona=' '.join(message[1:])),
-            ".custom": lambda: self.set_prompt(connection, "privmsg", sender, custom=' '.join(message[1:])),
-            ".reset": lambda: self.reset(connection, "privmsg", sender),
-            ".stock": lambda: self.reset(connection, "privmsg", sender, stock=True),
-            ".help": lambda: self.help_menu(connection, sender)
-        }
-        admin_commands = {
-            ".model": lambda: self.change_model(connection, "privmsg", model=message[1] if len(message) > 1 else None, sender=sender),
-            ".join": lambda: self.join_channels(connection, [message[1]] if len(message) > 1 else None),
-            ".part": lambda: self.part(connection, message[1] if len(message) > 1 else None),
-            ".gpersona": lambda: self.gpersona(" ".join(message[1:]) if len(message) > 1 else None)
-        }
-
         command = message[0]
-        if command in user_commands:
-            self.log(f"Received private message from {sender}: '{' '.join(message)}'")
-            action = user_commands[command]
-            await action()
-        elif sender in self.admins and command in admin_commands:
-            self.log(f"Received private message from {sender}: '{' '.join(message)}'")
-            action = admin_commands[command]
-            await action()
+        action = self.private_commands.get(command)
+        if action is None and sender in self.admins:
+            action = self.private_admin_commands.get(command)
+        if action is not None:
+            if logging.getLogger(__name__).isEnabledFor(logging.INFO):
+                self.log("Received private message from %s: '%s'", sender, ' '.join(message))
+            await action(connection, sender, message)
         else:
-            await self.add_history("user", "privmsg", sender, ' '.join(message))
-            self.log(f"Received private message from {sender}: '{' '.join(message)}'")
-            name, lines = await self.respond("", sender, self.messages["privmsg"][sender], tools=self.tools)
-            lines, joined_lines = await self.thinking(lines)
-            await self.add_history("assistant", "privmsg", sender, joined_lines)
-            self.log(f"Sending response to {sender}: '{joined_lines}'")
-            for line in lines:
-                connection.privmsg(sender, line)
-                await asyncio.sleep(1.5)
+            text = ' '.join(message)
+            self.log("Received private message from %s: '%s'", sender, text)
+            await self.converse(connection, "privmsg", sender, sender, text)
     
     async def main(self):
         """
         Initializes and runs the InfiniGPT bot.
         """
         self.loop = asyncio.get_running_loop()
-        await asyncio.to_thread(self.start)
+        self.started = time.monotonic()
+        self.identified = asyncio.Event()
+        self.sender.start()
+        if self.storage is not None:
+            settings = await self.storage.load_settings()
+            model = settings.get(self.scope("model"))
+            if model in self.model_index:
+                self.default_model = model
+            elif model is not None:
+                self.log("Saved model %s is no longer configured, using %s", model, self.default_model)
+            self.default_personality = settings.get(self.scope("personality"), self.default_personality)
+            self.channel_models = settings.get(self.scope("channel_models"), {})
+            self.user_models = {(channel, sender): model for channel, sender, model in settings.get(self.scope("user_models"), [])}
+        if self.transport == "asyncio":
+            self.reactor.loop = self.loop
+            try:
+                await self.connect_async()
+            except OSError as e:
+                self.log("Could not connect to %s: %s", self.server, e)
+                self.recon.run(self)
+            await self.loop.create_future()
+        else:
+            reactor = concurrent.futures.Future()
+            threading.Thread(target=self.serve, args=(reactor,), name=f"irc-{self.network or self.server}", daemon=True).start()
+            await asyncio.wrap_future(reactor)
+
+    def serve(self, reactor):
+        """
+        Run the IRC reactor with the thread transport.
+
+        Each network gets a thread of its own rather than a worker of the
+        default executor, which the reactor would hold for as long as the bot
+        runs, leaving none for storage and tools once there are a few networks.
+
+        Args:
+            reactor (concurrent.futures.Future): Completed when the reactor stops.
+        """
+        try:
+            reactor.set_result(self.start())
+        except BaseException as e:
+            reactor.set_exception(e)
+
+async def run():
+    """
+    Serve every configured network from one process and one event loop.
+    """
+    services = Services.from_files()
+    bots = [InfiniGPT(services, irc) for irc in services.networks]
+
+    def reload(config, schema):
+        previous = services.reload(config, schema)
+        networks = {irc.get("name"): irc for irc in services.networks}
+        for bot in bots:
+            if bot.network in networks:
+                bot.reload(networks[bot.network], previous)
+            else:
+                logging.getLogger(__name__).info("Network %s was removed, it is left after a restart", bot.network)
+        if set(networks) - {bot.network for bot in bots}:
+            logging.getLogger(__name__).info("New networks are joined after a restart")
+
+    watcher = ConfigWatcher(reload, **services.config.get("reload", {}))
+    services.start()
+    watcher.start()
+    try:
+        await asyncio.gather(*(bot.main() for bot in bots))
+    finally:
+        await watcher.close()
+        await services.close()
 
 if __name__ == "__main__":
-    bot = InfiniGPT()
-    asyncio.run(bot.main())
\ No newline at end of file
+    asyncio.run(run())
\ No newline at end of file
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+class Overloaded(Exception):
+    """
+    Raised when a provider already has as many requests waiting as it is allowed to queue.
+    """
+
+class ProviderLimiter:
+    """
+    Caps the requests in flight to one provider and how many may wait for a slot.
+
+    Attributes:
+        max_inflight (int): Requests allowed to run at once.
+        max_queue (int): Requests allowed to wait for a slot before new ones are shed.
+        inflight (int): Requests currently running.
+        waiting (int): Requests currently waiting for a slot.
+        admitted (int): Requests that got a slot.
+        shed (int): Requests turned away because the queue was full.
+        wait_total (float): Total seconds admitted requests spent waiting.
+        wait_max (float): Longest wait for a slot.
+    """
+    def __init__(self, max_inflight=8, max_queue=32):
+        """
+        Args:
+            max_inflight (int, optional): Requests allowed to run at once.
+            max_queue (int, optional): Requests allowed to wait for a slot.
+        """
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_inflight)
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @asynccontextmanager
+    async def slot(self, shed=True):
+        """
+        Hold one of the provider's slots for the duration of a request.
+
+        Args:
+            shed (bool, optional): Raise Overloaded instead of waiting when the queue is full.
+                Follow-up requests of a reply that is already running pass False.
+
+        Raises:
+            Overloaded: The queue is full and shed is True.
+        """
+        if shed and self.semaphore.locked() and self.waiting >= self.max_queue:
+            self.shed += 1
+            raise Overloaded()
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self.semaphore.release()
+
+    def stats(self):
+        """
+        Report load and queue wait counters.
+
+        Returns:
+            dict: In flight, waiting, admitted and shed requests, and average and maximum wait in seconds.
+        """
+        return {
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_avg": self.wait_total / self.admitted if self.admitted else 0.0,
+            "wait_max": self.wait_max
+        }
+
+class Admission:
+    """
+    Admission control for LLM requests.
+
+    Each provider gets its own ProviderLimiter.  Messages a user sends while
+    their previous one is being answered are not admitted separately, the
+    TurnCoalescer holds them and answers them together once the reply is done.
+
+    Attributes:
+        limits (dict): Provider name -> limiter settings, with "default" for the rest.
+        limiters (dict): Provider name -> ProviderLimiter.
+    """
+    def __init__(self, limits=None):
+        """
+        Args:
+            limits (dict, optional): Provider name -> {"max_inflight", "max_queue"}, "default" applies to the rest.
+        """
+        self.limits = limits or {}
+        self.limiters = {}
+
+    def limiter(self, provider):
+        """
+        Get the limiter for a provider.
+
+        Args:
+            provider (str): Provider name.
+
+        Returns:
+            ProviderLimiter: The provider's limiter.
+        """
+        limiter = self.limiters.get(provider)
+        if limiter is None:
+            limiter = self.limiters[provider] = ProviderLimiter(**self.limits.get(provider, self.limits.get("default", {})))
+        return limiter
+
+    def stats(self):
+        """
+        Report per-provider load and wait counters.
+
+        Returns:
+            dict: "providers", provider name -> limiter stats.
+        """
+        return {
+            "providers": {provider: limiter.stats() for provider, limiter in self.limiters.items()}
+        }
@@ -0,0 +1,195 @@
+import re
+import unicodedata
+
+# A message from the server, prefix and CRLF included, can't be longer than this
+IRC_LINE_BYTES = 512
+# Worst case lengths used until the bot has seen its own hostmask or the target is known
+USER_BYTES = 10
+HOST_BYTES = 63
+TARGET_BYTES = 50
+# ":" before the prefix, " PRIVMSG " and " :" around the target, CRLF at the end
+FRAMING_BYTES = 14
+
+WORD = re.compile(r"\s*\S+")
+# The last word of a text, empty if it ends with a space
+LAST_WORD = re.compile(r"\S*$")
+
+def line_budget(nickname, target=None, hostmask=None):
+    """
+    Work out how many bytes of text fit in one message to a target.
+
+    The server relays ":nick!user@host PRIVMSG target :text" followed by
+    CRLF to everyone in the target, and cuts off anything past 512 bytes,
+    so the prefix and target are subtracted from the limit.
+
+    Args:
+        nickname (str): The bot's nickname.
+        target (str, optional): Channel or nickname the text is sent to, the longest likely one if not given.
+        hostmask (str, optional): The bot's nick!user@host as seen by the server, if known.
+
+    Returns:
+        int: Bytes of UTF-8 text that fit in one message.
+    """
+    if hostmask:
+        prefix = len(hostmask.encode())
+    else:
+        prefix = len(nickname.encode()) + 1 + USER_BYTES + 1 + HOST_BYTES
+    target_bytes = len(target.encode()) if target else TARGET_BYTES
+    return IRC_LINE_BYTES - FRAMING_BYTES - prefix - target_bytes
+
+def joins_previous(text, index):
+    """
+    Check whether the character at index belongs to the same grapheme as the one before it.
+
+    Covers combining marks, variation selectors, emoji modifiers and zero
+    width joiner sequences, which are the ways a cut in the middle of a
+    character shows up on screen.
+
+    Args:
+        text (str): The text.
+        index (int): Index of the character, greater than 0.
+
+    Returns:
+        bool: True if the text shouldn't be cut before this character.
+    """
+    char = text[index]
+    return (
+        unicodedata.category(char) in ("Mn", "Mc", "Me")
+        or char in "\u200d\ufe0e\ufe0f"
+        or "\U0001f3fb" <= char <= "\U0001f3ff"
+        or text[index - 1] == "\u200d"
+    )
+
+class LineSplitter:
+    """
+    Splits text into IRC lines that fit a byte budget, all at once or as it streams in.
+
+    Lines are broken at newlines and then between words.  A word too long
+    for a line is cut at the last character boundary that fits, moved back
+    so accents and emoji sequences are never split.  Every character is
+    looked at a constant number of times, so splitting is linear in the
+    length of the text, and most lines are returned as they are without
+    being copied.
+
+    Attributes:
+        budget (int): Most bytes of UTF-8 text on one line.
+        pending (str): Streamed text that doesn't end a line yet.
+    """
+    def __init__(self, budget):
+        """
+        Args:
+            budget (int): Most bytes of UTF-8 text on one line.
+        """
+        self.budget = budget
+        self.pending = ""
+
+    def split(self, text):
+        """
+        Split a complete text into lines.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            list: Lines within the budget.
+        """
+        lines = []
+        for line in text.splitlines():
+            lines.extend(self.wrap(line))
+        return lines
+
+    def feed(self, text):
+        """
+        Add streamed text and return the lines it completed.
+
+        Args:
+            text (str): The next piece of the text.
+
+        Returns:
+            list: Complete lines, possibly empty.
+        """
+        self.pending += text
+        lines = []
+        if "\n" in text:
+            *finished, self.pending = self.pending.split("\n")
+            for line in finished:
+                lines.extend(self.wrap(line.rstrip("\r")))
+        # Four bytes per character at most, so shorter text can't be over the budget
+        if len(self.pending) * 4 > self.budget and len(self.pending.encode()) > self.budget:
+            # The last word may still be growing, so it is left for later unless it is too long for any line
+            start = LAST_WORD.search(self.pending).start()
+            done, word = self.pending[:start], self.pending[start:]
+            if len(word.encode()) > self.budget:
+                done, word = self.pending, ""
+            wrapped = self.wrap(done.rstrip())
+            lines.extend(wrapped[:-1])
+            self.pending = wrapped[-1] + done[len(done.rstrip()):] + word
+        return lines
+
+    def flush(self):
+        """
+        Return whatever is left once the stream has ended.
+
+        Returns:
+            list: The remaining lines.
+        """
+        lines = self.wrap(self.pending) if self.pending else []
+        self.pending = ""
+        return lines
+
+    def wrap(self, line):
+        """
+        Break one line of text into pieces within the budget.
+
+        Args:
+            line (str): Text without newlines.
+
+        Returns:
+            list: The pieces, at least one.
+        """
+        budget = self.budget
+        if len(line) * 4 <= budget or len(line.encode()) <= budget:
+            return [line]
+        pieces = []
+        current = []
+        size = 0
+        for match in WORD.finditer(line):
+            word = match.group()
+            length = len(word.encode())
+            if size + length <= budget:
+                current.append(word)
+                size += length
+                continue
+            if current:
+                pieces.append("".join(current))
+                # The space the line was broken at isn't carried to the next line
+                word = word.lstrip()
+                length = len(word.encode())
+            while length > budget:
+                head, word = self.cut(word)
+                pieces.append(head)
+                length -= len(head.encode())
+            current = [word]
+            size = length
+        if current:
+            pieces.append("".join(current))
+        return pieces or [""]
+
+    def cut(self, word):
+        """
+        Cut the longest start off a word that fits the budget, between graphemes.
+
+        Args:
+            word (str): A word longer than the budget.
+
+        Returns:
+            tuple: The start that fits and the rest of the word.
+        """
+        # A character is at least one byte, so the first budget characters hold the cut
+        index = len(word[:self.budget].encode()[:self.budget].decode(errors="ignore"))
+        end = index
+        while end > 1 and joins_previous(word, end):
+            end -= 1
+        if end <= 1:
+            end = max(index, 1)
+        return word[:end], word[end:]
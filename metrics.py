@@ -0,0 +1,319 @@
+import asyncio
+import bisect
+import logging
+
+# Latency buckets in seconds, from a fast cache hit to a slow completion
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def label_text(names, values):
+    """
+    Format a label set the way Prometheus expects it.
+
+    Args:
+        names (tuple): Label names.
+        values (tuple): Label values, in the same order.
+
+    Returns:
+        str: {name="value",...}, or an empty string without labels.
+    """
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+class Counter:
+    """
+    A value that only goes up, kept per label set.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): Description shown by the exporter.
+        labels (tuple): Label names.
+        values (dict): Label values -> count.
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        """
+        Add to the counter.
+
+        Args:
+            *labels (str): Label values, in the order of the label names.
+            amount (float, optional): How much to add.
+        """
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        """
+        List the current values.
+
+        Returns:
+            list: (name, label text, value) for each series.
+        """
+        return [(self.name, label_text(self.labels, labels), value) for labels, value in self.values.items()]
+
+class Gauge:
+    """
+    A value read from a callback whenever metrics are collected.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): Description shown by the exporter.
+        labels (tuple): Label names.
+        read (callable): Returns a number, or a dict of label values -> number.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, read, labels=()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = tuple(labels)
+
+    def samples(self):
+        """
+        List the current values.
+
+        Returns:
+            list: (name, label text, value) for each series.
+        """
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, label_text(self.labels, labels), value) for labels, value in values.items()]
+
+class Histogram:
+    """
+    Distribution of observed values in fixed buckets, kept per label set.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): Description shown by the exporter.
+        labels (tuple): Label names.
+        buckets (tuple): Upper bounds of the buckets.
+        series (dict): Label values -> [bucket counts, sum, count].
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, *labels):
+        """
+        Record one value.
+
+        Args:
+            value (float): The observed value.
+            *labels (str): Label values, in the order of the label names.
+        """
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        """
+        List cumulative bucket counts, sum and count for each series.
+
+        Returns:
+            list: (name, label text, value) for each sample.
+        """
+        samples = []
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                samples.append((f"{self.name}_bucket", label_text(self.labels + ("le",), labels + (bound,)), cumulative))
+            samples.append((f"{self.name}_bucket", label_text(self.labels + ("le",), labels + ("+Inf",)), count))
+            samples.append((f"{self.name}_sum", label_text(self.labels, labels), total))
+            samples.append((f"{self.name}_count", label_text(self.labels, labels), count))
+        return samples
+
+    def quantile(self, q, *labels):
+        """
+        Estimate a quantile from the buckets.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+            *labels (str): Label values of the series.
+
+        Returns:
+            float: Upper bound of the bucket holding the quantile, None without observations.
+        """
+        series = self.series.get(labels)
+        if not series or not series[2]:
+            return None
+        rank = q * series[2]
+        cumulative = 0
+        for bound, bucket in zip(self.buckets, series[0]):
+            cumulative += bucket
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """
+    Registry of the bot's metrics, with an optional Prometheus endpoint and a periodic log dump.
+
+    Recording a value is a dictionary update, cheap enough for every message
+    and request.  Gauges are read from the components' own counters only when
+    metrics are collected.
+
+    Attributes:
+        metrics (dict): Metric name -> Counter, Gauge or Histogram.
+        host (str): Address the HTTP endpoint listens on.
+        port (int): Port of the HTTP endpoint, None to disable it.
+        dump_interval (float): Seconds between stats dumps to the log, 0 to disable them.
+        server (asyncio.Server): The running HTTP endpoint, or None.
+    """
+    def __init__(self, host="127.0.0.1", port=None, dump_interval=0):
+        """
+        Args:
+            host (str, optional): Address the HTTP endpoint listens on.
+            port (int, optional): Port of the HTTP endpoint, None to disable it.
+            dump_interval (float, optional): Seconds between stats dumps to the log.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.metrics = {}
+        self.host = host
+        self.port = port
+        self.dump_interval = dump_interval
+        self.server = None
+        self.tasks = []
+
+    def register(self, metric):
+        """
+        Add a metric, or return the one already registered under its name.
+
+        Args:
+            metric (Counter, Gauge or Histogram): The metric.
+
+        Returns:
+            The registered metric.
+        """
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        """
+        Get or create a counter.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        """
+        Get or create a histogram.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read, labels=()):
+        """
+        Get or create a gauge read from a callback.
+
+        Returns:
+            Gauge: The gauge.
+        """
+        return self.register(Gauge(name, help, read, labels))
+
+    def render(self):
+        """
+        Collect every metric in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def start(self):
+        """
+        Start the HTTP endpoint and the stats dump, if configured, on the running event loop.
+        """
+        if self.port:
+            self.tasks.append(asyncio.create_task(self.serve()))
+        if self.dump_interval:
+            self.tasks.append(asyncio.create_task(self.dump()))
+
+    async def serve(self):
+        """
+        Serve the metrics over HTTP until cancelled.
+        """
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.log("Serving metrics on http://%s:%s/metrics", self.host, self.port)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """
+        Answer one HTTP request with the current metrics.
+
+        Args:
+            reader (asyncio.StreamReader): Request stream.
+            writer (asyncio.StreamWriter): Response stream.
+        """
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            if request.split(b" ")[:2] in ([b"GET", b"/metrics"], [b"GET", b"/"]):
+                status, body = "200 OK", self.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def dump(self):
+        """
+        Log a summary of every metric periodically until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.dump_interval)
+            for metric in self.metrics.values():
+                if isinstance(metric, Histogram):
+                    for labels, (counts, total, count) in metric.series.items():
+                        self.log("%s%s count=%d avg=%.3f p50=%s p99=%s", metric.name, label_text(metric.labels, labels),
+                                 count, total / count if count else 0.0, metric.quantile(0.5, *labels), metric.quantile(0.99, *labels))
+                else:
+                    for name, labels, value in metric.samples():
+                        self.log("%s%s %s", name, labels, value)
+
+    async def close(self):
+        """
+        Stop the endpoint and the stats dump.
+        """
+        for task in self.tasks:
+            task.cancel()
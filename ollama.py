@@ -0,0 +1,500 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import httpx
+
+from reasoning import ReasoningFilter
+from resilience import ProviderError
+
+# Request fields that are part of the chat request itself, everything else is a model option
+REQUEST_FIELDS = {"model", "messages", "tools", "stream"}
+
+def tagged(model):
+    """
+    Args:
+        model (str): Model name as configured, eg llama3.2
+
+    Returns:
+        str: The name with its tag, eg llama3.2:latest, the way /api/ps reports it.
+    """
+    return model if ":" in model.rsplit("/", 1)[-1] else f"{model}:latest"
+
+def chat_messages(messages):
+    """
+    Convert OpenAI style messages to the ones Ollama's /api/chat takes.
+
+    Only tool calls differ: Ollama takes their arguments as an object
+    instead of a JSON string, and tool results by the tool's name instead of
+    the call's id.  Other messages are passed on as they are.
+
+    Args:
+        messages (list): Chat messages in the OpenAI format.
+
+    Returns:
+        list: The messages for Ollama.
+    """
+    converted = []
+    names = {}
+    for message in messages:
+        if message.get("tool_calls"):
+            calls = []
+            for call in message["tool_calls"]:
+                function = call.get("function") or {}
+                arguments = function.get("arguments") or {}
+                if isinstance(arguments, str):
+                    try:
+                        arguments = json.loads(arguments)
+                    except ValueError:
+                        arguments = {}
+                names[call.get("id")] = function.get("name")
+                calls.append({"function": {"name": function.get("name"), "arguments": arguments}})
+            message = {"role": message["role"], "content": message.get("content") or "", "tool_calls": calls}
+        elif message.get("role") == "tool":
+            message = {"role": "tool", "content": message.get("content") or "", "tool_name": names.get(message.get("tool_call_id"))}
+        converted.append(message)
+    return converted
+
+def chat_request(body, keep_alive=None):
+    """
+    Build an /api/chat request from an OpenAI style chat completion request.
+
+    Args:
+        body (dict): The chat completion request, sampling options at the top level.
+        keep_alive (str or int, optional): How long Ollama keeps the model loaded afterwards.
+
+    Returns:
+        dict: The /api/chat request, sampling options moved into "options".
+    """
+    request = {"model": body["model"], "messages": chat_messages(body["messages"]), "stream": bool(body.get("stream"))}
+    if body.get("tools"):
+        request["tools"] = body["tools"]
+    options = {key: value for key, value in body.items() if key not in REQUEST_FIELDS}
+    if options:
+        request["options"] = options
+    if keep_alive is not None:
+        request["keep_alive"] = keep_alive
+    return request
+
+def tool_call(call):
+    """
+    Args:
+        call (dict): A tool call from Ollama.
+
+    Returns:
+        dict: The tool call in the OpenAI format, with a new id.
+    """
+    function = call.get("function") or {}
+    return {
+        "id": call.get("id") or f"call_{secrets.token_hex(6)}",
+        "type": "function",
+        "function": {"name": function.get("name", ""), "arguments": json.dumps(function.get("arguments") or {})}
+    }
+
+def usage(chunk):
+    """
+    Args:
+        chunk (dict): The final /api/chat response or stream chunk.
+
+    Returns:
+        dict: Token counts in the OpenAI format.
+    """
+    return {"prompt_tokens": chunk.get("prompt_eval_count"), "completion_tokens": chunk.get("eval_count")}
+
+def chat_completion(response):
+    """
+    Convert a complete /api/chat response to the shape of an OpenAI chat completion.
+
+    Args:
+        response (dict): The response from Ollama.
+
+    Returns:
+        dict: The completion, with "choices" and "usage".  Reasoning in <think>
+            blocks is left in the content, for reasoning.separate to take out.
+    """
+    if response.get("error"):
+        raise ProviderError(response["error"])
+    reply = response.get("message") or {}
+    message = {"role": "assistant", "content": reply.get("content") or None}
+    if reply.get("thinking"):
+        message["reasoning_content"] = reply["thinking"]
+    if reply.get("tool_calls"):
+        message["tool_calls"] = [tool_call(call) for call in reply["tool_calls"]]
+    return {"choices": [{"message": message, "finish_reason": response.get("done_reason")}], "usage": usage(response)}
+
+async def read_stream(response, on_text, opened=False):
+    """
+    Read a streamed /api/chat response, one JSON object per line.
+
+    Works like streaming.read_stream: content is passed to on_text as it
+    arrives, reasoning is kept out of it, and the return value has the shape
+    of a regular completion.
+
+    Args:
+        response (httpx.Response): An open streaming response.
+        on_text (coroutine function): Called with each piece of content.
+        opened (bool, optional): Whether the chat template opens the reasoning block, see ReasoningFilter.
+
+    Returns:
+        dict: The assembled completion, with "choices" and "usage".
+
+    Raises:
+        ProviderError: Ollama reported an error partway through.
+    """
+    content = []
+    tool_calls = []
+    final = {}
+    reasoning = ReasoningFilter(opened=opened)
+
+    async for line in response.aiter_lines():
+        if not line.strip():
+            continue
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            raise ProviderError(chunk["error"])
+        message = chunk.get("message") or {}
+        if message.get("thinking"):
+            reasoning.reason(message["thinking"])
+        if message.get("content"):
+            text = reasoning.feed(message["content"])
+            if text:
+                content.append(text)
+                await on_text(text)
+        for call in message.get("tool_calls") or []:
+            tool_calls.append(tool_call(call))
+        if chunk.get("done"):
+            final = chunk
+            break
+
+    text = reasoning.flush()
+    if text:
+        content.append(text)
+        await on_text(text)
+
+    message = {"role": "assistant", "content": "".join(content) or None}
+    if reasoning.text():
+        message["reasoning_content"] = reasoning.text()
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return {"choices": [{"message": message, "finish_reason": final.get("done_reason")}], "usage": usage(final)}
+
+class OllamaHost:
+    """
+    One Ollama server, the requests running on it and the models it has loaded.
+
+    Requests that have to wait are queued by model.  When a slot frees up it
+    goes to a request for a model that is already running or loaded, so the
+    server doesn't unload and reload models as requests for different models
+    alternate.  A request that has waited longer than max_wait is served
+    next whatever its model, so no model waits forever.
+
+    Attributes:
+        url (str): Base URL of the server, eg http://localhost:11434
+        parallel (int): Requests the server is sent at once.
+        max_wait (float): Seconds a request may be passed over for other models.
+        inflight (int): Requests running.
+        running (dict): Model name -> requests running.
+        queues (dict): Model name -> deque of (time queued, future) for waiting requests.
+        waiting (int): Requests waiting for a slot.
+        loaded (set): Models the server has in memory as far as we know, with their tags.
+        failed_until (float): Monotonic time until which the server is avoided after a failure.
+        served (int): Requests that got a slot.
+        switches (int): Slots given to a different model than the one before.
+        last_model (str): Model of the request that got the last slot.
+    """
+    def __init__(self, url, parallel=1, max_wait=10.0):
+        """
+        Args:
+            url (str): Base URL of the server.
+            parallel (int, optional): Requests the server is sent at once.
+            max_wait (float, optional): Seconds a request may be passed over for other models.
+        """
+        self.url = url
+        self.parallel = parallel
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.running = {}
+        self.queues = {}
+        self.waiting = 0
+        self.loaded = set()
+        self.failed_until = 0.0
+        self.served = 0
+        self.switches = 0
+        self.last_model = None
+
+    def load(self):
+        """
+        Returns:
+            float: Requests running and waiting per slot.
+        """
+        return (self.inflight + self.waiting) / self.parallel
+
+    def start(self, model):
+        """
+        Take a slot for a model.
+
+        Args:
+            model (str): The model the request is for.
+        """
+        self.inflight += 1
+        self.running[model] = self.running.get(model, 0) + 1
+        self.served += 1
+        if model != self.last_model:
+            self.switches += self.last_model is not None
+            self.last_model = model
+
+    def finish(self, model):
+        """
+        Give back a slot and pass it on to the next waiting request.
+
+        Args:
+            model (str): The model the request was for.
+        """
+        self.inflight -= 1
+        self.running[model] -= 1
+        if not self.running[model]:
+            del self.running[model]
+        self.grant()
+
+    def grant(self):
+        """
+        Hand free slots to waiting requests, requests for the model that just ran or other loaded models first.
+        """
+        while self.inflight < self.parallel and self.queues:
+            now = time.monotonic()
+            oldest = min(self.queues, key=lambda model: self.queues[model][0][0])
+            if now - self.queues[oldest][0][0] > self.max_wait:
+                model = oldest
+            elif self.last_model in self.queues:
+                model = self.last_model
+            else:
+                model = next((model for model in self.queues if model in self.running or tagged(model) in self.loaded), oldest)
+            queue = self.queues[model]
+            future = queue.popleft()[1]
+            if not queue:
+                del self.queues[model]
+            self.waiting -= 1
+            self.start(model)
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, model):
+        """
+        Hold one of the server's slots for the duration of a request.
+
+        Args:
+            model (str): The model the request is for.
+        """
+        if self.inflight < self.parallel and not self.queues:
+            self.start(model)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            entry = (time.monotonic(), future)
+            self.queues.setdefault(model, deque()).append(entry)
+            self.waiting += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as the request was cancelled
+                    self.finish(model)
+                else:
+                    self.queues[model].remove(entry)
+                    if not self.queues[model]:
+                        del self.queues[model]
+                    self.waiting -= 1
+                raise
+        try:
+            yield
+        finally:
+            self.finish(model)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Requests running and waiting, loaded models, requests served and model switches.
+        """
+        return {
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "loaded": sorted(self.loaded),
+            "served": self.served,
+            "switches": self.switches
+        }
+
+class OllamaPool:
+    """
+    Native backend for local models served by one or more Ollama servers.
+
+    Requests go to Ollama's own /api/chat instead of its OpenAI compatible
+    endpoint, so every request can tell Ollama how long to keep the model
+    loaded ("keep_alive"), and the model that answers by default can be
+    loaded at startup instead of on the first message.  Each request is
+    sent to the least loaded server, preferring servers that already have
+    the model loaded as long as they have a free slot.  Which models each
+    server has loaded is checked every "refresh" seconds with /api/ps.  A
+    server that fails is avoided for "retry_after" seconds, so a retry goes
+    to another one.
+
+    Attributes:
+        hosts (list): OllamaHost for each server.
+        models (list): Models served by Ollama.
+        keep_alive (str or int): How long Ollama keeps a model loaded after a request, None for its default.
+        preload (bool): Whether to load the default model at startup.
+        refresh (float): Seconds between checks of the loaded models, 0 to not check.
+        retry_after (float): Seconds a failed server is avoided.
+        clients (ClientPool): Shared HTTP clients.
+        task (asyncio.Task): The loop checking loaded models while it is running.
+    """
+    def __init__(self, hosts=None, keep_alive="30m", parallel=1, max_wait=10.0, preload=True, refresh=30.0, retry_after=30.0, models=None, clients=None):
+        """
+        Args:
+            hosts (list, optional): host:port or URL of each server.
+            keep_alive (str or int, optional): How long Ollama keeps a model loaded after a request.
+            parallel (int, optional): Requests each server is sent at once.
+            max_wait (float, optional): Seconds a request may be passed over for requests for another model.
+            preload (bool, optional): Load the default model at startup.
+            refresh (float, optional): Seconds between checks of the loaded models.
+            retry_after (float, optional): Seconds a failed server is avoided.
+            models (list, optional): Models served by Ollama.
+            clients (ClientPool, optional): Shared HTTP clients.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.hosts = [OllamaHost(host if "://" in host else f"http://{host}", parallel, max_wait) for host in hosts or ["localhost:11434"]]
+        self.models = models or []
+        self.keep_alive = keep_alive
+        self.preload = preload
+        self.refresh = refresh
+        self.retry_after = retry_after
+        self.clients = clients
+        self.task = None
+
+    @classmethod
+    def from_config(cls, llm, clients):
+        """
+        Build the backend from the "llm" section of config.json.
+
+        Args:
+            llm (dict): LLM settings, with the servers in the "ollama" block or else "ollama_url".
+            clients (ClientPool): Shared HTTP clients.
+
+        Returns:
+            OllamaPool: The backend, or None if no Ollama models are configured.
+        """
+        models = llm["models"].get("ollama")
+        if not models:
+            return None
+        settings = dict(llm.get("ollama") or {})
+        settings.setdefault("hosts", [llm["ollama_url"]])
+        return cls(models=models, clients=clients, **settings)
+
+    def pick(self, model):
+        """
+        Choose the server for a request.
+
+        Args:
+            model (str): The model the request is for.
+
+        Returns:
+            OllamaHost: A working server with a free slot that has the model loaded,
+                or else the least loaded one.
+        """
+        now = time.monotonic()
+        hosts = [host for host in self.hosts if host.failed_until <= now] or self.hosts
+        loaded = tagged(model)
+        return min(hosts, key=lambda host: (host.load() >= 1, loaded not in host.loaded and model not in host.running, host.load()))
+
+    @asynccontextmanager
+    async def slot(self, model):
+        """
+        Wait for a server to take a request.
+
+        Args:
+            model (str): The model the request is for.
+
+        Yields:
+            str: Base URL of the server to send the request to.
+        """
+        host = self.pick(model)
+        async with host.slot(model):
+            try:
+                yield host.url
+            except (ProviderError, httpx.TransportError) as e:
+                if getattr(e, "retry", True):
+                    host.failed_until = time.monotonic() + self.retry_after
+                raise
+            host.failed_until = 0.0
+            host.loaded.add(tagged(model))
+
+    def start(self, default_model=None):
+        """
+        Start checking loaded models and load the default one, on the running event loop.
+
+        Args:
+            default_model (str, optional): The model answering by default, loaded now if Ollama serves it.
+        """
+        loop = asyncio.get_running_loop()
+        if self.refresh:
+            self.task = loop.create_task(self.watch())
+        self.warm(default_model)
+
+    def warm(self, model):
+        """
+        Load a model in the background, if preloading is on and Ollama serves it.
+
+        Args:
+            model (str): The model to load.
+        """
+        if self.preload and model in self.models:
+            asyncio.get_running_loop().create_task(self.load(model))
+
+    async def load(self, model):
+        """
+        Load a model on the server that would answer it, without generating anything.
+
+        Args:
+            model (str): The model to load.
+        """
+        start = time.monotonic()
+        try:
+            async with self.slot(model) as url:
+                response = await self.clients.get(url).post(f"{url}/api/chat", json=chat_request({"model": model, "messages": []}, self.keep_alive))
+                if response.status_code != 200:
+                    raise ProviderError.from_response(response)
+        except (ProviderError, httpx.TransportError) as e:
+            self.log("Could not load %s: %s", model, str(e) or type(e).__name__)
+            return
+        self.log("Loaded %s on %s in %.1f seconds", model, url, time.monotonic() - start)
+
+    async def watch(self):
+        """
+        Keep track of the models each server has loaded.
+        """
+        while True:
+            await asyncio.sleep(self.refresh)
+            for host in self.hosts:
+                try:
+                    response = await self.clients.get(host.url).get(f"{host.url}/api/ps")
+                    if response.status_code == 200:
+                        host.loaded = {tagged(entry.get("model") or entry.get("name")) for entry in response.json().get("models", [])}
+                except (httpx.TransportError, ValueError) as e:
+                    self.log("Could not check models loaded on %s: %s", host.url, str(e) or type(e).__name__)
+
+    def stop(self):
+        """
+        Stop checking loaded models.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self):
+        """
+        Returns:
+            dict: Server URL -> OllamaHost stats.
+        """
+        return {host.url: host.stats() for host in self.hosts}
@@ -0,0 +1,42 @@
+import logging
+from collections import namedtuple
+
+PROVIDER_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "xai": "https://api.x.ai/v1",
+    "google": "https://generativelanguage.googleapis.com/v1beta/openai",
+    "mistral": "https://api.mistral.ai/v1"
+}
+
+# Providers that reject the extra sampling options from config.json
+NO_OPTIONS = {"google"}
+
+Provider = namedtuple("Provider", ["name", "url", "key", "use_options"])
+
+def build_index(models, api_keys, ollama_url):
+    """
+    Map every configured model to the provider that serves it.
+
+    Built once from config.json, so finding where to send a request is a
+    single dictionary lookup.
+
+    Args:
+        models (dict): Provider name -> list of model names.
+        api_keys (dict): Provider name -> API key.
+        ollama_url (str): host:port of the Ollama server.
+
+    Returns:
+        dict: Model name -> Provider.
+    """
+    index = {}
+    for name, names in models.items():
+        if name == "ollama":
+            provider = Provider(name, f"http://{ollama_url}/v1", "hello_friend", True)
+        elif name in PROVIDER_URLS:
+            provider = Provider(name, PROVIDER_URLS[name], api_keys.get(name), name not in NO_OPTIONS)
+        else:
+            logging.getLogger(__name__).info("Skipping models for unknown provider %s", name)
+            continue
+        for model in names:
+            index.setdefault(model, provider)
+    return index
@@ -0,0 +1,209 @@
+import logging
+import os
+
+class ReasoningFilter:
+    """
+    Separates the reasoning of thinking models from their answer while the text streams in.
+
+    Reasoning models like DeepSeek-R1 wrap their thinking in <think> tags,
+    at the start of a line or in the middle of one.  Text is passed through
+    as soon as it is known to be outside a reasoning block.  Only a possible
+    start of a tag at the very end of a chunk is held back until the next
+    chunk shows whether it really is one, so the answer starts as soon as
+    the reasoning ends.  Reasoning that providers send in a separate field,
+    like "reasoning_content", is collected with the rest.
+
+    Some chat templates open the reasoning block in the prompt, so the model
+    only writes the closing tag.  For those models the filter starts inside
+    a block and holds the text back until the closing tag shows it was
+    reasoning.  If the response ends without one, or the model opens a block
+    itself, or the provider sends the reasoning separately, the held text
+    was the answer after all.
+
+    Attributes:
+        open_tag (str): Tag starting a reasoning block.
+        close_tag (str): Tag ending a reasoning block.
+        thinking (bool): Whether the text so far ends inside a reasoning block.
+        implicit (bool): Whether the response may still be inside a block the chat template opened.
+        checked (bool): Whether the start of the response was checked for an opening tag.
+        pending (str): Text held back because it may be the start of a tag.
+        held (list): Pieces of text in a block the chat template opened, before its closing tag.
+        reasoning (list): Pieces of reasoning, in order.
+    """
+    def __init__(self, open_tag="<think>", close_tag="</think>", opened=False):
+        """
+        Args:
+            open_tag (str, optional): Tag starting a reasoning block.
+            close_tag (str, optional): Tag ending a reasoning block.
+            opened (bool, optional): Whether the chat template opens the block, so the response starts inside it.
+        """
+        self.open_tag = open_tag
+        self.close_tag = close_tag
+        self.thinking = opened
+        self.implicit = opened
+        self.checked = not opened
+        self.pending = ""
+        self.held = []
+        self.reasoning = []
+
+    def feed(self, text):
+        """
+        Add the next piece of a response.
+
+        Args:
+            text (str): Streamed text.
+
+        Returns:
+            str: The part of the text that belongs to the answer, possibly empty.
+        """
+        text = self.pending + text
+        self.pending = ""
+        if not self.checked:
+            start = text.lstrip()
+            if self.open_tag.startswith(start):
+                self.pending = text
+                return ""
+            self.checked = True
+            if start.startswith(self.open_tag):
+                # The model opened the block itself
+                self.thinking = self.implicit = False
+        visible = []
+        while text:
+            tag = self.close_tag if self.thinking else self.open_tag
+            index = text.find(tag)
+            if index >= 0:
+                if self.implicit:
+                    self.reasoning.extend(self.held)
+                    self.held, self.implicit = [], False
+                (self.reasoning if self.thinking else visible).append(text[:index])
+                text = text[index + len(tag):]
+                self.thinking = not self.thinking
+                continue
+            # Hold back a trailing "<", "</th" and so on until the next piece arrives
+            start = text.rfind("<", max(0, len(text) - len(tag) + 1))
+            if start >= 0 and tag.startswith(text[start:]):
+                text, self.pending = text[:start], text[start:]
+            (self.held if self.implicit else self.reasoning if self.thinking else visible).append(text)
+            break
+        return "".join(visible)
+
+    def reason(self, text):
+        """
+        Add reasoning the provider sent apart from the answer.
+
+        Args:
+            text (str): A piece of reasoning.
+        """
+        if self.implicit and not self.held:
+            # The provider separates the reasoning, so the content is all answer
+            self.thinking = self.implicit = False
+        self.reasoning.append(text)
+
+    def flush(self):
+        """
+        End the response.  An unfinished reasoning block is kept out of the answer.
+
+        Returns:
+            str: Answer text that was held back, possibly empty.
+        """
+        text, self.pending = self.pending, ""
+        if self.implicit:
+            # No closing tag came, so nothing was reasoning
+            text, self.held = "".join(self.held) + text, []
+            self.thinking = self.implicit = False
+            return text
+        if self.thinking:
+            self.reasoning.append(text)
+            return ""
+        return text
+
+    def text(self):
+        """
+        Returns:
+            str: All reasoning collected so far.
+        """
+        return "".join(self.reasoning).strip()
+
+def separate(message):
+    """
+    Split a complete assistant message into its answer and reasoning.
+
+    Args:
+        message (dict): Assistant message from a completion.
+
+    Returns:
+        dict: A copy with reasoning removed from "content" and collected in
+            "reasoning_content", which is left out when there is none.
+    """
+    message = dict(message)
+    reasoning = ReasoningFilter()
+    for field in ("reasoning_content", "reasoning"):
+        if message.get(field):
+            reasoning.reason(message.pop(field))
+        message.pop(field, None)
+    content = message.get("content")
+    if content:
+        # Some chat templates open the block themselves, so only the closing tag shows up
+        if reasoning.close_tag in content and reasoning.open_tag not in content:
+            content = reasoning.open_tag + content
+        message["content"] = reasoning.feed(content) + reasoning.flush()
+    if reasoning.text():
+        message["reasoning_content"] = reasoning.text()
+    return message
+
+class ReasoningLog:
+    """
+    Where the reasoning of thinking models goes instead of IRC.
+
+    Attributes:
+        path (str): File the reasoning is appended to, None to write it to the main log.
+        opened_by_template (list): Lowercase parts of the names of models whose chat template opens the reasoning block.
+        write_line (callable): Logs one entry.
+    """
+    def __init__(self, path=None, opened_by_template=None):
+        """
+        Args:
+            path (str, optional): File to append reasoning to, None to use the main log.
+            opened_by_template (list, optional): Parts of model names, like "deepseek-r1", whose
+                chat template opens the reasoning block, so only its closing tag is streamed.
+        """
+        self.path = path
+        self.opened_by_template = [name.lower() for name in opened_by_template or []]
+        if path:
+            logger = logging.getLogger("reasoning")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            # A reload may point the log at another file
+            for handler in list(logger.handlers):
+                if handler.baseFilename != os.path.abspath(path):
+                    logger.removeHandler(handler)
+                    handler.close()
+            if not logger.handlers:
+                handler = logging.FileHandler(path, encoding="utf-8")
+                handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+                logger.addHandler(handler)
+            self.write_line = logger.info
+        else:
+            self.write_line = logging.getLogger(__name__).info
+
+    def opens(self, model):
+        """
+        Args:
+            model (str): Model name.
+
+        Returns:
+            bool: Whether the model's responses start inside a reasoning block.
+        """
+        model = model.lower()
+        return any(name in model for name in self.opened_by_template)
+
+    def write(self, model, target, text):
+        """
+        Record the reasoning behind one completion.
+
+        Args:
+            model (str): Model that reasoned.
+            target (str): Who the response is for, as "channel/nickname".
+            text (str): The reasoning.
+        """
+        self.write_line("Thinking of %s for %s: %s", model, target, text)
@@ -0,0 +1,310 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import signal
+import time
+
+from clients import ClientPool
+from completions import CompletionCache
+from context import ContextPacker
+from conversations import ConversationStore
+from limiter import ProviderLimiter
+from ollama import OllamaPool
+from providers import PROVIDER_URLS
+from reasoning import ReasoningLog
+from resilience import Resilience
+from toolrunner import ToolRuntime
+
+# Blocks of the "llm" section that are passed to a constructor as keyword arguments
+BLOCKS = {
+    "context": ContextPacker,
+    "conversations": ConversationStore,
+    "response_cache": CompletionCache,
+    "retry": Resilience,
+    "reasoning": ReasoningLog,
+    "tools": ToolRuntime,
+    "http": ClientPool,
+    "ollama": OllamaPool
+}
+
+class ConfigError(Exception):
+    """
+    Raised when config.json or schema.json can't be read or doesn't make sense.
+    """
+
+def keywords(cls):
+    """
+    Args:
+        cls (type): A class built from a config block.
+
+    Returns:
+        set: Names of the keyword arguments its constructor takes.
+    """
+    return set(inspect.signature(cls.__init__).parameters) - {"self"}
+
+def number(value):
+    """
+    Args:
+        value: A setting from config.json.
+
+    Returns:
+        bool: Whether the value is a number that isn't negative.
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+def validate(config, schema):
+    """
+    Check a configuration before anything is built from it.
+
+    Everything the bot and the services read from config.json by key is
+    checked, so a configuration that passes can be applied without errors.
+    Fallback and summary models missing from the model lists are only
+    logged, since they are skipped when the configuration is applied.
+
+    Args:
+        config (dict): Contents of config.json.
+        schema (list): Tool definitions from schema.json.
+
+    Raises:
+        ConfigError: Listing every problem found.
+    """
+    log = logging.getLogger(__name__).info
+    problems = []
+    llm = config.get("llm")
+    if not isinstance(llm, dict):
+        raise ConfigError('missing "llm" section')
+    models = llm.get("models")
+    if not isinstance(models, dict) or not all(isinstance(names, list) and all(isinstance(name, str) for name in names) for names in models.values()):
+        problems.append('"models" must map providers to lists of models')
+        models = {}
+    known = {model for provider, names in models.items() if provider in PROVIDER_URLS or provider == "ollama" for model in names}
+    if llm.get("default_model") not in known:
+        problems.append(f'default model {llm.get("default_model")} is not in "models"')
+    if not isinstance(llm.get("api_keys"), dict):
+        problems.append('"api_keys" must be an object')
+    if not isinstance(llm.get("personality"), str):
+        problems.append('"personality" must be a string')
+    prompt = llm.get("prompt")
+    if not (isinstance(prompt, list) and len(prompt) == 2 and all(isinstance(part, str) for part in prompt)):
+        problems.append('"prompt" must be a list of two strings')
+    if not isinstance(llm.get("options"), dict):
+        problems.append('"options" must be an object')
+    if not isinstance(llm.get("history_size"), int) or isinstance(llm.get("history_size"), bool) or llm["history_size"] < 1:
+        problems.append('"history_size" must be a positive number')
+    history_tokens = llm.get("history_tokens", {})
+    if not isinstance(history_tokens, dict) or not all(isinstance(tokens, int) and tokens > 0 for tokens in history_tokens.values()):
+        problems.append('"history_tokens" must map models to positive numbers')
+    if not isinstance(llm.get("ollama_url"), str):
+        problems.append('"ollama_url" must be a string')
+    if not isinstance(llm.get("stream", False), bool):
+        problems.append('"stream" must be true or false')
+    if not number(llm.get("coalesce_window", 0)):
+        problems.append('"coalesce_window" must be a number of seconds')
+    fallback = llm.get("fallback") or []
+    if not isinstance(fallback, list) or not all(isinstance(model, str) for model in fallback):
+        problems.append('"fallback" must be a list of models')
+    elif set(fallback) - known:
+        log("Fallback models %s are not in \"models\" and are skipped", ", ".join(sorted(set(fallback) - known)))
+    for name, cls in BLOCKS.items():
+        block = llm.get(name)
+        if block is None:
+            continue
+        if not isinstance(block, dict):
+            problems.append(f'"{name}" must be an object')
+        elif set(block) - keywords(cls):
+            problems.append(f'unknown settings in "{name}": {", ".join(sorted(set(block) - keywords(cls)))}')
+    context = llm.get("context")
+    if isinstance(context, dict) and context.get("summary_model") is not None:
+        if not isinstance(context["summary_model"], str):
+            problems.append('"summary_model" must be a model or null')
+        elif context["summary_model"] not in known:
+            log("Summary model %s is not in \"models\", older messages are dropped without a summary", context["summary_model"])
+    limits = llm.get("limits", {})
+    if not isinstance(limits, dict):
+        problems.append('"limits" must be an object')
+        limits = {}
+    for provider, settings in limits.items():
+        if not isinstance(settings, dict) or set(settings) - keywords(ProviderLimiter) or not all(
+                isinstance(value, int) and not isinstance(value, bool) and value > 0 for value in settings.values()):
+            problems.append(f'bad limits for {provider}')
+
+    irc = config.get("irc")
+    networks = irc if isinstance(irc, list) else [irc]
+    for network in networks:
+        if not isinstance(network, dict):
+            problems.append('"irc" must be an object or a list of them')
+            continue
+        label = network.get("name") or network.get("server")
+        missing = [key for key in ("server", "port", "nickname", "password", "channels", "admins") if key not in network]
+        if missing:
+            problems.append(f'network {label} is missing {", ".join(missing)}')
+            continue
+        if not isinstance(network["server"], str) or not isinstance(network["nickname"], str):
+            problems.append(f'server and nickname of {label} must be strings')
+        if not isinstance(network["port"], int):
+            problems.append(f'port of {label} must be a number')
+        if network["password"] is not None and not isinstance(network["password"], str):
+            problems.append(f'password of {label} must be a string or null')
+        if not isinstance(network["admins"], list):
+            problems.append(f'admins of {label} must be a list')
+        channels = network["channels"]
+        if not isinstance(channels, list) or not all(
+                isinstance(channel, str) or (isinstance(channel, dict) and isinstance(channel.get("name"), str)) for channel in channels):
+            problems.append(f'channels of {label} must be names or objects with a "name"')
+        flood = network.get("flood", {})
+        if not isinstance(flood, dict) or set(flood) - {"burst", "rate"} or not all(number(value) for value in flood.values()):
+            problems.append(f'"flood" of {label} must set "burst" and "rate" to numbers')
+        if not number(network.get("identify_timeout", 0)):
+            problems.append(f'"identify_timeout" of {label} must be a number of seconds')
+        if network.get("transport", "thread") not in ("thread", "asyncio"):
+            problems.append(f'"transport" of {label} must be "thread" or "asyncio"')
+
+    if not isinstance(schema, list) or not all(isinstance(entry, dict) and isinstance(entry.get("function"), dict) and entry["function"].get("name") for entry in schema):
+        problems.append("schema.json must be a list of tool definitions with function names")
+    if problems:
+        raise ConfigError("; ".join(problems))
+
+def load(config_path="config.json", schema_path="schema.json"):
+    """
+    Read and validate the configuration files.
+
+    Args:
+        config_path (str, optional): Location of config.json.
+        schema_path (str, optional): Location of schema.json.
+
+    Returns:
+        tuple: The configuration and the tool schema.
+
+    Raises:
+        ConfigError: A file can't be read, isn't valid JSON or fails validation.
+    """
+    try:
+        with open(config_path, "r") as f:
+            config = json.load(f)
+        with open(schema_path) as f:
+            schema = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(str(e)) from e
+    validate(config, schema)
+    return config, schema
+
+class ConfigWatcher:
+    """
+    Reloads config.json and schema.json while the bot runs.
+
+    A reload is started by SIGHUP, or by the files changing on disk, which
+    is noticed by comparing their modification times every few seconds.
+    The new files are read and validated first, and only a configuration
+    that passes is handed to apply, so a typo in config.json is logged
+    and the running configuration is kept.
+
+    Attributes:
+        config_path (str): Location of config.json.
+        schema_path (str): Location of schema.json.
+        apply (callable): Called with (config, schema) to switch to a new configuration.
+        interval (float): Seconds between checks of the files, 0 to only reload on SIGHUP.
+        stamp (tuple): Modification time and size of each file when last loaded.
+        task (asyncio.Task): The polling loop while it is running.
+        reloads (int): Configurations applied.
+        rejected (int): Configurations rejected by validation.
+        failed (int): Configurations that passed validation but failed to apply.
+    """
+    def __init__(self, apply, config_path="config.json", schema_path="schema.json", interval=2.0):
+        """
+        Args:
+            apply (callable): Called with (config, schema) to switch to a new configuration.
+            config_path (str, optional): Location of config.json.
+            schema_path (str, optional): Location of schema.json.
+            interval (float, optional): Seconds between checks of the files, 0 to only reload on SIGHUP.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.apply = apply
+        self.config_path = config_path
+        self.schema_path = schema_path
+        self.interval = interval
+        self.stamp = self.files()
+        self.task = None
+        self.reloads = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def files(self):
+        """
+        Returns:
+            tuple: (modification time, size) of each file, None for a file that can't be read.
+        """
+        stamp = []
+        for path in (self.config_path, self.schema_path):
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def start(self):
+        """
+        Listen for SIGHUP and start watching the files, on the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if hasattr(signal, "SIGHUP"):
+            try:
+                loop.add_signal_handler(signal.SIGHUP, self.reload)
+            except (NotImplementedError, RuntimeError):
+                self.log("SIGHUP can't be handled here, reload by editing the files instead")
+        if self.interval:
+            self.task = loop.create_task(self.poll())
+
+    async def poll(self):
+        """
+        Reload whenever the files change.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.files() != self.stamp:
+                self.reload()
+
+    def reload(self):
+        """
+        Read, validate and apply the configuration files.
+
+        Returns:
+            bool: Whether the new configuration was applied.
+        """
+        start = time.perf_counter()
+        self.stamp = self.files()
+        try:
+            config, schema = load(self.config_path, self.schema_path)
+        except ConfigError as e:
+            self.rejected += 1
+            self.log("Keeping the running configuration, %s is not valid: %s", self.config_path, e)
+            return False
+        try:
+            self.apply(config, schema)
+        except Exception as e:
+            # Logged here, or the polling task would end with nobody to see why
+            self.failed += 1
+            logging.getLogger(__name__).exception("Applying %s failed, it may be partly in effect: %s", self.config_path, e)
+            return False
+        self.reloads += 1
+        self.log("Reloaded configuration in %.1f ms", (time.perf_counter() - start) * 1000)
+        return True
+
+    async def close(self):
+        """
+        Stop watching the files.
+        """
+        if hasattr(signal, "SIGHUP"):
+            try:
+                asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+            except (NotImplementedError, RuntimeError):
+                pass
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
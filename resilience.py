@@ -0,0 +1,309 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+
+import httpx
+
+from limiter import Overloaded
+
+# Statuses worth repeating the same request for
+RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class CompletionError(Exception):
+    """
+    Raised when no model in the fallback chain produced a completion.
+
+    Attributes:
+        partial (bool): Part of the response had already been sent when it failed.
+    """
+    def __init__(self, message, partial=False):
+        super().__init__(message)
+        self.partial = partial
+
+class ProviderError(Exception):
+    """
+    A provider answered with an error instead of a completion.
+
+    Attributes:
+        retry (bool): Whether repeating the request may succeed.
+        retry_after (float): Seconds the provider asked us to wait, or None.
+    """
+    def __init__(self, message, retry=True, retry_after=None):
+        super().__init__(message)
+        self.retry = retry
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Build an error from an unsuccessful HTTP response.
+
+        Args:
+            response (httpx.Response): The response, with its body read.
+
+        Returns:
+            ProviderError: The error, retryable for 429 and 5xx statuses.
+        """
+        return cls(
+            f"HTTP {response.status_code}: {response.text[:200]}",
+            retry=response.status_code in RETRY_STATUS,
+            retry_after=retry_after(response)
+        )
+
+def retry_after(response):
+    """
+    Read the Retry-After header of a response.
+
+    Args:
+        response (httpx.Response): The response.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid.
+    """
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a provider that keeps failing.
+
+    After failure_threshold failures in a row the breaker opens and requests
+    are refused for reset_timeout seconds.  Then a single trial request is let
+    through: if it succeeds the breaker closes, otherwise it opens again.
+
+    Attributes:
+        failure_threshold (int): Failures in a row that open the breaker.
+        reset_timeout (float): Seconds the breaker stays open before a trial request.
+        failures (int): Failures since the last success.
+        opened_at (float): Monotonic time the breaker opened, or None while closed.
+        probing (bool): Whether the trial request is in progress.
+        trips (int): Number of times the breaker has opened.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Args:
+            failure_threshold (int, optional): Failures in a row that open the breaker.
+            reset_timeout (float, optional): Seconds the breaker stays open.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        """
+        str: "closed", "open" or "half-open".
+        """
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """
+        Check whether a request may be sent, claiming the trial request if it is due.
+
+        Returns:
+            bool: True if the request may go ahead.
+        """
+        if self.opened_at is None:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self.probing = True
+        return True
+
+    def success(self):
+        """
+        Record a successful request, closing the breaker.
+        """
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self):
+        """
+        Record a failed request, opening the breaker if there were too many.
+        """
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.trips += 1
+        self.probing = False
+
+    def release(self):
+        """
+        Give back a trial request that ended without telling us anything about the provider.
+        """
+        self.probing = False
+
+class Resilience:
+    """
+    Retries, circuit breakers and failover for completion requests.
+
+    A request is tried on the chosen model first, then on each model of the
+    fallback chain in turn.  Failures that may be temporary, timeouts,
+    dropped connections, 429 and 5xx responses, are retried with jittered
+    exponential backoff, or after the Retry-After the provider asked for.
+    Each provider has a circuit breaker so one that is down is skipped
+    straight away instead of costing every request a timeout.
+
+    Attributes:
+        fallback (list): Models to try, in order, when the chosen one fails.
+        retries (int): Extra attempts per model for retryable failures.
+        backoff (float): Base delay in seconds, doubled on each retry.
+        max_backoff (float): Longest delay between retries.
+        max_retry_after (float): Longest Retry-After honoured, longer ones fail over instead.
+        breakers (dict): Provider name -> CircuitBreaker.
+    """
+    def __init__(self, fallback=None, retries=2, backoff=0.5, max_backoff=8.0, max_retry_after=30.0, failure_threshold=5, reset_timeout=30.0):
+        """
+        Args:
+            fallback (list, optional): Models to fall back to, in order.
+            retries (int, optional): Extra attempts per model.
+            backoff (float, optional): Base delay in seconds between attempts.
+            max_backoff (float, optional): Longest delay between attempts.
+            max_retry_after (float, optional): Longest Retry-After honoured.
+            failure_threshold (int, optional): Failures in a row that open a provider's breaker.
+            reset_timeout (float, optional): Seconds an open breaker waits before a trial request.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.fallback = fallback or []
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+
+    def breaker(self, provider):
+        """
+        Get the circuit breaker for a provider.
+
+        Args:
+            provider (str): Provider name.
+
+        Returns:
+            CircuitBreaker: The provider's breaker.
+        """
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            breaker = self.breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def chain(self, model, index):
+        """
+        List the models to try for a request.
+
+        Args:
+            model (str): The chosen model.
+            index (dict): Model name -> Provider.
+
+        Returns:
+            list: The chosen model followed by the configured fallbacks.
+        """
+        return [model] + [fallback for fallback in self.fallback if fallback != model and fallback in index]
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Work out how long to wait before retrying.
+
+        Args:
+            attempt (int): Number of attempts already made, starting at 0.
+            retry_after (float, optional): Delay requested by the provider.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def run(self, models, index, attempt, can_retry=None):
+        """
+        Run a request on the first model that can complete it.
+
+        Args:
+            models (list): Models to try, in order.
+            index (dict): Model name -> Provider.
+            attempt (coroutine function): Called with (model, provider), returns the completion
+                or raises ProviderError, httpx.TransportError or ValueError.
+            can_retry (callable, optional): Returns False once a retry is no longer safe,
+                for example because part of the response was already sent.
+
+        Returns:
+            tuple: The model that answered and its completion.
+
+        Raises:
+            CompletionError: Every model failed or was unavailable.
+            Overloaded: Every model was turned away by admission control.
+        """
+        errors = []
+        shed = False
+        for model in models:
+            provider = index[model]
+            breaker = self.breaker(provider.name)
+            for tries in range(self.retries + 1):
+                if not breaker.allow():
+                    errors.append(f"{model}: {provider.name} unavailable")
+                    break
+                try:
+                    result = await attempt(model, provider)
+                except Overloaded:
+                    breaker.release()
+                    shed = True
+                    break
+                except (ProviderError, httpx.TransportError, ValueError) as e:
+                    retry = getattr(e, "retry", True)
+                    if retry:
+                        breaker.failure()
+                    else:
+                        breaker.release()
+                    description = str(e) or type(e).__name__
+                    self.log("Request to %s failed: %s", model, description)
+                    errors.append(f"{model}: {description}")
+                    if not retry or tries == self.retries or (can_retry and not can_retry()):
+                        break
+                    wait = self.delay(tries, getattr(e, "retry_after", None))
+                    if wait > self.max_retry_after:
+                        break
+                    await asyncio.sleep(wait)
+                    continue
+                except BaseException:
+                    breaker.release()
+                    raise
+                breaker.success()
+                return model, result
+            if can_retry and not can_retry():
+                break
+        if shed and not errors:
+            raise Overloaded()
+        raise CompletionError("; ".join(errors) or "no model available", partial=bool(can_retry and not can_retry()))
+
+    def stats(self):
+        """
+        Report the state of each provider's breaker.
+
+        Returns:
+            dict: Provider name -> state, failures in a row and times opened.
+        """
+        return {
+            provider: {"state": breaker.state, "failures": breaker.failures, "trips": breaker.trips}
+            for provider, breaker in self.breakers.items()
+        }
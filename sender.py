@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+PRIORITY_COMMAND = 0
+PRIORITY_REPLY = 1
+
+class SendScheduler:
+    """
+    Central outbound queue for IRC messages, paced by a token bucket.
+
+    Every message the bot sends goes through one queue on the event loop, so
+    concurrent replies share a single flood budget instead of each sleeping on
+    its own.  Messages are grouped by priority, command feedback ahead of LLM
+    output, and within a priority targets are served round robin so one long
+    answer can't starve other channels.
+
+    Attributes:
+        write (callable): Sends one message, called as write(command, target, text).
+        burst (int): Number of messages that may be sent back to back.
+        rate (float): Messages per second the bucket refills at.
+        tokens (float): Messages currently available to send.
+        queues (list): One OrderedDict of target -> deque per priority.
+        queued (int): Number of messages waiting to be sent.
+        sent (int): Number of messages sent.
+        wait_total (float): Total seconds messages spent queued.
+        wait_max (float): Longest time a single message spent queued.
+        observe_wait (callable): Called with the seconds each message spent queued, or None.
+    """
+    def __init__(self, write, burst=5, rate=0.7, observe_wait=None):
+        """
+        Args:
+            write (callable): Sends one message, called as write(command, target, text).
+            burst (int): Number of messages that may be sent back to back.
+            rate (float): Messages per second once the burst is used up.
+            observe_wait (callable, optional): Called with the seconds each message spent queued.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.write = write
+        self.burst = burst
+        self.rate = rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.queues = [OrderedDict(), OrderedDict()]
+        self.queued = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.sent = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.observe_wait = observe_wait
+
+    def start(self):
+        """
+        Start the sending task on the running event loop.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def send(self, target, text, priority=PRIORITY_REPLY, command="privmsg"):
+        """
+        Queue a message.  Must be called from the event loop.
+
+        Args:
+            target (str): Channel or nickname to send to.
+            text (str): The message.
+            priority (int, optional): PRIORITY_COMMAND or PRIORITY_REPLY.
+            command (str, optional): Connection method to send with, "privmsg" or "notice".
+
+        Returns:
+            asyncio.Future: Resolves to True once the message has been written.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues[priority].get(target)
+        if queue is None:
+            queue = self.queues[priority][target] = deque()
+        queue.append((command, text, time.monotonic(), future))
+        self.queued += 1
+        self.wakeup.set()
+        return future
+
+    def depth(self, target=None):
+        """
+        Count queued messages.
+
+        Args:
+            target (str, optional): Only count messages for this target.
+
+        Returns:
+            int: Number of messages waiting to be sent.
+        """
+        if target is not None:
+            return sum(len(queues.get(target, ())) for queues in self.queues)
+        return self.queued
+
+    def stats(self):
+        """
+        Report queue depth and wait time counters.
+
+        Returns:
+            dict: Current depth, messages sent, and average and maximum wait in seconds.
+        """
+        return {
+            "depth": self.depth(),
+            "sent": self.sent,
+            "wait_avg": self.wait_total / self.sent if self.sent else 0.0,
+            "wait_max": self.wait_max
+        }
+
+    def next_message(self):
+        """
+        Take the next message, highest priority first and round robin across targets.
+
+        Returns:
+            tuple: (target, command, text, queued_at, future), or None if nothing is queued.
+        """
+        for queues in self.queues:
+            if queues:
+                target, queue = next(iter(queues.items()))
+                command, text, queued, future = queue.popleft()
+                self.queued -= 1
+                if queue:
+                    queues.move_to_end(target)
+                else:
+                    del queues[target]
+                return target, command, text, queued, future
+        return None
+
+    async def take_token(self):
+        """
+        Wait until the bucket allows another message, then use it up.
+        """
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def run(self):
+        """
+        Send queued messages forever, as fast as the token bucket allows.
+        """
+        while True:
+            if not self.queued:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            await self.take_token()
+            target, command, text, queued, future = self.next_message()
+            waited = time.monotonic() - queued
+            self.sent += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if self.observe_wait is not None:
+                self.observe_wait(waited)
+            try:
+                self.write(command, target, text)
+                sent = True
+            except Exception as e:
+                self.log("Error sending to %s: %s", target, e)
+                sent = False
+            if not future.done():
+                future.set_result(sent)
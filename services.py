@@ -0,0 +1,201 @@
+import logging
+
+from clients import ClientPool
+from completions import CompletionCache
+from conversations import ConversationStore
+from limiter import Admission
+from metrics import Metrics
+from ollama import OllamaPool
+from providers import build_index
+from reasoning import ReasoningLog
+from reload import load
+from resilience import Resilience
+from storage import Storage
+from toolrunner import ToolRuntime
+import tools
+
+class Services:
+    """
+    LLM side resources shared by every IRC network the process serves.
+
+    The "irc" section of config.json is either one network block or a list
+    of them.  Each network gets its own bot, but they all share the HTTP
+    clients, caches, conversation store, storage, limits and tools built
+    here, so adding a network costs one IRC connection and nothing more.
+
+    Attributes:
+        config (dict): Contents of config.json.
+        schema (list): Tool definitions from schema.json.
+        networks (list): IRC settings for each network.  Networks in a list are named,
+            by "name" or else by server, and their conversations are kept apart by that name.
+        model_index (dict): Model name -> Provider, built once from the model lists.
+        storage (Storage): On-disk copy of conversations and settings, or None.
+        conversations (ConversationStore): Conversation history of every network.
+        completions (CompletionCache): Responses to repeated requests like introductions and farewells.
+        clients (ClientPool): Persistent HTTP clients shared by all LLM requests.
+        ollama (OllamaPool): Native backend for the Ollama servers, None without Ollama models.
+        admission (Admission): Per-provider request limits.
+        resilience (Resilience): Retries, circuit breakers and the fallback chain for requests.
+        toolbox (ToolRuntime): Registry and executor for the tools in schema.json.
+        metrics (Metrics): Latency, token and error metrics of every network.
+        reasoning_log (ReasoningLog): Where the reasoning of thinking models is written.
+        senders (dict): Network name -> SendScheduler, for the send queue gauge.
+    """
+    def __init__(self, config, schema):
+        """
+        Build the shared resources.
+
+        Args:
+            config (dict): Contents of config.json.
+            schema (list): Tool definitions from schema.json.
+        """
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        self.log = logging.getLogger(__name__).info
+        self.config = config
+        self.schema = schema
+        self.networks = self.read_networks(config)
+
+        self.metrics = Metrics(**config.get("metrics", {}))
+        self.senders = {}
+        llm = config["llm"]
+        self.model_index = build_index(llm["models"], llm["api_keys"], llm["ollama_url"])
+        self.storage = Storage.from_config(config.get("storage"))
+        self.conversations = ConversationStore(storage=self.storage, **llm.get("conversations", {}))
+        self.completions = CompletionCache(storage=self.storage, **llm.get("response_cache", {}))
+        self.clients = ClientPool.from_config(llm.get("http"))
+        self.ollama = OllamaPool.from_config(llm, self.clients)
+        self.admission = Admission(llm.get("limits"))
+        self.resilience = Resilience(llm.get("fallback"), **llm.get("retry", {}))
+        self.reasoning_log = ReasoningLog(**llm.get("reasoning", {}))
+        self.toolbox = ToolRuntime(tools, schema, client=self.clients.get("tools"), metrics=self.metrics, **llm.get("tools", {}))
+
+        self.metrics.gauge("conversations", "Conversations held in memory", lambda: self.conversations.stats()["conversations"])
+        self.metrics.gauge("history_bytes", "Bytes of message text held in memory", lambda: self.conversations.stats()["bytes"])
+        self.metrics.gauge("conversations_evicted", "Conversations evicted from memory so far", lambda: self.conversations.evicted)
+        self.metrics.gauge("irc_send_queue_depth", "Messages waiting to be sent", lambda: {(name,): sender.depth() for name, sender in self.senders.items()}, ("network",))
+        self.metrics.gauge("llm_requests_inflight", "Requests running per provider",
+                           lambda: {(name,): stats["inflight"] for name, stats in self.admission.stats()["providers"].items()}, ("provider",))
+        self.metrics.gauge("ollama_requests_inflight", "Requests running per Ollama server",
+                           lambda: {(url,): stats["inflight"] for url, stats in (self.ollama.stats() if self.ollama else {}).items()}, ("host",))
+
+    @staticmethod
+    def read_networks(config):
+        """
+        Args:
+            config (dict): Contents of config.json.
+
+        Returns:
+            list: IRC settings for each network, named when there are several.
+        """
+        irc = config["irc"]
+        if isinstance(irc, list):
+            return [dict(network, name=network.get("name") or network["server"]) for network in irc]
+        return [irc]
+
+    def reload(self, config, schema):
+        """
+        Switch to a new configuration without interrupting requests in progress.
+
+        Everything is built from the new configuration first and then swapped
+        in at once, so a request sees either the old settings or the new ones.
+        State worth keeping is carried over: conversations, caches, circuit
+        breakers whose settings didn't change and limiters of providers whose
+        limits didn't change.  Requests
+        already running finish on the objects they started with.  Storage,
+        metrics and HTTP settings are only read at startup.
+
+        Args:
+            config (dict): Validated contents of config.json.
+            schema (list): Tool definitions from schema.json.
+
+        Returns:
+            dict: The configuration that was replaced.
+        """
+        previous, llm = self.config, config["llm"]
+        old = previous["llm"]
+        model_index = build_index(llm["models"], llm["api_keys"], llm["ollama_url"])
+
+        admission = Admission(llm.get("limits"))
+        def provider_limits(admission, provider):
+            return admission.limits.get(provider, admission.limits.get("default"))
+        for provider, limiter in self.admission.limiters.items():
+            if provider_limits(admission, provider) == provider_limits(self.admission, provider):
+                admission.limiters[provider] = limiter
+
+        resilience = Resilience(llm.get("fallback"), **llm.get("retry", {}))
+        if (resilience.failure_threshold, resilience.reset_timeout) == (self.resilience.failure_threshold, self.resilience.reset_timeout):
+            resilience.breakers = self.resilience.breakers
+
+        toolbox = self.toolbox
+        if schema != self.schema or llm.get("tools") != old.get("tools"):
+            toolbox = ToolRuntime(tools, schema, client=self.clients.get("tools"), metrics=self.metrics, **llm.get("tools", {}))
+        reasoning_log = self.reasoning_log
+        if llm.get("reasoning") != old.get("reasoning"):
+            reasoning_log = ReasoningLog(**llm.get("reasoning", {}))
+        ollama = self.ollama
+        if (llm.get("ollama"), llm["models"].get("ollama"), llm["ollama_url"]) != (old.get("ollama"), old["models"].get("ollama"), old["ollama_url"]):
+            ollama = OllamaPool.from_config(llm, self.clients)
+
+        self.config, self.schema, self.networks = config, schema, self.read_networks(config)
+        self.model_index, self.admission, self.resilience = model_index, admission, resilience
+        self.toolbox, self.reasoning_log = toolbox, reasoning_log
+        if ollama is not self.ollama:
+            # Requests already sent to the old servers finish there
+            if self.ollama is not None:
+                self.ollama.stop()
+            self.ollama = ollama
+            if ollama is not None:
+                ollama.start(llm["default_model"])
+        elif ollama is not None and llm["default_model"] != old["default_model"]:
+            ollama.warm(llm["default_model"])
+        limits = llm.get("conversations", {})
+        for name in ("max_conversations", "max_bytes", "idle_timeout"):
+            setattr(self.conversations, name, limits.get(name, getattr(self.conversations, name)))
+        cache = llm.get("response_cache", {})
+        self.completions.ttl = cache.get("ttl", self.completions.ttl)
+        self.completions.memory.max_size = cache.get("max_size", self.completions.memory.max_size)
+
+        for section, before, after in (("storage", previous.get("storage"), config.get("storage")),
+                                       ("metrics", previous.get("metrics"), config.get("metrics")),
+                                       ("http", old.get("http"), llm.get("http"))):
+            if before != after:
+                self.log("Changes to %s settings take effect after a restart", section)
+        return previous
+
+    @classmethod
+    def from_files(cls, config_path="config.json", schema_path="schema.json"):
+        """
+        Build the shared resources from the configuration files.
+
+        Args:
+            config_path (str, optional): Location of config.json.
+            schema_path (str, optional): Location of schema.json.
+
+        Returns:
+            Services: The shared resources.
+
+        Raises:
+            ConfigError: A file can't be read, isn't valid JSON or fails validation.
+        """
+        return cls(*load(config_path, schema_path))
+
+    def start(self):
+        """
+        Start background tasks on the running event loop.
+        """
+        if self.storage is not None:
+            self.storage.start()
+        self.metrics.start()
+        if self.ollama is not None:
+            self.ollama.start(self.config["llm"]["default_model"])
+
+    async def close(self):
+        """
+        Close the HTTP clients and write pending changes to storage.
+        """
+        await self.metrics.close()
+        if self.ollama is not None:
+            self.ollama.stop()
+        await self.clients.aclose()
+        if self.storage is not None:
+            await self.storage.close()
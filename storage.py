@@ -0,0 +1,303 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+class Storage:
+    """
+    Crash-safe SQLite file holding conversations, bot settings and cached responses.
+
+    The database runs in WAL mode.  Changes are only marked as pending on the
+    event loop and written in batches from a worker thread, so the bot never
+    waits on the disk.  Conversations are read back one at a time, when a user
+    next speaks, so startup time doesn't depend on how many are stored.
+
+    Attributes:
+        path (str): Location of the database file.
+        flush_interval (float): Seconds between batched writes.
+        compact_interval (float): Seconds between compactions.
+        retention (float): Seconds an unused conversation is kept on disk.
+        pending (dict): (channel, sender) -> Conversation waiting to be written.
+        writing (dict): Conversations in the batch currently being written.
+        pending_channels (list): Channels whose conversations are waiting to be deleted.
+        pending_settings (dict): Setting name -> value waiting to be written.
+        pending_completions (dict): Request hash -> (lines, expiry time) waiting to be written.
+    """
+    def __init__(self, path, flush_interval=2.0, compact_interval=3600.0, retention_days=30):
+        """
+        Open the database, creating it if needed.
+
+        Args:
+            path (str): Location of the database file.
+            flush_interval (float, optional): Seconds between batched writes.
+            compact_interval (float, optional): Seconds between compactions.
+            retention_days (float, optional): Days an unused conversation is kept on disk.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.retention = retention_days * 86400
+        self.pending = {}
+        self.writing = {}
+        self.pending_channels = []
+        self.pending_settings = {}
+        self.pending_completions = {}
+        self.tasks = []
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "channel TEXT, sender TEXT, system TEXT, units TEXT, updated REAL, "
+            "PRIMARY KEY (channel, sender))"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, lines TEXT, expires REAL)")
+        self.db.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build storage from the "storage" block of config.json.
+
+        Args:
+            config (dict): Storage settings, or None.
+
+        Returns:
+            Storage: The opened storage, or None if no path is configured.
+        """
+        if not config or not config.get("path"):
+            return None
+        return cls(**config)
+
+    def start(self):
+        """
+        Start the background flush and compaction tasks on the running event loop.
+        """
+        self.tasks = [
+            asyncio.create_task(self.every(self.flush_interval, self.flush)),
+            asyncio.create_task(self.every(self.compact_interval, self.compact))
+        ]
+
+    async def every(self, interval, job):
+        """
+        Run a job periodically, logging instead of stopping on errors.
+
+        Args:
+            interval (float): Seconds between runs.
+            job (coroutine function): The job to run.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except Exception as e:
+                self.log("Storage error in %s: %s", job.__name__, e)
+
+    def save(self, conversation):
+        """
+        Mark a conversation to be written with the next batch.
+
+        Args:
+            conversation (Conversation): The conversation that changed.
+        """
+        self.pending[conversation.key] = conversation
+
+    def delete_channel(self, channel):
+        """
+        Mark every conversation in a channel to be deleted with the next batch.
+
+        Args:
+            channel (str): Channel name.
+        """
+        for key in [key for key in self.pending if key[0] == channel]:
+            del self.pending[key]
+        self.pending_channels.append(channel)
+
+    def set_setting(self, key, value):
+        """
+        Mark a setting to be written with the next batch.
+
+        Args:
+            key (str): Setting name.
+            value: JSON serializable value.
+        """
+        self.pending_settings[key] = value
+
+    def save_completion(self, key, lines, expires):
+        """
+        Mark a cached response to be written with the next batch.
+
+        Args:
+            key (str): Request hash.
+            lines (list): The response lines.
+            expires (float): Unix time the response stops being valid.
+        """
+        self.pending_completions[key] = (lines, expires)
+
+    async def flush(self):
+        """
+        Write all pending changes in one transaction.
+
+        If the write fails, the batch is marked pending again, under anything
+        that changed meanwhile, so the next flush tries it again.
+        """
+        if not (self.pending or self.pending_channels or self.pending_settings or self.pending_completions):
+            return
+        now = time.time()
+        rows = [
+            (channel, sender, conversation.system, json.dumps([list(unit) for unit, size, tokens in conversation.units]), now)
+            for (channel, sender), conversation in self.pending.items()
+        ]
+        channels = [(channel,) for channel in self.pending_channels]
+        settings = [(key, json.dumps(value)) for key, value in self.pending_settings.items()]
+        completions = [(key, json.dumps(lines), expires) for key, (lines, expires) in self.pending_completions.items()]
+        batch = self.pending, self.pending_channels, self.pending_settings, self.pending_completions
+        self.writing = self.pending
+        self.pending, self.pending_channels, self.pending_settings, self.pending_completions = {}, [], {}, {}
+        try:
+            await asyncio.to_thread(self.write, channels, rows, settings, completions)
+        except Exception:
+            self.restore(*batch)
+            raise
+        finally:
+            self.writing = {}
+
+    def restore(self, pending, pending_channels, pending_settings, pending_completions):
+        """
+        Mark a batch that failed to be written as pending again.
+
+        Changes made since the batch was taken win, and conversations in
+        channels deleted since then are dropped.
+
+        Args:
+            pending (dict): (channel, sender) -> Conversation from the batch.
+            pending_channels (list): Channels from the batch whose conversations were to be deleted.
+            pending_settings (dict): Setting name -> value from the batch.
+            pending_completions (dict): Request hash -> (lines, expiry time) from the batch.
+        """
+        pending = {key: conversation for key, conversation in pending.items() if key[0] not in self.pending_channels}
+        self.pending = {**pending, **self.pending}
+        self.pending_channels = pending_channels + [channel for channel in self.pending_channels if channel not in pending_channels]
+        self.pending_settings = {**pending_settings, **self.pending_settings}
+        self.pending_completions = {**pending_completions, **self.pending_completions}
+
+    def write(self, channels, rows, settings, completions=()):
+        """
+        Apply a batch of changes.  Runs in a worker thread.
+
+        Args:
+            channels (list): Channels to delete conversations from.
+            rows (list): Conversation rows to insert or replace.
+            settings (list): Setting rows to insert or replace.
+            completions (list, optional): Cached response rows to insert or replace.
+        """
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM conversations WHERE channel = ?", channels)
+            self.db.executemany("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?)", rows)
+            self.db.executemany("INSERT OR REPLACE INTO settings VALUES (?, ?)", settings)
+            self.db.executemany("INSERT OR REPLACE INTO completions VALUES (?, ?, ?)", completions)
+
+    async def load(self, channel, sender):
+        """
+        Read one conversation from disk.
+
+        Args:
+            channel (str): Channel name, or "privmsg".
+            sender (str): Nickname the conversation belongs to.
+
+        Returns:
+            tuple: (system prompt, list of units), or None if it isn't stored.
+        """
+        if channel in self.pending_channels:
+            return None
+        conversation = self.pending.get((channel, sender)) or self.writing.get((channel, sender))
+        if conversation is not None:
+            return conversation.system, [unit for unit, size, tokens in conversation.units]
+        row = await asyncio.to_thread(self.read, "SELECT system, units FROM conversations WHERE channel = ? AND sender = ?", (channel, sender))
+        if not row:
+            return None
+        system, units = row[0]
+        return system, json.loads(units)
+
+    async def load_completion(self, key):
+        """
+        Read a cached response from disk.
+
+        Args:
+            key (str): Request hash.
+
+        Returns:
+            tuple: (lines, expiry time), or None if it isn't stored or has expired.
+        """
+        now = time.time()
+        pending = self.pending_completions.get(key)
+        if pending is not None:
+            return (list(pending[0]), pending[1]) if pending[1] > now else None
+        row = await asyncio.to_thread(self.read, "SELECT lines, expires FROM completions WHERE key = ? AND expires > ?", (key, now))
+        if not row:
+            return None
+        lines, expires = row[0]
+        return json.loads(lines), expires
+
+    async def load_settings(self):
+        """
+        Read all stored settings.
+
+        Returns:
+            dict: Setting name -> value.
+        """
+        rows = await asyncio.to_thread(self.read, "SELECT key, value FROM settings", ())
+        return {key: json.loads(value) for key, value in rows}
+
+    def read(self, query, params):
+        """
+        Run a query.  Runs in a worker thread.
+
+        Args:
+            query (str): SQL query.
+            params (tuple): Query parameters.
+
+        Returns:
+            list: The resulting rows.
+        """
+        with self.lock:
+            return self.db.execute(query, params).fetchall()
+
+    async def compact(self):
+        """
+        Drop conversations unused for longer than the retention period, expired responses, and shrink the file.
+        """
+        await asyncio.to_thread(self.vacuum, time.time() - self.retention)
+
+    def vacuum(self, cutoff):
+        """
+        Delete old conversations and expired responses, checkpoint the WAL and release free pages.  Runs in a worker thread.
+
+        Args:
+            cutoff (float): Conversations last updated before this time are deleted.
+        """
+        with self.lock:
+            with self.db:
+                removed = self.db.execute("DELETE FROM conversations WHERE updated < ?", (cutoff,)).rowcount
+                self.db.execute("DELETE FROM completions WHERE expires < ?", (time.time(),))
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.db.execute("PRAGMA incremental_vacuum").fetchall()
+        if removed:
+            self.log("Removed %s old conversations from %s", removed, self.path)
+
+    async def close(self):
+        """
+        Stop the background tasks, write pending changes and close the database.
+        """
+        for task in self.tasks:
+            task.cancel()
+        await self.flush()
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,74 @@
+import json
+
+from reasoning import ReasoningFilter
+
+async def read_stream(response, on_text, opened=False):
+    """
+    Read an OpenAI compatible server-sent event stream of chat completion chunks.
+
+    Content deltas are passed to on_text as they arrive, and tool call
+    fragments are stitched back together, so the return value has the same
+    shape as a regular (non-streamed) completion.  Reasoning, in <think>
+    blocks or in "reasoning_content" deltas, is never passed to on_text and
+    is returned as the message's "reasoning_content".
+
+    Args:
+        response (httpx.Response): An open streaming response.
+        on_text (coroutine function): Called with each piece of content.
+        opened (bool, optional): Whether the chat template opens the reasoning block, see ReasoningFilter.
+
+    Returns:
+        dict: The assembled completion, with "choices" and "usage".
+    """
+    content = []
+    tool_calls = {}
+    finish_reason = None
+    usage = None
+    reasoning = ReasoningFilter(opened=opened)
+
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            break
+        chunk = json.loads(payload)
+        if chunk.get("usage"):
+            usage = chunk["usage"]
+        if not chunk.get("choices"):
+            continue
+        choice = chunk["choices"][0]
+        delta = choice.get("delta") or {}
+        for field in ("reasoning_content", "reasoning"):
+            if delta.get(field):
+                reasoning.reason(delta[field])
+        if delta.get("content"):
+            text = reasoning.feed(delta["content"])
+            if text:
+                content.append(text)
+                await on_text(text)
+        for call in delta.get("tool_calls") or []:
+            entry = tool_calls.setdefault(call.get("index", len(tool_calls)), {
+                "id": None,
+                "type": "function",
+                "function": {"name": "", "arguments": ""}
+            })
+            if call.get("id"):
+                entry["id"] = call["id"]
+            function = call.get("function") or {}
+            entry["function"]["name"] += function.get("name") or ""
+            entry["function"]["arguments"] += function.get("arguments") or ""
+        if choice.get("finish_reason"):
+            finish_reason = choice["finish_reason"]
+
+    text = reasoning.flush()
+    if text:
+        content.append(text)
+        await on_text(text)
+
+    message = {"role": "assistant", "content": "".join(content) or None}
+    if reasoning.text():
+        message["reasoning_content"] = reasoning.text()
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+    return {"choices": [{"message": message, "finish_reason": finish_reason}], "usage": usage}
@@ -0,0 +1,52 @@
+import asyncio
+import json
+import os
+
+from infinigpt import InfiniGPT
+from services import Services
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def bot():
+    with open(os.path.join(ROOT, "config.json")) as f:
+        config = json.load(f)
+    with open(os.path.join(ROOT, "schema.json")) as f:
+        schema = json.load(f)
+    config.pop("storage", None)
+    bot = InfiniGPT(Services(config, schema))
+    bot.model = bot.default_model
+    bot.sent = []
+    bot.sender.send = lambda target, line, priority=None: bot.sent.append((target, line))
+    return bot
+
+def test_private_model_changes_the_global_model():
+    infinigpt = bot()
+    admin = infinigpt.admins[0]
+    asyncio.run(infinigpt.handle_privmsg(None, admin, [".model", "gpt-4.1"]))
+    assert infinigpt.model == "gpt-4.1"
+    assert infinigpt.channel_models == {}
+    assert infinigpt.model_for("privmsg", "someone_else") == "gpt-4.1"
+    assert infinigpt.sent == [(admin, "Model set to gpt-4.1")]
+
+def test_channel_model_stays_in_its_channel():
+    infinigpt = bot()
+    asyncio.run(infinigpt.handle_message(None, "#chan", infinigpt.admins[0], [".model", "gpt-4.1"]))
+    assert infinigpt.model == infinigpt.default_model
+    assert infinigpt.model_for("#chan", "someone") == "gpt-4.1"
+    assert infinigpt.model_for("privmsg", "someone") == infinigpt.default_model
+
+def test_reset_waits_for_the_running_turn():
+    infinigpt = bot()
+
+    async def run():
+        await infinigpt.add_history("user", "#chan", "alice", "hello")
+        async with infinigpt.turns.lock(("#chan", "alice")):
+            reset = asyncio.create_task(infinigpt.handle_message(None, "#chan", "alice", [".stock"]))
+            await asyncio.sleep(0.01)
+            # A reply that finishes while the reset waits
+            await infinigpt.add_history("assistant", "#chan", "alice", "hi")
+        await reset
+        return await infinigpt.conversations.fetch("#chan", "alice")
+
+    conversation = asyncio.run(run())
+    assert conversation.messages() == []
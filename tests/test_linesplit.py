@@ -0,0 +1,57 @@
+from linesplit import IRC_LINE_BYTES, LineSplitter, line_budget
+
+TEXT = ("The quick brown fox jumps over the lazy dog while a curious cat watches. " * 20).strip()
+
+def fits(lines, budget):
+    return all(len(line.encode()) <= budget for line in lines)
+
+def test_budget_leaves_room_for_the_prefix_and_target():
+    budget = line_budget("bot", "#chan", "bot!user@example.org")
+    message = f":bot!user@example.org PRIVMSG #chan :{'x' * budget}\r\n"
+    assert len(message.encode()) == IRC_LINE_BYTES
+
+def test_unknown_hostmask_and_target_give_a_smaller_budget():
+    assert line_budget("bot") < line_budget("bot", "#chan", "bot!user@example.org")
+
+def test_short_lines_are_kept_as_they_are():
+    assert LineSplitter(100).split("one\ntwo") == ["one", "two"]
+
+def test_lines_break_between_words():
+    lines = LineSplitter(60).split(TEXT)
+    assert fits(lines, 60)
+    assert " ".join(lines) == TEXT
+    assert not any(line.startswith(" ") for line in lines)
+
+def test_long_words_are_cut_on_character_boundaries():
+    word = "é" * 100
+    lines = LineSplitter(31).split(word)
+    assert fits(lines, 31)
+    assert "".join(lines) == word
+
+def test_emoji_sequences_are_not_split():
+    family = "\U0001f468‍\U0001f469‍\U0001f467"
+    thumbs = "\U0001f44d\U0001f3fd"
+    accent = "é"
+    for cluster in (family, thumbs, accent):
+        text = cluster * 20
+        for budget in range(len(cluster.encode()), 40):
+            lines = LineSplitter(budget).split(text)
+            assert fits(lines, budget)
+            assert all(line == cluster * (len(line) // len(cluster)) for line in lines), (cluster, budget)
+
+def test_streaming_gives_the_same_lines_as_splitting():
+    text = TEXT + "\n\nSecond paragraph, " + "ü" * 150 + "\nlast"
+    expected = LineSplitter(50).split(text)
+    for size in (1, 3, 7, 64):
+        splitter = LineSplitter(50)
+        lines = []
+        for start in range(0, len(text), size):
+            lines.extend(splitter.feed(text[start:start + size]))
+        lines.extend(splitter.flush())
+        assert lines == expected, size
+
+def test_streamed_lines_are_sent_before_the_text_ends():
+    splitter = LineSplitter(40)
+    assert splitter.feed("first line\nsecond") == ["first line"]
+    assert splitter.feed(" " + "word " * 20) != []
+    assert fits(splitter.flush(), 40)
@@ -0,0 +1,35 @@
+import asyncio
+
+from ollama import OllamaHost, OllamaPool, tagged
+
+def test_names_get_the_tag_ollama_reports():
+    assert tagged("llama3.2") == "llama3.2:latest"
+    assert tagged("qwen2.5:14b") == "qwen2.5:14b"
+    assert tagged("registry.local:5000/team/model") == "registry.local:5000/team/model:latest"
+
+def test_server_with_the_model_loaded_is_preferred():
+    pool = OllamaPool(hosts=["a:11434", "b:11434"], parallel=2)
+    # As /api/ps reports them
+    pool.hosts[1].loaded = {"llama3.2:latest"}
+    assert pool.pick("llama3.2") is pool.hosts[1]
+    assert pool.pick("qwen2.5:14b") is pool.hosts[0]
+
+def test_waiting_requests_for_a_loaded_model_go_first():
+    async def run():
+        host = OllamaHost("http://a:11434", parallel=1)
+        host.loaded = {"llama3.2:latest"}
+        order = []
+        release = asyncio.Event()
+
+        async def request(model):
+            async with host.slot(model):
+                order.append(model)
+                await release.wait()
+
+        tasks = [asyncio.create_task(request(model)) for model in ("phi3", "mistral", "llama3.2")]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["phi3", "llama3.2", "mistral"]
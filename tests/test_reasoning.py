@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import httpx
+
+import ollama
+from reasoning import ReasoningFilter, ReasoningLog, separate
+from streaming import read_stream
+
+def filtered(chunks, opened=False):
+    reasoning = ReasoningFilter(opened=opened)
+    answer = "".join(reasoning.feed(chunk) for chunk in chunks) + reasoning.flush()
+    return answer, reasoning.text()
+
+def pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def test_think_block_is_removed_whatever_the_chunking():
+    text = "<think>\nFirst I work it out.\n</think>\n\nThe answer is 4."
+    for size in range(1, len(text) + 1):
+        assert filtered(pieces(text, size)) == ("\n\nThe answer is 4.", "First I work it out.")
+
+def test_block_in_the_middle_of_a_line():
+    assert filtered(["Sure. <thi", "nk>hmm</th", "ink>Done."]) == ("Sure. Done.", "hmm")
+
+def test_text_that_only_looks_like_a_tag_is_kept():
+    assert filtered(["a <b> and <", "thing> c <"]) == ("a <b> and <thing> c <", "")
+
+def test_unfinished_block_is_not_sent():
+    assert filtered(["Hi <think>still going"]) == ("Hi ", "still going")
+
+def test_answer_streams_once_the_block_ends():
+    reasoning = ReasoningFilter()
+    assert reasoning.feed("<think>x</think>Hel") == "Hel"
+    assert reasoning.feed("lo") == "lo"
+
+def test_block_opened_by_the_template():
+    text = "Let me think about this.\nStill thinking.\n</think>\n\nHello there"
+    for size in range(1, len(text) + 1):
+        assert filtered(pieces(text, size), opened=True) == ("\n\nHello there", "Let me think about this.\nStill thinking.")
+
+def test_nothing_leaks_before_the_closing_tag():
+    reasoning = ReasoningFilter(opened=True)
+    assert reasoning.feed("Reasoning goes") == ""
+    assert reasoning.feed(" on and on\n") == ""
+    assert reasoning.feed("</think>Answer") == "Answer"
+
+def test_template_opened_model_that_opens_the_block_itself():
+    assert filtered(["\n<thi", "nk>why</think>Because."], opened=True) == ("\nBecause.", "why")
+
+def test_template_opened_model_that_did_not_think():
+    assert filtered(["Just ", "an answer"], opened=True) == ("Just an answer", "")
+    assert filtered(["  "], opened=True) == ("  ", "")
+
+def test_separate_reasoning_means_content_is_the_answer():
+    reasoning = ReasoningFilter(opened=True)
+    reasoning.reason("thought about it")
+    assert reasoning.feed("Answer") == "Answer"
+    assert reasoning.flush() == ""
+    assert reasoning.text() == "thought about it"
+
+def test_separate_handles_a_missing_opening_tag():
+    message = separate({"role": "assistant", "content": "thinking</think>Answer"})
+    assert message == {"role": "assistant", "content": "Answer", "reasoning_content": "thinking"}
+
+def test_separate_collects_reasoning_fields():
+    message = separate({"role": "assistant", "content": "Answer", "reasoning_content": "because"})
+    assert message == {"role": "assistant", "content": "Answer", "reasoning_content": "because"}
+
+def test_models_whose_template_opens_the_block():
+    log = ReasoningLog(opened_by_template=["DeepSeek-R1"])
+    assert log.opens("deepseek-r1:14b")
+    assert log.opens("deepseek-ai/DeepSeek-R1-Distill-Qwen-32B")
+    assert not log.opens("llama3.2")
+
+def stream(lines):
+    return httpx.Response(200, content="".join(line + "\n" for line in lines).encode())
+
+def collect(read, response, opened):
+    sent = []
+
+    async def on_text(text):
+        sent.append(text)
+
+    result = asyncio.run(read(response, on_text, opened))
+    return sent, result["choices"][0]["message"]
+
+def test_openai_stream_with_block_opened_by_the_template():
+    chunks = ["Plan", " the reply.", "</think>", "Hi", " all"]
+    response = stream(f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}" for chunk in chunks)
+    sent, message = collect(read_stream, response, True)
+    assert "".join(sent) == "Hi all"
+    assert message["content"] == "Hi all"
+    assert message["reasoning_content"] == "Plan the reply."
+
+def test_ollama_stream_with_block_opened_by_the_template():
+    chunks = [{"message": {"content": piece}} for piece in ["Plan.", "</think>", "Hi"]] + [{"done": True, "done_reason": "stop"}]
+    sent, message = collect(ollama.read_stream, stream(json.dumps(chunk) for chunk in chunks), True)
+    assert "".join(sent) == "Hi"
+    assert message["reasoning_content"] == "Plan."
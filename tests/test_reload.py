@@ -0,0 +1,59 @@
+import copy
+import json
+import os
+
+import pytest
+
+from reload import ConfigError, ConfigWatcher, validate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, "config.json")) as f:
+    CONFIG = json.load(f)
+with open(os.path.join(ROOT, "schema.json")) as f:
+    SCHEMA = json.load(f)
+
+def broken(change):
+    config = copy.deepcopy(CONFIG)
+    change(config)
+    with pytest.raises(ConfigError):
+        validate(config, SCHEMA)
+
+def test_shipped_config_is_valid():
+    validate(CONFIG, SCHEMA)
+
+def test_missing_password_is_rejected():
+    broken(lambda config: config["irc"].pop("password"))
+
+def test_channel_without_name_is_rejected():
+    broken(lambda config: config["irc"]["channels"].append({"intro": False}))
+
+def test_unknown_summary_and_fallback_models_are_allowed():
+    config = copy.deepcopy(CONFIG)
+    for provider in ("openai", "xai", "google", "mistral"):
+        config["llm"]["models"][provider] = []
+    config["llm"]["default_model"] = "llama3.2"
+    validate(config, SCHEMA)
+    broken(lambda config: config["llm"]["context"].update(summary_model=["gpt-4o-mini"]))
+
+def test_settings_of_the_wrong_type_are_rejected():
+    broken(lambda config: config["llm"].update(coalesce_window="soon"))
+    broken(lambda config: config["irc"].update(flood={"burst": "5"}))
+    broken(lambda config: config["llm"]["limits"]["default"].update(max_inflight=None))
+    broken(lambda config: config["llm"].update(limits=[]))
+
+def test_failed_apply_is_logged_and_watching_goes_on(tmp_path):
+    config_path, schema_path = tmp_path / "config.json", tmp_path / "schema.json"
+    config_path.write_text(json.dumps(CONFIG))
+    schema_path.write_text(json.dumps(SCHEMA))
+    calls = []
+
+    def apply(config, schema):
+        calls.append(config)
+        if len(calls) == 1:
+            raise RuntimeError("half way")
+
+    watcher = ConfigWatcher(apply, str(config_path), str(schema_path))
+    assert watcher.reload() is False
+    assert watcher.reload() is True
+    assert (watcher.failed, watcher.reloads) == (1, 1)
@@ -0,0 +1,39 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from conversations import Conversation
+from storage import Storage
+
+def test_failed_write_is_tried_again(tmp_path):
+    async def run():
+        storage = Storage(str(tmp_path / "test.db"))
+        write = storage.write
+        first = Conversation(("#a", "alice"), "first prompt")
+        storage.save(first)
+        storage.save(Conversation(("#b", "bob"), "old prompt"))
+        storage.set_setting("model", "old")
+        storage.set_setting("personality", "kept")
+        storage.save_completion("hash", ["cached"], 2e9)
+
+        def fail(*batch):
+            # Changes made while the batch is being written
+            storage.set_setting("model", "new")
+            storage.delete_channel("#b")
+            raise sqlite3.OperationalError("database is locked")
+
+        storage.write = fail
+        with pytest.raises(sqlite3.OperationalError):
+            await storage.flush()
+        assert await storage.load("#a", "alice") == ("first prompt", [])
+        storage.write = write
+        await storage.flush()
+        assert storage.pending == {} and storage.pending_settings == {}
+        assert await storage.load_settings() == {"model": "new", "personality": "kept"}
+        assert await storage.load("#a", "alice") == ("first prompt", [])
+        assert await storage.load("#b", "bob") is None
+        assert await storage.load_completion("hash") == (["cached"], 2e9)
+        await storage.close()
+
+    asyncio.run(run())
@@ -0,0 +1,211 @@
+import asyncio
+import inspect
+import json
+import logging
+import time
+
+from cache import TTLCache
+
+JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict
+}
+
+class ToolRuntime:
+    """
+    Registry and executor for the tools declared in schema.json.
+
+    Tools are matched to functions in the tools module once, when the schema
+    is loaded, instead of being looked up by name on every call.  All calls
+    from one model turn run concurrently, each with its own timeout.  Async
+    tools run on the event loop, plain functions are moved to a worker thread
+    so they can't block it.
+
+    Schema entries may carry runtime settings next to "type" and "function",
+    "timeout" in seconds and "cache_ttl", how long identical calls are served
+    from the result cache.  These are stripped before the schema is sent to
+    the model.
+
+    Attributes:
+        functions (dict): Tool name -> function.
+        parameters (dict): Tool name -> JSON schema of its arguments.
+        timeouts (dict): Tool name -> timeout in seconds.
+        ttls (dict): Tool name -> seconds results are cached, 0 for no caching.
+        cache (TTLCache): Results of cacheable tool calls.
+        schema (list): Tool definitions to send to the model.
+        latency (Histogram): Seconds each tool call took, by tool, or None.
+    """
+    runtime_keys = ("timeout", "cache_ttl")
+
+    def __init__(self, module, schema, timeout=30.0, client=None, cache_size=256, metrics=None):
+        """
+        Load and check the tool schema.
+
+        Args:
+            module (module): Module holding the tool functions.
+            schema (list): Tool definitions loaded from schema.json.
+            timeout (float, optional): Timeout for tools that don't set their own.
+            client (httpx.AsyncClient, optional): Shared HTTP client, exposed to tools as module.http.
+            cache_size (int, optional): Maximum number of cached tool results.
+            metrics (Metrics, optional): Registry to record tool call latency in.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.functions = {}
+        self.parameters = {}
+        self.timeouts = {}
+        self.ttls = {}
+        self.cache = TTLCache(cache_size)
+        self.schema = []
+        self.latency = metrics.histogram("tool_call_seconds", "Tool call latency, cache misses only", ("tool",)) if metrics is not None else None
+        if client is not None:
+            module.http = client
+
+        for entry in schema:
+            name = entry.get("function", {}).get("name")
+            function = getattr(module, name, None) if name else None
+            if not callable(function):
+                self.log("Skipping tool %s: no matching function in %s", name, module.__name__)
+                continue
+            parameters = entry["function"].get("parameters") or {}
+            problem = self.check_signature(function, parameters)
+            if problem:
+                self.log("Skipping tool %s: %s", name, problem)
+                continue
+            self.functions[name] = function
+            self.parameters[name] = parameters
+            self.timeouts[name] = entry.get("timeout", timeout)
+            self.ttls[name] = entry.get("cache_ttl", 0)
+            self.schema.append({key: value for key, value in entry.items() if key not in self.runtime_keys})
+
+    @staticmethod
+    def check_signature(function, parameters):
+        """
+        Check that a function accepts exactly what its schema describes.
+
+        Args:
+            function (callable): The tool function.
+            parameters (dict): JSON schema of the tool's arguments.
+
+        Returns:
+            str: A description of the mismatch, or None if they agree.
+        """
+        signature = inspect.signature(function)
+        accepts_any = any(p.kind == p.VAR_KEYWORD for p in signature.parameters.values())
+        properties = parameters.get("properties", {})
+        for name in properties:
+            if name not in signature.parameters and not accepts_any:
+                return f"schema argument '{name}' is not accepted by {function.__name__}"
+        for name, param in signature.parameters.items():
+            if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                continue
+            if param.default is param.empty and name not in parameters.get("required", []):
+                return f"{function.__name__} requires '{name}' but the schema doesn't"
+        return None
+
+    def check_arguments(self, name, args):
+        """
+        Validate call arguments against the tool's schema.
+
+        Args:
+            name (str): Tool name.
+            args (dict): Arguments supplied by the model.
+
+        Returns:
+            str: What is wrong with the arguments, or None if they are valid.
+        """
+        if not isinstance(args, dict):
+            return "arguments must be a JSON object"
+        parameters = self.parameters[name]
+        properties = parameters.get("properties", {})
+        for key in parameters.get("required", []):
+            if key not in args:
+                return f"missing required argument '{key}'"
+        for key, value in args.items():
+            if key not in properties:
+                if parameters.get("additionalProperties", True) is False:
+                    return f"unexpected argument '{key}'"
+                continue
+            expected = JSON_TYPES.get(properties[key].get("type"))
+            if expected and (not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool)):
+                return f"argument '{key}' should be {properties[key]['type']}"
+        return None
+
+    async def call(self, name, arguments):
+        """
+        Run a single tool call.  Errors are returned as text for the model to read.
+
+        Args:
+            name (str): Tool name.
+            arguments (str): JSON encoded arguments from the model.
+
+        Returns:
+            str: The tool result.
+        """
+        if name not in self.functions:
+            return f"Error calling tool {name}: no such tool"
+        try:
+            args = json.loads(arguments or "{}")
+        except ValueError as e:
+            return f"Error calling tool {name}: invalid arguments: {e}"
+        problem = self.check_arguments(name, args)
+        if problem:
+            return f"Error calling tool {name}: {problem}"
+
+        try:
+            if self.ttls[name]:
+                key = (name, json.dumps(args, sort_keys=True, separators=(",", ":")))
+                return await self.cache.get_or_compute(key, lambda: self.execute(name, args), self.ttls[name])
+            return await self.execute(name, args)
+        except asyncio.TimeoutError:
+            self.log("Tool %s timed out after %s seconds", name, self.timeouts[name])
+            return f"Error calling tool {name}: timed out after {self.timeouts[name]} seconds"
+        except Exception as e:
+            self.log("Error calling tool %s: %s", name, e)
+            return f"Error calling tool {name}: {e}"
+
+    async def execute(self, name, args):
+        """
+        Run a tool function with its timeout, bypassing the cache.
+
+        Args:
+            name (str): Tool name.
+            args (dict): Validated arguments.
+
+        Returns:
+            str: The tool result.
+        """
+        self.log("Calling tool: %s with args: %s", name, args)
+        function = self.functions[name]
+        start = time.monotonic()
+        try:
+            if inspect.iscoroutinefunction(function):
+                result = await asyncio.wait_for(function(**args), self.timeouts[name])
+            else:
+                result = await asyncio.wait_for(asyncio.to_thread(function, **args), self.timeouts[name])
+        finally:
+            if self.latency is not None:
+                self.latency.observe(time.monotonic() - start, name)
+        return result if isinstance(result, str) else json.dumps(result)
+
+    async def run(self, tool_calls):
+        """
+        Run every tool call from one model turn concurrently.
+
+        Args:
+            tool_calls (list): The "tool_calls" of an assistant message.
+
+        Returns:
+            list: One tool result message per call, in the original order.
+        """
+        results = await asyncio.gather(*(
+            self.call(tool_call['function']['name'], tool_call['function'].get('arguments'))
+            for tool_call in tool_calls
+        ))
+        return [
+            {"role": "tool", "tool_call_id": tool_call['id'], "content": result}
+            for tool_call, result in zip(tool_calls, results)
+        ]
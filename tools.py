@@ -1,10 +1,14 @@
 # Example tools, add your own tools here and add them to the schema.json file
+# Tools can be async or plain functions, plain functions are run in a worker thread.
+# Use the shared `http` client for web requests, it is set up by the tool runtime.
 
 import httpx
 import json
 import asyncio
 
+http = None
+
 async def crypto_prices(product_id):
     url = f"https://api.coinbase.com/api/v3/brokerage/market/products/{product_id}"
-    response = httpx.get(url, headers={'Content-Type': 'application/json'})
+    response = await http.get(url, headers={'Content-Type': 'application/json'})
     return json.dumps(response.json())
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import random
+
+from irc.bot import ReconnectStrategy
+from irc.client_aio import AioReactor
+
+class LoopReactor(AioReactor):
+    """
+    AioReactor that is attached to the bot's event loop when the bot starts.
+
+    AioReactor looks up the event loop when it is constructed, but the bot is
+    built before asyncio.run() starts the loop it will run on, so the loop is
+    filled in by InfiniGPT.main instead.
+    """
+    def __init__(self, on_connect=lambda *args: None, on_disconnect=lambda *args: None):
+        # A placeholder keeps AioReactor from looking up a loop that isn't running yet
+        super().__init__(on_connect, on_disconnect, loop=False)
+        self.loop = None
+
+class AsyncReconnect(ReconnectStrategy):
+    """
+    Reconnect on the event loop with exponential backoff and jitter.
+
+    Used instead of irc.bot.ExponentialBackoff with the asyncio transport,
+    which has no reactor scheduler.
+
+    Attributes:
+        min_interval (float): Shortest wait before an attempt, in seconds.
+        max_interval (float): Longest wait before an attempt, in seconds.
+        task (asyncio.Task): The reconnect loop while it is running.
+    """
+    def __init__(self, min_interval=5, max_interval=300):
+        """
+        Args:
+            min_interval (float, optional): Shortest wait before an attempt, in seconds.
+            max_interval (float, optional): Longest wait before an attempt, in seconds.
+        """
+        self.log = logging.getLogger(__name__).info
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.task = None
+
+    def run(self, bot):
+        """
+        Start reconnecting, unless already doing so.  Called by the bot on disconnect.
+
+        Args:
+            bot (InfiniGPT): The disconnected bot.
+        """
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self.reconnect(bot))
+
+    async def reconnect(self, bot):
+        """
+        Try the configured servers in turn until one accepts the connection.
+
+        Args:
+            bot (InfiniGPT): The disconnected bot.
+        """
+        attempt = 0
+        while not bot.connection.is_connected():
+            attempt += 1
+            delay = max(self.min_interval, random.uniform(0, min(self.max_interval, 2 ** attempt)))
+            self.log("Reconnecting in %.0f seconds", delay)
+            await asyncio.sleep(delay)
+            try:
+                await bot.connect_async()
+            except OSError as e:
+                self.log("Reconnect failed: %s", e)